@@ -0,0 +1,381 @@
+# benchmarks/load_test.py
+# Test de charge HTTP de /api/ask/ : débit soutenable, latence (p50/p90/p99,
+# histogramme) et taux d'erreur, en boucle fermée (N utilisateurs qui
+# enchaînent les questions) ou ouverte (arrivées à débit fixe, la latence
+# compte l'attente depuis l'instant prévu : pas d'omission coordonnée).
+#
+#   # serveurs locaux (gunicorn) : sync (WSGI) vs async (ASGI/uvicorn), 1 et 4 workers
+#   python benchmarks/load_test.py --serve sync async --workers 1 4 --closed 1 16 --open 100 --out load.json
+#   # serveur déjà lancé
+#   python benchmarks/load_test.py --target http://127.0.0.1:8000 --closed 8 --payload json form
+#   python benchmarks/load_test.py --compare old.json new.json
+#
+# La charge est générée par --procs processus (threads + connexions
+# keep-alive dans chacun) ; seules les requêtes envoyées après --warmup
+# secondes sont mesurées (chargement de la base au premier appel de chaque
+# worker).
+from __future__ import annotations
+import argparse
+import contextlib
+import http.client
+import json
+import os
+import platform
+import random
+import signal
+import socket
+import subprocess
+import sys
+import threading
+import time
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from pathlib import Path
+from urllib.parse import urlencode, urlsplit
+
+ROOT = Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(ROOT))
+sys.path.insert(0, str(Path(__file__).resolve().parent))
+
+SERVERS = ("sync", "async")
+PAYLOADS = ("json", "form")
+API_PATH = "/api/ask/"
+# Bornes (ms) de l'histogramme : fixes, pour comparer deux rapports
+HIST_BOUNDS_MS = (1, 2, 5, 10, 20, 50, 100, 200, 500, 1000, 2000, 5000, 10000)
+
+
+def _percentiles(values_ms):
+    import numpy as np
+    if not values_ms:
+        return None
+    arr = np.asarray(values_ms)
+    return {
+        "mean": float(arr.mean()),
+        "p50": float(np.percentile(arr, 50)),
+        "p90": float(np.percentile(arr, 90)),
+        "p99": float(np.percentile(arr, 99)),
+        "max": float(arr.max()),
+    }
+
+
+def _histogram(values_ms):
+    from bisect import bisect_left
+    counts = [0] * (len(HIST_BOUNDS_MS) + 1)
+    for v in values_ms:
+        counts[bisect_left(HIST_BOUNDS_MS, v)] += 1
+    labels = [f"<={b}" for b in HIST_BOUNDS_MS] + [f">{HIST_BOUNDS_MS[-1]}"]
+    return dict(zip(labels, counts))
+
+
+# ---- Client HTTP (une connexion keep-alive par thread) ----
+
+def _encode(question: str, payload: str):
+    if payload == "json":
+        return json.dumps({"question": question}).encode("utf-8"), "application/json"
+    return urlencode({"message": question}).encode("utf-8"), "application/x-www-form-urlencoded"
+
+
+class Client:
+    def __init__(self, target: str, host_header: str, timeout: float):
+        url = urlsplit(target)
+        self.netloc = url.netloc
+        self.path = (url.path.rstrip("/") or "") + API_PATH
+        self.host_header = host_header or url.netloc
+        self.timeout = timeout
+        self._local = threading.local()
+
+    def _conn(self) -> http.client.HTTPConnection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = self._local.conn = http.client.HTTPConnection(self.netloc, timeout=self.timeout)
+        return conn
+
+    def ask(self, body: bytes, content_type: str) -> str:
+        """Envoie une question ; retourne "ok" ou la catégorie d'erreur."""
+        conn = self._conn()
+        try:
+            conn.request("POST", self.path, body, {"Content-Type": content_type, "Host": self.host_header})
+            resp = conn.getresponse()
+            data = resp.read()
+        except socket.timeout:
+            self._reset()
+            return "timeout"
+        except (OSError, http.client.HTTPException) as e:
+            self._reset()
+            return f"conn:{type(e).__name__}"
+        if resp.status != 200:
+            return f"http_{resp.status}"
+        try:
+            json.loads(data)["answer"]
+        except (ValueError, KeyError):
+            return "bad_body"
+        return "ok"
+
+    def _reset(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is not None:
+            conn.close()
+            self._local.conn = None
+
+
+# ---- Générateurs de charge (un par processus) ----
+
+def drive(spec: dict) -> dict:
+    """
+    Boucle fermée (spec["users"] threads) ou ouverte (spec["rate"] req/s)
+    jusqu'à spec["end"] (horloge murale partagée entre processus). Retourne
+    les latences (ms) et issues des requêtes envoyées après spec["measure_from"].
+    """
+    client = Client(spec["target"], spec["host_header"], spec["timeout"])
+    bodies = [_encode(q, spec["payload"]) for q in spec["questions"]]
+    rng = random.Random(spec["seed"])
+    latencies, outcomes = [], Counter()
+    lock = threading.Lock()
+    # horloge murale (commune aux processus) -> perf_counter (précise, locale)
+    offset = time.perf_counter() - time.time()
+    measure_from, end = spec["measure_from"] + offset, spec["end"] + offset
+    counter = iter(range(1 << 62))
+
+    def one(scheduled: float):
+        body, content_type = bodies[next(counter) % len(bodies)]
+        outcome = client.ask(body, content_type)
+        elapsed = (time.perf_counter() - scheduled) * 1000
+        if scheduled >= measure_from:
+            with lock:
+                outcomes[outcome] += 1
+                if outcome == "ok":
+                    latencies.append(elapsed)
+
+    time.sleep(max(0.0, spec["start"] + offset - time.perf_counter()))
+    if spec["mode"] == "closed":
+        def user():
+            while True:
+                t = time.perf_counter()
+                if t >= end:
+                    return
+                one(t)
+                if spec["think"]:
+                    time.sleep(spec["think"])
+        threads = [threading.Thread(target=user) for _ in range(spec["users"])]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+    else:
+        rate = spec["rate"]
+        with ThreadPoolExecutor(max_workers=spec["max_inflight"]) as pool:
+            t = time.perf_counter()
+            while t < end:
+                time.sleep(max(0.0, t - time.perf_counter()))
+                pool.submit(one, t)
+                t += rng.expovariate(rate) if spec["arrival"] == "poisson" else 1 / rate
+    return {"latencies": latencies, "outcomes": dict(outcomes)}
+
+
+def run_scenario(target, host_header, mode, load, payload, questions, args) -> dict:
+    procs = max(1, min(args.procs, load if mode == "closed" else args.procs))
+    start = time.time() + 0.5  # laisse les processus démarrer
+    measure_from = start + args.warmup
+    end = measure_from + args.duration
+    specs = []
+    for p in range(procs):
+        share = load // procs + (1 if p < load % procs else 0) if mode == "closed" else load / procs
+        specs.append({
+            "target": target, "host_header": host_header, "timeout": args.timeout, "payload": payload,
+            "questions": questions[p::procs], "seed": args.seed + p, "mode": mode,
+            "users": share, "rate": share, "think": args.think / 1000, "arrival": args.arrival,
+            "max_inflight": args.max_inflight, "start": start, "measure_from": measure_from, "end": end,
+        })
+    with ProcessPoolExecutor(max_workers=procs) as ex:
+        parts = list(ex.map(drive, specs))
+
+    latencies = [v for part in parts for v in part["latencies"]]
+    outcomes = Counter()
+    for part in parts:
+        outcomes.update(part["outcomes"])
+    total = sum(outcomes.values())
+    errors = {k: v for k, v in sorted(outcomes.items()) if k != "ok"}
+    return {
+        "mode": mode,
+        "load": load,  # utilisateurs (closed) ou req/s offertes (open)
+        "payload": payload,
+        "duration_s": args.duration,
+        "requests": total,
+        "ok": outcomes["ok"],
+        "errors": errors,
+        "error_rate": (total - outcomes["ok"]) / total if total else None,
+        "throughput_rps": outcomes["ok"] / args.duration,
+        "latency_ms": _percentiles(latencies),
+        "histogram_ms": _histogram(latencies),
+    }
+
+
+# ---- Serveur local ----
+
+def _free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def _default_host_header() -> str:
+    """Premier ALLOWED_HOSTS des settings (Django refuse l'en-tête Host 127.0.0.1 sinon)."""
+    from config import settings
+    hosts = [h for h in settings.ALLOWED_HOSTS if h not in ("*", "")]
+    return hosts[0].lstrip(".") if hosts else ""
+
+
+@contextlib.contextmanager
+def local_server(kind: str, workers: int, host_header: str, timeout: float = 60.0):
+    """gunicorn sur un port libre : WSGI + workers sync, ou ASGI + workers uvicorn (gunicorn.conf.py)."""
+    port = _free_port()
+    app = ["-k", "sync", "config.wsgi:application"] if kind == "sync" else ["config.asgi:application"]
+    cmd = [sys.executable, "-m", "gunicorn", "-c", str(ROOT / "gunicorn.conf.py"),
+           "--bind", f"127.0.0.1:{port}", "--workers", str(workers), "--log-level", "warning"] + app
+    proc = subprocess.Popen(cmd, cwd=ROOT, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE,
+                            start_new_session=True)
+    target = f"http://127.0.0.1:{port}"
+    try:
+        client = Client(target, host_header, 5.0)
+        body = _encode("bonjour", "json")
+        deadline = time.time() + timeout
+        while client.ask(*body) != "ok":
+            if proc.poll() is not None:
+                raise RuntimeError(f"gunicorn ({kind}) s'est arrêté : {proc.stderr.read().decode()[-2000:]}")
+            if time.time() > deadline:
+                raise RuntimeError(f"gunicorn ({kind}) ne répond pas après {timeout:.0f}s")
+            time.sleep(0.2)
+        yield target
+    finally:
+        with contextlib.suppress(ProcessLookupError):
+            os.killpg(proc.pid, signal.SIGTERM)
+        try:
+            proc.wait(30)
+        except subprocess.TimeoutExpired:
+            os.killpg(proc.pid, signal.SIGKILL)
+            proc.wait()
+
+
+# ---- Orchestration ----
+
+def _git_commit():
+    try:
+        return subprocess.check_output(["git", "rev-parse", "--short", "HEAD"], cwd=ROOT,
+                                       stderr=subprocess.DEVNULL).decode().strip()
+    except Exception:
+        return None
+
+
+def _scenarios(args):
+    for payload in args.payload:
+        for users in args.closed or ():
+            yield "closed", users, payload
+        for rate in args.open or ():
+            yield "open", rate, payload
+
+
+def run_all(args) -> dict:
+    import query_sets
+
+    questions = query_sets.traffic_mix(query_sets.load_pairs(), args.questions, args.repeat, args.hot, args.seed)
+    host_header = args.host_header if args.host_header is not None else (
+        "" if args.target else _default_host_header())
+
+    results = []
+
+    def run_on(target, server, workers):
+        for mode, load, payload in _scenarios(args):
+            print(f"→ {server:<8} {workers or '-':>3} workers  {mode:<6} {load:>6} {payload:<4}…",
+                  file=sys.stderr, flush=True)
+            res = {"server": server, "workers": workers}
+            res.update(run_scenario(target, host_header, mode, load, payload, questions, args))
+            lat = res["latency_ms"] or {}
+            print(f"  {res['throughput_rps']:.0f} req/s, p50 {lat.get('p50', 0):.1f} ms, "
+                  f"p99 {lat.get('p99', 0):.1f} ms, erreurs {res['error_rate'] or 0:.2%}", file=sys.stderr)
+            results.append(res)
+
+    if args.target:
+        run_on(args.target, "external", None)
+    else:
+        for server in args.serve:
+            for workers in args.workers:
+                with local_server(server, workers, host_header) as target:
+                    run_on(target, server, workers)
+
+    return {
+        "meta": {
+            "commit": _git_commit(),
+            "date": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "cpu_count": os.cpu_count(),
+            "seed": args.seed,
+            "questions": args.questions,
+            "repeat": args.repeat,
+            "hot": args.hot,
+            "procs": args.procs,
+            "warmup_s": args.warmup,
+            "arrival": args.arrival,
+            "target": args.target,
+        },
+        "results": results,
+    }
+
+
+def compare(old_path: Path, new_path: Path):
+    """Affiche l'évolution du débit, de la latence p99 et du taux d'erreur par scénario."""
+    def key(r):
+        return r["server"], r["workers"] or 0, r["mode"], r["load"], r["payload"]
+    old = {key(r): r for r in json.loads(old_path.read_text())["results"]}
+    new = {key(r): r for r in json.loads(new_path.read_text())["results"]}
+    print(f"{'serveur':<9}{'w':>3} {'mode':<7}{'charge':>7} {'corps':<6}{'req/s':>18}{'p99 ms':>20}{'erreurs':>18}")
+    for k in sorted(old.keys() & new.keys()):
+        o, n = old[k], new[k]
+        p99 = ((o["latency_ms"] or {}).get("p99", float("nan")), (n["latency_ms"] or {}).get("p99", float("nan")))
+        print(f"{k[0]:<9}{k[1]:>3} {k[2]:<7}{k[3]:>7} {k[4]:<6}"
+              f"{o['throughput_rps']:>8.0f}→{n['throughput_rps']:<9.0f}{p99[0]:>9.1f}→{p99[1]:<10.1f}"
+              f"{o['error_rate'] or 0:>8.2%}→{n['error_rate'] or 0:.2%}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--target", help="URL d'un serveur déjà lancé (sinon serveurs locaux --serve).")
+    parser.add_argument("--serve", nargs="+", default=list(SERVERS), choices=SERVERS)
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, 2])
+    parser.add_argument("--closed", type=int, nargs="*", help="Utilisateurs simultanés (boucle fermée).")
+    parser.add_argument("--open", type=float, nargs="*", help="Débits d'arrivée en req/s (boucle ouverte).")
+    parser.add_argument("--payload", nargs="+", default=["json"], choices=PAYLOADS)
+    parser.add_argument("--duration", type=float, default=10.0, help="Secondes mesurées par scénario.")
+    parser.add_argument("--warmup", type=float, default=2.0, help="Secondes de chauffe non mesurées.")
+    parser.add_argument("--procs", type=int, default=min(4, os.cpu_count() or 1),
+                        help="Processus générateurs de charge.")
+    parser.add_argument("--timeout", type=float, default=10.0, help="Délai max d'une requête (s).")
+    parser.add_argument("--think", type=float, default=0.0, help="Pause (ms) entre deux questions (boucle fermée).")
+    parser.add_argument("--arrival", choices=("poisson", "uniform"), default="poisson")
+    parser.add_argument("--max-inflight", type=int, default=256, help="Requêtes en vol max par processus (ouverte).")
+    parser.add_argument("--questions", type=int, default=5000, help="Taille du mélange de questions.")
+    parser.add_argument("--repeat", type=float, default=0.5, help="Part de questions fréquentes répétées.")
+    parser.add_argument("--hot", type=int, default=50, help="Nombre de questions fréquentes.")
+    parser.add_argument("--host-header", help="En-tête Host (défaut : premier ALLOWED_HOSTS).")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--out", type=Path, help="Fichier JSON de résultats (sinon stdout).")
+    parser.add_argument("--compare", type=Path, nargs=2, metavar=("OLD", "NEW"))
+    args = parser.parse_args()
+
+    if args.compare:
+        compare(*args.compare)
+        return
+    if not args.closed and not args.open:
+        parser.error("au moins un scénario : --closed N... et/ou --open RATE...")
+
+    report = run_all(args)
+    text = json.dumps(report, indent=2, ensure_ascii=False)
+    if args.out:
+        args.out.write_text(text, encoding="utf-8")
+        print(f"✅ Résultats: {args.out}", file=sys.stderr)
+    else:
+        print(text)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,136 @@
+# benchmarks/query_sets.py
+# Jeux de requêtes reproductibles (graine fixe) et corpus synthétiques
+# pour le banc d'essai de la recherche (run_benchmarks.py) et le test de
+# charge HTTP (load_test.py).
+from __future__ import annotations
+import csv
+import random
+import re
+from pathlib import Path
+from typing import Dict, List
+
+ROOT = Path(__file__).resolve().parents[1]
+DATA = ROOT / "support_bot" / "data"
+FAQ_CSV = DATA / "faq.csv"
+QA_CORPUS = DATA / "raw" / "qa_corpus.csv"
+
+# Mêmes gabarits de paraphrase que scripts/build_qa.py
+TEMPLATES = [
+    "Comment {base} ?",
+    "Que faire pour {base} ?",
+    "Pourquoi {base} ne fonctionne pas ?",
+    "Tutoriel : {base} ?",
+    "Guide débutant : {base} ?",
+    "Problème : {base}. Comment résoudre ?",
+    "Solution rapide pour {base} ?",
+    "Étapes pour {base} ?",
+    "Je n’arrive pas à {base}, que faire ?",
+]
+KINDS = ("exact", "paraphrase", "typo", "truncation")
+
+
+def load_pairs(paths=(FAQ_CSV, QA_CORPUS)) -> List[Dict[str, str]]:
+    """Paires question/réponse de faq.csv et raw/qa_corpus.csv (sans doublon de question)."""
+    pairs, seen = [], set()
+    for path in paths:
+        if not path.exists():
+            continue
+        with open(path, encoding="utf-8", newline="") as f:
+            for row in csv.DictReader(f):
+                q = (row.get("question") or "").strip()
+                a = (row.get("answer") or "").strip()
+                if q and a and q.lower() not in seen:
+                    seen.add(q.lower())
+                    pairs.append({"question": q, "answer": a})
+    return pairs
+
+
+def _base(question: str) -> str:
+    q = re.sub(r"^\s*(comment|que faire pour|pourquoi)\s+", "", question.strip(), flags=re.I)
+    return q.rstrip(" ?").strip() or question
+
+
+def _typo(text: str, rng: random.Random) -> str:
+    """Une faute par mot long : lettre supprimée, doublée ou inversée."""
+    words = text.split()
+    for i, w in enumerate(words):
+        if len(w) < 5 or rng.random() < 0.5:
+            continue
+        j = rng.randrange(1, len(w) - 1)
+        op = rng.choice(("drop", "double", "swap"))
+        if op == "drop":
+            w = w[:j] + w[j + 1:]
+        elif op == "double":
+            w = w[:j] + w[j] + w[j:]
+        else:
+            w = w[:j - 1] + w[j] + w[j - 1] + w[j + 1:]
+        words[i] = w
+    return " ".join(words)
+
+
+def make_queries(pairs: List[Dict[str, str]], n: int = 500, seed: int = 0) -> List[Dict[str, str]]:
+    """
+    n requêtes tirées des paires, réparties entre KINDS. Chaque requête garde
+    la réponse attendue (`answer`) pour mesurer la précision top-1 / top-5.
+    """
+    rng = random.Random(seed)
+    queries = []
+    for i in range(n):
+        pair = pairs[rng.randrange(len(pairs))]
+        kind = KINDS[i % len(KINDS)]
+        q = pair["question"]
+        if kind == "paraphrase":
+            q = rng.choice(TEMPLATES).format(base=_base(q))
+        elif kind == "typo":
+            q = _typo(q, rng)
+        elif kind == "truncation":
+            words = q.split()
+            q = " ".join(words[: max(1, (len(words) + 1) // 2)])
+        queries.append({"query": q, "answer": pair["answer"], "kind": kind})
+    return queries
+
+
+def traffic_mix(pairs: List[Dict[str, str]], n: int, repeat: float = 0.5, hot: int = 50,
+                seed: int = 0) -> List[str]:
+    """
+    n questions comme en production : une part `repeat` tirée parmi les `hot`
+    questions les plus demandées (loi de Zipf, mêmes textes : cache de
+    réponses), le reste en variantes (paraphrases, fautes, troncatures)
+    presque toutes différentes.
+    """
+    rng = random.Random(seed)
+    hot_set = [p["question"] for p in pairs[:hot]]
+    weights = [1 / (rank + 1) for rank in range(len(hot_set))]
+    variants = iter(make_queries(pairs, n, seed + 1))
+    return [rng.choices(hot_set, weights)[0] if rng.random() < repeat else next(variants)["query"]
+            for _ in range(n)]
+
+
+def synthetic_corpus(pairs: List[Dict[str, str]], size: int, seed: int = 0) -> List[Dict[str, str]]:
+    """
+    Corpus de `size` lignes : les paires réelles (tronquées si size est plus
+    petit), complétées par des questions synthétiques construites avec le
+    vocabulaire réel et des termes rares, chacune avec sa propre réponse
+    (distracteurs). La distribution des termes reste réaliste quand on passe
+    de 1k à 100k lignes.
+    """
+    rng = random.Random(seed)
+    rows = list(pairs[:size])
+    vocab = sorted({w for p in pairs for w in re.findall(r"\w{3,}", p["question"].lower())})
+    i = 0
+    while len(rows) < size:
+        words = rng.sample(vocab, k=min(len(vocab), rng.randint(3, 8)))
+        words.append(f"ref{i % 50000}")  # terme rare : le vocabulaire grandit avec le corpus
+        q = rng.choice(TEMPLATES).format(base=" ".join(words))
+        rows.append({"question": q, "answer": f"Réponse synthétique n°{i} : {' '.join(words)}."})
+        i += 1
+    return rows
+
+
+def write_csv(rows: List[Dict[str, str]], path: Path):
+    path.parent.mkdir(parents=True, exist_ok=True)
+    with open(path, "w", encoding="utf-8", newline="") as f:
+        w = csv.DictWriter(f, fieldnames=["question", "answer"])
+        w.writeheader()
+        for r in rows:
+            w.writerow({"question": r["question"], "answer": r["answer"]})
@@ -0,0 +1,299 @@
+# benchmarks/run_benchmarks.py
+# Banc d'essai hors ligne de la recherche : démarrage à froid, latence par
+# requête (p50/p90/p99), débit, RSS max et précision top-1/top-5, pour chaque
+# moteur et chaque taille de corpus (1k, 10k, 100k lignes synthétiques).
+#
+#   python benchmarks/run_benchmarks.py --sizes 1000 10000 100000 --out bench.json
+#   python benchmarks/run_benchmarks.py --compare old.json new.json
+#
+# Chaque (moteur, taille) tourne dans un sous-processus : RSS et démarrage à
+# froid ne sont pas faussés par les mesures précédentes.
+from __future__ import annotations
+import argparse
+import json
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(ROOT))
+sys.path.insert(0, str(Path(__file__).resolve().parent))
+
+# tfidf-spell : + correcteur ; tfidf-intent : index partitionné par sujet (routeur à règles)
+ENGINES = ("tfidf", "tfidf-spell", "tfidf-intent", "brute", "dense", "hybrid")
+DEFAULT_SIZES = (1000, 10000, 100000)
+DENSE_DIM = 128
+
+
+def _peak_rss_mb():
+    """
+    RSS max de ce processus. Sous Linux, VmHWM (remis à zéro par exec) :
+    ru_maxrss garde le maximum du parent à travers fork/exec, donc chaque
+    sous-processus --worker rapporterait celui de l'orchestrateur.
+    """
+    try:
+        with open("/proc/self/status", encoding="ascii") as f:
+            for line in f:
+                if line.startswith("VmHWM:"):
+                    return int(line.split()[1]) / 1024  # kB
+    except OSError:
+        pass
+    try:
+        import resource
+    except ImportError:  # Windows
+        return None
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return rss / 1024 if sys.platform != "darwin" else rss / (1024 * 1024)
+
+
+def _percentiles(values_ms):
+    import numpy as np
+    arr = np.asarray(values_ms)
+    return {
+        "mean": float(arr.mean()),
+        "p50": float(np.percentile(arr, 50)),
+        "p90": float(np.percentile(arr, 90)),
+        "p99": float(np.percentile(arr, 99)),
+        "max": float(arr.max()),
+    }
+
+
+# ---- Moteurs évalués (construits depuis l'artefact compilé) ----
+
+class BruteForceEngine:
+    """Ancien chemin : NearestNeighbors(metric="cosine") en force brute."""
+    name = "brute"
+
+    def __init__(self, vectorizer, index):
+        from sklearn.neighbors import NearestNeighbors
+        self.vectorizer = vectorizer
+        self.nn = NearestNeighbors(metric="cosine").fit(index.transposed().T.tocsr())
+
+    def search_batch(self, questions, k=1):
+        dist, idx = self.nn.kneighbors(self.vectorizer.transform([q.lower() for q in questions]),
+                                       n_neighbors=min(k, self.nn.n_samples_fit_))
+        return [[(int(i), 1.0 - float(d)) for i, d in zip(ri, rd)] for ri, rd in zip(idx, dist)]
+
+    def search(self, question, k=1):
+        return self.search_batch([question], k)[0]
+
+
+class ProjectionEncoder:
+    """
+    Encodeur de remplacement hors ligne pour le moteur dense : projection
+    aléatoire du vecteur TF-IDF. Mesure le coût de la recherche dense, pas la
+    qualité d'un vrai modèle d'embeddings.
+    """
+
+    def __init__(self, vectorizer, n_terms, seed=0):
+        import numpy as np
+        self.vectorizer = vectorizer
+        self.proj = np.random.default_rng(seed).standard_normal((n_terms, DENSE_DIM)).astype(np.float32)
+
+    def project(self, tfidf_rows):
+        import numpy as np
+        x = np.asarray(tfidf_rows @ self.proj, dtype=np.float32)
+        return x / np.maximum(np.linalg.norm(x, axis=1, keepdims=True), 1e-12)
+
+    def __call__(self, questions):
+        return self.project(self.vectorizer.transform(questions))
+
+
+def build_engine(name, kb, workdir: Path):
+    import numpy as np
+    from support_bot.retrieval import (DenseEngine, HybridEngine, InvertedIndex, PartitionedEngine, TfidfEngine,
+                                       partition_index)
+
+    a = kb.arrays
+    vectorizer = kb.make_vectorizer(kb.make_speller() if name == "tfidf-spell" else None)
+    index = InvertedIndex(a["postings_indptr"], a["postings_docs"], a["postings_weights"], kb.n_docs)
+    tfidf = TfidfEngine(vectorizer, index, 0.2)
+    if name in ("tfidf", "tfidf-spell"):
+        return tfidf
+    if name == "tfidf-intent":
+        from support_bot.intents import RuleRouter
+        table = kb.labels["intent"]
+        parts = partition_index(index, np.asarray(table.ids), len(table.texts))
+        return PartitionedEngine(vectorizer, index, 0.2, dict(zip(table.texts, parts)), RuleRouter())
+    if name == "brute":
+        return BruteForceEngine(vectorizer, index)
+
+    encoder = ProjectionEncoder(vectorizer, index.n_terms)
+    emb_path = workdir / "embeddings.npy"
+    if not emb_path.exists():
+        # Encodage du corpus par blocs (mémoire bornée)
+        matrix = index.transposed().T.tocsr()
+        blocks = [encoder.project(matrix[i:i + 4096]) for i in range(0, matrix.shape[0], 4096)]
+        np.save(emb_path, np.vstack(blocks))
+    dense = DenseEngine(np.load(emb_path, mmap_mode="r"), encoder, 0.3)
+    if name == "dense":
+        return dense
+    return HybridEngine(tfidf, dense, reranker=None)
+
+
+# ---- Sous-processus : une configuration (moteur, taille) ----
+
+def run_worker(engine_name: str, workdir: Path, queries_path: Path) -> dict:
+    t0 = time.perf_counter()
+    from support_bot.kb_artifact import open_artifact
+    kb = open_artifact(workdir / "kb.bin")
+    engine = build_engine(engine_name, kb, workdir)
+    queries = json.loads(queries_path.read_text(encoding="utf-8"))
+    engine.search(queries[0]["query"], k=1)
+    cold_start = time.perf_counter() - t0
+
+    # Latence par requête (chemin unitaire, top-5)
+    latencies, hits = [], []
+    for q in queries:
+        t = time.perf_counter_ns()
+        hits.append(engine.search(q["query"], k=5))
+        latencies.append((time.perf_counter_ns() - t) / 1e6)
+
+    # Débit du chemin groupé
+    t = time.perf_counter()
+    engine.search_batch([q["query"] for q in queries], k=1)
+    batch_seconds = time.perf_counter() - t
+
+    # Précision : la réponse du document trouvé est-elle la réponse attendue ?
+    by_kind = {}
+    top1 = top5 = 0
+    for q, h in zip(queries, hits):
+        answers = [kb.answers[d] for d, _ in h]
+        ok1 = bool(answers) and answers[0] == q["answer"]
+        ok5 = q["answer"] in answers
+        top1 += ok1
+        top5 += ok5
+        stats = by_kind.setdefault(q["kind"], {"n": 0, "top1": 0})
+        stats["n"] += 1
+        stats["top1"] += ok1
+
+    n = len(queries)
+    return {
+        "engine": engine_name,
+        "size": kb.n_docs,
+        "n_terms": int(kb.header["n_terms"]),
+        "n_queries": n,
+        "cold_start_seconds": cold_start,
+        "latency_ms": _percentiles(latencies),
+        "throughput_qps": {"single": n / (sum(latencies) / 1000), "batch": n / batch_seconds},
+        "top1": top1 / n,
+        "top5": top5 / n,
+        "top1_by_kind": {k: v["top1"] / v["n"] for k, v in sorted(by_kind.items())},
+        "peak_rss_mb": _peak_rss_mb(),
+    }
+
+
+def compile_corpus(size: int, workdir: Path, seed: int, analyzer: str = "default") -> float:
+    import query_sets
+    from support_bot.kb_artifact import build_artifact
+
+    rows = query_sets.synthetic_corpus(query_sets.load_pairs(), size, seed)
+    query_sets.write_csv(rows, workdir / "faq.csv")
+    t = time.perf_counter()
+    build_artifact(workdir / "faq.csv", workdir / "kb.bin", analyzer=analyzer)
+    return time.perf_counter() - t
+
+
+# ---- Orchestration ----
+
+def _git_commit():
+    try:
+        return subprocess.check_output(["git", "rev-parse", "--short", "HEAD"], cwd=ROOT,
+                                       stderr=subprocess.DEVNULL).decode().strip()
+    except Exception:
+        return None
+
+
+def run_all(sizes, engines, n_queries, seed, analyzer="default") -> dict:
+    import query_sets
+
+    results = []
+    with tempfile.TemporaryDirectory(prefix="sb-bench-") as tmp:
+        queries = query_sets.make_queries(query_sets.load_pairs(), n_queries, seed)
+        queries_path = Path(tmp) / "queries.json"
+        queries_path.write_text(json.dumps(queries, ensure_ascii=False), encoding="utf-8")
+
+        for size in sizes:
+            workdir = Path(tmp) / f"n{size}"
+            workdir.mkdir()
+            compile_seconds = compile_corpus(size, workdir, seed, analyzer)
+            for name in engines:
+                print(f"→ {name:<7} {size:>7} lignes…", file=sys.stderr, flush=True)
+                out = subprocess.run(
+                    [sys.executable, __file__, "--worker", name, str(workdir), str(queries_path)],
+                    capture_output=True, text=True,
+                )
+                if out.returncode != 0:
+                    results.append({"engine": name, "size": size, "error": out.stderr.strip()[-2000:]})
+                    continue
+                res = json.loads(out.stdout.strip().splitlines()[-1])
+                res["compile_seconds"] = compile_seconds
+                results.append(res)
+
+    return {
+        "meta": {
+            "commit": _git_commit(),
+            "date": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "cpu_count": os.cpu_count(),
+            "seed": seed,
+            "n_queries": n_queries,
+            "analyzer": analyzer,
+        },
+        "results": results,
+    }
+
+
+def compare(old_path: Path, new_path: Path):
+    """Affiche l'évolution (en %) de la latence p99, du débit et du top-1."""
+    old = {(r["engine"], r["size"]): r for r in json.loads(old_path.read_text())["results"] if "error" not in r}
+    new = {(r["engine"], r["size"]): r for r in json.loads(new_path.read_text())["results"] if "error" not in r}
+    print(f"{'moteur':<8}{'taille':>8}{'p99 ms':>18}{'batch q/s':>22}{'top1':>16}")
+    for key in sorted(old.keys() & new.keys()):
+        o, n = old[key], new[key]
+        p99 = (o["latency_ms"]["p99"], n["latency_ms"]["p99"])
+        qps = (o["throughput_qps"]["batch"], n["throughput_qps"]["batch"])
+        print(f"{key[0]:<8}{key[1]:>8}"
+              f"{p99[0]:>8.3f}→{p99[1]:<8.3f}{qps[0]:>11.0f}→{qps[1]:<10.0f}"
+              f"{o['top1']:>7.3f}→{n['top1']:.3f}")
+
+
+def main():
+    from support_bot.analyzer import PROFILES
+
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--sizes", type=int, nargs="+", default=list(DEFAULT_SIZES))
+    parser.add_argument("--engines", nargs="+", default=list(ENGINES), choices=ENGINES)
+    parser.add_argument("--queries", type=int, default=500, help="Nombre de requêtes générées.")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--analyzer", default="default", choices=sorted(PROFILES),
+                        help="Profil de l'analyseur de texte (support_bot/analyzer.py).")
+    parser.add_argument("--out", type=Path, help="Fichier JSON de résultats (sinon stdout).")
+    parser.add_argument("--compare", type=Path, nargs=2, metavar=("OLD", "NEW"))
+    parser.add_argument("--worker", nargs=3, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.worker:
+        name, workdir, queries_path = args.worker
+        print(json.dumps(run_worker(name, Path(workdir), Path(queries_path))))
+        return
+    if args.compare:
+        compare(*args.compare)
+        return
+
+    report = run_all(args.sizes, args.engines, args.queries, args.seed, args.analyzer)
+    text = json.dumps(report, indent=2, ensure_ascii=False)
+    if args.out:
+        args.out.write_text(text, encoding="utf-8")
+        print(f"✅ Résultats: {args.out}", file=sys.stderr)
+    else:
+        print(text)
+
+
+if __name__ == "__main__":
+    main()
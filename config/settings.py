@@ -1,3 +1,4 @@
+import os
 from pathlib import Path
 
 
@@ -86,3 +87,120 @@ STATICFILES_DIRS = [
 
 # === DEFAULT PRIMARY KEY ===
 DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
+
+# === CHATBOT ===
+# Cache des réponses par question normalisée (vidé à chaque reload_kb).
+# BACKEND: None (mémoire du worker) ou "sqlite" (fichier partagé entre workers, lignes indexées par
+# empreinte des réglages CHATBOT_* et version de la base ; purgées après BACKEND_TTL secondes).
+CHATBOT_ANSWER_CACHE = {
+    'MAX_ENTRIES': 2048,
+    'MAX_BYTES': 8 * 1024 * 1024,
+    'BACKEND': None,
+    'PATH': BASE_DIR / 'support_bot' / 'data' / 'answer_cache.sqlite3',
+    'BACKEND_TTL': 24 * 3600,
+}
+
+# Surveillance de faq.csv / kb.bin (secondes) : rechargement à chaud dans chaque worker. 0 = désactivé.
+CHATBOT_KB_POLL_INTERVAL = 5.0
+
+# Réponses de kb.bin : stockées une fois par texte distinct ; "zlib" les compresse une à une
+# (décompressées à la lecture, le cache de réponses évite de le refaire). None = non compressées.
+CHATBOT_KB_ANSWERS_CODEC = None
+
+# Analyseur de texte du build et des questions (support_bot/analyzer.py) : "default" = celui de
+# sklearn (minuscules, mots de 2+ caractères) ; "fr" = accents retirés, mots vides français,
+# racinisation légère, unigrammes + bigrammes. Changer de profil recompile kb.bin.
+CHATBOT_ANALYZER = "default"
+
+# Correction orthographique avant la recherche (support_bot/spelling.py, index SymSpell construit au
+# chargement depuis le vocabulaire de kb.bin) : un mot hors vocabulaire d'au moins MIN_LENGTH lettres
+# est remplacé par le terme le plus proche à MAX_DISTANCE modifications près (1 jusqu'à 5 lettres),
+# parmi les termes d'au moins MIN_FREQUENCY questions. Désactivée par défaut : avec le petit vocabulaire
+# de faq.csv, MAX_DISTANCE 2 ou MIN_LENGTH 4 réécrivent des mots ordinaires ("demain" -> "email").
+# Taux de correction : chatbot_engine.kb_info()['spelling'] et /metrics/ (chatbot_spell_hit_ratio).
+CHATBOT_SPELLING = {
+    'ENABLED': False,
+    'MAX_DISTANCE': 1,
+    'PREFIX_LENGTH': 7,
+    'MIN_LENGTH': 6,
+    'MIN_FREQUENCY': 2,
+}
+
+# Index partitionné par sujet (support_bot/intents.py) : une sous-liste de postings par intent (colonne
+# intent de faq.csv, sinon règles INTENT_RULES sur les questions). Le routeur choisit les sujets de la
+# question ('rules' : INTENT_RULES ; 'classifier' : model.pkl, sujets de probabilité >= MIN_CONFIDENCE),
+# le champ topic de chat.js l'emporte ; sans sujet ou sans résultat au-dessus du seuil, index global.
+CHATBOT_INTENT_INDEX = {
+    'ENABLED': False,
+    'ROUTER': 'rules',
+    'MIN_CONFIDENCE': 0.5,
+}
+
+# Modifications à chaud (chatbot_engine.add_entries / remove_entries / update_entry) : refit complet
+# en arrière-plan quand la dérive des IDF ou la part de documents modifiés dépasse ce seuil. 0 = jamais.
+CHATBOT_KB_REFIT_DRIFT = 0.1
+
+# Moteur de recherche : 'tfidf' (index inversé), 'dense' (embeddings précalculés) ou 'hybrid'.
+CHATBOT_RETRIEVAL_ENGINE = 'tfidf'
+# Moteur dense : matrice float32 alignée sur kb.bin (scripts/train_embed_index.py faq),
+# encodeur de questions (chemin pointé vers une fonction list[str] -> ndarray), FAISS optionnel.
+CHATBOT_DENSE = {
+    'EMBEDDINGS': BASE_DIR / 'support_bot' / 'models' / 'faq_embeddings.npy',
+    'ENCODER': 'support_bot.retrieval.encode_minilm',
+    'THRESHOLD': 0.5,
+    'USE_FAISS': False,
+}
+
+# Mode hybride (CHATBOT_RETRIEVAL_ENGINE = 'hybrid') : top-N TF-IDF + top-N dense,
+# fusion 'rrf' (rang réciproque) ou 'weighted' (scores), puis reranking de la courte liste.
+# RERANKER : 'classifier' (data/model.pkl de train_model.py), None, ou chemin pointé.
+CHATBOT_HYBRID = {
+    'CANDIDATES': 30,
+    'FUSION': 'rrf',
+    'RRF_K': 60,
+    'DENSE_WEIGHT': 0.5,
+    'RERANKER': 'classifier',
+    'RERANK_WEIGHT': 0.5,
+}
+
+# Regroupement des quasi-doublons au build de kb.bin (MinHash + LSH) : une seule question
+# indexée par groupe de similarité de Jaccard >= THRESHOLD (n-grammes de SHINGLE caractères),
+# les autres gardées comme alias. SAME_ANSWER : ne regrouper que des questions de même réponse.
+# Rapport des groupes : python manage.py build_kb --near-dup-report groupes.json
+CHATBOT_NEAR_DUP = {
+    'ENABLED': False,
+    'THRESHOLD': 0.8,
+    'NUM_PERM': 128,
+    'SHINGLE': 4,
+    'SAME_ANSWER': True,
+}
+
+# Pool de recherche des vues async /api/ask/ : 'thread' ou 'process', WORKERS en parallèle,
+# QUEUE requêtes en attente au maximum ; au-delà -> 503 avec Retry-After (secondes).
+# Le saut vers le pool a un coût : benchmarks/load_test.py, 1 worker, 4 utilisateurs en
+# boucle fermée : ASGI/uvicorn 193 req/s (p50 20 ms) contre 436 req/s (p50 9 ms) en WSGI sync.
+# L'ASGI sert quand les connexions lentes ou nombreuses dominent ; sinon, servir en WSGI
+# (gunicorn -k sync config.wsgi:application -c gunicorn.conf.py).
+CHATBOT_API_POOL = {
+    'KIND': 'thread',
+    'WORKERS': 4,
+    'QUEUE': 64,
+    'RETRY_AFTER': 1,
+}
+
+# Métriques du moteur (route /metrics/, texte Prometheus). DIR : répertoire partagé par les
+# workers (un fichier mmap par processus, additionnés à la lecture) ; None = processus courant.
+CHATBOT_METRICS = {
+    'ENABLED': True,
+    'DIR': os.environ.get('CHATBOT_METRICS_DIR'),
+}
+
+# Profilage intégré (support_bot/profiling.py) de /api/ask/, du premier chargement de la base et des
+# scripts : MODE None, 'sample' (piles repliées pour flamegraph) ou 'cprofile' (.prof). RATE : part des
+# requêtes profilées. Les variables CHATBOT_PROFILE, CHATBOT_PROFILE_DIR, _RATE, _INTERVAL l'emportent.
+CHATBOT_PROFILE = {
+    'MODE': None,
+    'DIR': BASE_DIR / 'support_bot' / 'data' / 'profiles',
+    'RATE': 0.01,
+    'INTERVAL': 0.005,
+}
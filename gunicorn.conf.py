@@ -0,0 +1,33 @@
+# gunicorn.conf.py — service ASGI (vues async /api/ask/) avec des workers uvicorn.
+#   gunicorn config.asgi:application -c gunicorn.conf.py
+# Chaque worker gère des centaines de connexions lentes sur sa boucle d'événements ;
+# la recherche tourne dans le pool borné de support_bot/executor.py (CHATBOT_API_POOL).
+import os
+import subprocess
+import sys
+
+bind = f"0.0.0.0:{os.environ.get('PORT', '8000')}"
+worker_class = "uvicorn_worker.UvicornWorker"
+workers = int(os.environ.get("WEB_CONCURRENCY", "2"))
+worker_connections = int(os.environ.get("WORKER_CONNECTIONS", "1000"))
+keepalive = 5
+timeout = 30
+graceful_timeout = 30
+# Pas de preload : chaque worker ouvre kb.bin (memmap, pages partagées) après le fork
+preload_app = False
+
+# Métriques multiprocessus (route /metrics/) : chaque worker écrit ses compteurs dans
+# <dir>/<pid>.bin, vidé au démarrage du maître.
+os.environ.setdefault("CHATBOT_METRICS_DIR", os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                                                          "support_bot", "data", ".metrics"))
+
+
+def on_starting(server):
+    from support_bot.metrics import clear_dir
+
+    clear_dir(os.environ["CHATBOT_METRICS_DIR"])
+    # kb.bin est compilé ici, dans le maître et avant le fork : les fichiers écrits
+    # par une phase release (Heroku) n'arrivent pas jusqu'aux dynos web. Sous-processus :
+    # le maître n'importe ni Django ni scikit-learn. No-op si l'artefact est à jour.
+    subprocess.run([sys.executable, os.path.join(os.path.dirname(os.path.abspath(__file__)), "manage.py"), "build_kb"],
+                   check=True)
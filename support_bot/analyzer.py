@@ -0,0 +1,155 @@
+# support_bot/analyzer.py
+# Analyseur de texte partagé par le build de kb.bin (TfidfVectorizer avec
+# analyzer=Analyzer(...)) et le service (tfidf.QueryVectorizer) : une seule
+# implémentation, donc les mêmes termes des deux côtés.
+#
+# Le profil (dict) est enregistré dans l'en-tête de kb.bin ; un artefact
+# compilé avec un autre profil est périmé et recompilé.
+#   "default" : analyseur par défaut de sklearn (minuscules, mots de 2+
+#               caractères, unigrammes) ;
+#   "fr"      : + accents retirés, mots vides français, racinisation légère,
+#               unigrammes + bigrammes.
+# Chaque mot n'est normalisé qu'une fois (cache mot -> terme) ; le découpage
+# est un seul findall d'une regex compilée à l'import. Au service, un
+# correcteur (spelling.SpellIndex) peut remplacer les mots inconnus avant la
+# construction des n-grammes.
+from __future__ import annotations
+import re
+import time
+import unicodedata
+from typing import Callable, Dict, List, Optional, Union
+
+from . import metrics
+
+# TfidfVectorizer(token_pattern=r"(?u)\b\w\w+\b") : mots d'au moins 2 caractères
+TOKEN_PATTERN = re.compile(r"(?u)\b\w\w+\b")
+
+# Mots vides (forme sans accents : comparés après repli des accents)
+FRENCH_STOPWORDS = frozenset("""
+a ai aie au aux avec avoir c ca ce ceci cela celle celles celui ces cet cette ceux comme d dans de des
+du elle elles en est et etaient etait etre eu eux faire il ils j je l la le les leur leurs lui m ma mais
+me meme mes moi mon n ne ni nos notre nous on ou par pas peu peut peux plus pour qu que quel quelle
+quelles quels qui quoi s sa sans se sera ses si son sont suis sur t ta te tes toi ton tu un une vos
+votre vous y afin dont moins quand ete
+""".split())
+
+PROFILES: Dict[str, dict] = {
+    "default": {"version": 1, "fold_accents": False, "stopwords": None, "stem": None, "ngrams": [1, 1]},
+    "fr": {"version": 1, "fold_accents": True, "stopwords": "fr", "stem": "light", "ngrams": [1, 2]},
+}
+STOPWORD_LISTS = {"fr": FRENCH_STOPWORDS}
+
+# Suffixes retirés par la racinisation légère (formes sans accents, plus longs d'abord)
+_SUFFIXES = ("issements", "issement", "atrices", "ateurs", "ations", "ements", "atrice", "ateur",
+             "ation", "ement", "ances", "ences", "ables", "ismes", "istes", "ance", "ence", "able",
+             "isme", "iste", "euses", "euse", "ites", "ite")
+_CACHE_MAX = 200_000  # mots distincts gardés en cache (vidé au-delà)
+
+
+def resolve_profile(profile: Union[str, dict, None]) -> dict:
+    """Nom de profil (PROFILES) ou dict -> dict complet (tel qu'enregistré dans kb.bin)."""
+    if profile is None:
+        return dict(PROFILES["default"])
+    if isinstance(profile, str):
+        if profile not in PROFILES:
+            raise ValueError(f"Profil d'analyseur inconnu: {profile!r} (attendu: {', '.join(PROFILES)})")
+        return dict(PROFILES[profile])
+    resolved = dict(PROFILES["default"], **profile)
+    resolved["ngrams"] = list(resolved["ngrams"])
+    return resolved
+
+
+def fold_accents(word: str) -> str:
+    """'réseau' -> 'reseau', 'cœur' -> 'coeur' (décomposition NFKD, diacritiques retirés)."""
+    word = word.replace("œ", "oe").replace("æ", "ae")
+    if word.isascii():
+        return word
+    return "".join(c for c in unicodedata.normalize("NFKD", word) if not unicodedata.combining(c))
+
+
+def light_stem(word: str) -> str:
+    """
+    Racinisation légère (mot sans accents) : un suffixe dérivationnel courant,
+    puis pluriel et terminaisons -er/-e (règles du stemmer minimal de Savoy).
+    """
+    if len(word) < 5 or not word.isalpha():
+        return word
+    for suffix in _SUFFIXES:
+        if word.endswith(suffix) and len(word) - len(suffix) >= 4:
+            return word[:-len(suffix)]
+    if word.endswith("aux") and len(word) >= 6:
+        return word[:-3] + "al"
+    if word[-1] in "sx":
+        word = word[:-1]
+    if word.endswith("r") and len(word) > 5:
+        word = word[:-1]
+    if word.endswith("e") and len(word) > 4:
+        word = word[:-1]
+    if len(word) > 4 and word[-1] == word[-2]:
+        word = word[:-1]
+    return word
+
+
+class Analyzer:
+    """
+    Texte -> liste de termes selon un profil. Appelable (analyzer= de
+    TfidfVectorizer) et picklable (le cache n'est pas sérialisé).
+    """
+
+    def __init__(self, profile: Union[str, dict, None] = None):
+        self.profile = resolve_profile(profile)
+        p = self.profile
+        self._fold = p["fold_accents"]
+        self._stop = STOPWORD_LISTS[p["stopwords"]] if p["stopwords"] else frozenset()
+        self._stem = light_stem if p["stem"] == "light" else None
+        self._min_n, self._max_n = p["ngrams"]
+        self._simple = not (self._fold or self._stop or self._stem) and self._max_n == 1
+        self._cache: Dict[str, Optional[str]] = {}
+
+    def __getstate__(self):
+        return {"profile": self.profile}
+
+    def __setstate__(self, state):
+        self.__init__(state["profile"])
+
+    def _term(self, word: str) -> Optional[str]:
+        """Forme normalisée d'un mot (None pour un mot vide)."""
+        if self._fold:
+            word = fold_accents(word)
+        if word in self._stop:
+            return None
+        return self._stem(word) if self._stem else word
+
+    def __call__(self, doc: str, correct: Optional[Callable[[List[str]], List[str]]] = None) -> List[str]:
+        """Termes de doc ; correct(mots normalisés) -> mots corrigés, appliqué avant les n-grammes."""
+        t0 = time.perf_counter()
+        words = TOKEN_PATTERN.findall(doc.lower())
+        if self._simple:
+            if correct is not None:
+                words = correct(words)
+            metrics.inc(metrics.ANALYZER_SECONDS, time.perf_counter() - t0)
+            return words
+
+        cache = self._cache
+        if len(cache) > _CACHE_MAX:
+            cache.clear()
+        tokens = []
+        for word in words:
+            try:
+                term = cache[word]
+            except KeyError:
+                term = cache[word] = self._term(word)
+            if term is not None:
+                tokens.append(term)
+        if correct is not None:
+            tokens = correct(tokens)
+
+        if self._max_n == 1:
+            terms = tokens
+        else:
+            # n-grammes sur les termes gardés (mêmes règles que sklearn _word_ngrams)
+            terms = tokens[:] if self._min_n == 1 else []
+            for n in range(max(self._min_n, 2), self._max_n + 1):
+                terms.extend(" ".join(tokens[i:i + n]) for i in range(len(tokens) - n + 1))
+        metrics.inc(metrics.ANALYZER_SECONDS, time.perf_counter() - t0)
+        return terms
@@ -0,0 +1,208 @@
+# support_bot/answer_cache.py
+# Cache de réponses en mémoire (LRU borné en entrées et en octets), indexé
+# par une question normalisée et par la version de la base de connaissances.
+# Un backend SQLite optionnel partage les réponses entre workers gunicorn.
+from __future__ import annotations
+import os
+import re
+import sqlite3
+import threading
+import time
+import unicodedata
+import uuid
+from collections import OrderedDict
+from pathlib import Path
+from typing import Optional
+
+_WS = re.compile(r"\s+")
+
+
+def normalize_query(text: str, fold_accents: bool = True) -> str:
+    """Minuscules, accents supprimés (si fold_accents), espaces compactés, '?' final retiré."""
+    s = (text or "").lower()
+    if fold_accents:
+        s = unicodedata.normalize("NFKD", s)
+        s = "".join(c for c in s if not unicodedata.combining(c))
+    s = _WS.sub(" ", s).strip()
+    return s.rstrip("? ").strip()
+
+
+class SQLiteCacheBackend:
+    """
+    Cache partagé sur disque (un fichier SQLite commun à tous les workers).
+    Les lignes sont indexées par (config, version, clé) : config est
+    l'empreinte des réglages qui changent les réponses (moteur, analyseur,
+    correcteur...), donc ni une autre version de la base ni d'autres réglages
+    ne sont jamais servis. Un worker qui change de version ne purge que ses
+    propres lignes (owner) et celles de plus de ttl secondes : les autres
+    workers gardent les leurs, même sur une autre version.
+    """
+
+    def __init__(self, path: Path, max_entries: int = 50_000, config: str = "", ttl: float = 86_400.0):
+        self.path = Path(path)
+        self.max_entries = max_entries
+        self.config = config
+        self.ttl = ttl
+        self._local = threading.local()
+        self._puts = 0
+        self._owner = None
+        self._owner_pid = None
+        with self._connect() as conn:
+            columns = {row[1] for row in conn.execute("PRAGMA table_info(answers)")}
+            if columns and "owner" not in columns:
+                conn.execute("DROP TABLE answers")  # ancien schéma (version, key) : c'est un cache
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS answers ("
+                " config TEXT NOT NULL, version TEXT NOT NULL, key TEXT NOT NULL, answer TEXT NOT NULL,"
+                " owner TEXT NOT NULL, created REAL NOT NULL,"
+                " PRIMARY KEY (config, version, key))"
+            )
+            conn.execute("CREATE INDEX IF NOT EXISTS answers_owner ON answers (owner)")
+            conn.execute("CREATE INDEX IF NOT EXISTS answers_created ON answers (created)")
+
+    @property
+    def owner(self) -> str:
+        """Identifiant de ce processus (tiré à nouveau après un fork)."""
+        if self._owner_pid != os.getpid():
+            self._owner = f"{os.getpid()}-{uuid.uuid4().hex[:12]}"
+            self._owner_pid = os.getpid()
+        return self._owner
+
+    def _connect(self) -> sqlite3.Connection:
+        # Une connexion par thread et par processus (jamais partagée après un fork)
+        conn = getattr(self._local, "conn", None)
+        if conn is None or self._local.pid != os.getpid():
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            conn = sqlite3.connect(str(self.path), timeout=1.0)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+            self._local.pid = os.getpid()
+        return conn
+
+    def get(self, version: str, key: str) -> Optional[str]:
+        row = self._connect().execute(
+            "SELECT answer FROM answers WHERE config = ? AND version = ? AND key = ?",
+            (self.config, version, key)
+        ).fetchone()
+        return row[0] if row else None
+
+    def put(self, version: str, key: str, answer: str):
+        with self._connect() as conn:
+            conn.execute("INSERT OR REPLACE INTO answers VALUES (?, ?, ?, ?, ?, ?)",
+                         (self.config, version, key, answer, self.owner, time.time()))
+            self._puts += 1
+            # Purge des plus anciennes lignes de temps en temps (pas à chaque écriture)
+            if self._puts % 1000 == 0:
+                conn.execute(
+                    "DELETE FROM answers WHERE rowid <= "
+                    "(SELECT MAX(rowid) FROM answers) - ?", (self.max_entries,)
+                )
+
+    def invalidate(self, version: Optional[str]):
+        """Purge les lignes de ce processus d'une autre version, et celles de plus de ttl secondes."""
+        with self._connect() as conn:
+            conn.execute("DELETE FROM answers WHERE owner = ? AND NOT (config = ? AND version IS ?)",
+                         (self.owner, self.config, version))
+            conn.execute("DELETE FROM answers WHERE created < ?", (time.time() - self.ttl,))
+
+
+class AnswerCache:
+    """
+    LRU thread-safe. Chaque entrée est valable pour une version de la base :
+    invalidate() vide le cache et change de version en une seule opération,
+    et put() ignore une réponse calculée avec une autre version.
+    """
+
+    def __init__(self, max_entries: int = 2048, max_bytes: int = 8 * 1024 * 1024,
+                 backend: Optional[SQLiteCacheBackend] = None):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.backend = backend
+        self.version: Optional[str] = None
+        self._entries: "OrderedDict[str, str]" = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.backend_hits = 0
+
+    @staticmethod
+    def _size(key: str, answer: str) -> int:
+        return len(key.encode("utf-8")) + len(answer.encode("utf-8"))
+
+    def get(self, key: str) -> Optional[str]:
+        with self._lock:
+            answer = self._entries.get(key)
+            if answer is not None:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return answer
+            version = self.version
+
+        if self.backend is not None and version is not None:
+            try:
+                answer = self.backend.get(version, key)
+            except sqlite3.Error:
+                answer = None
+            if answer is not None:
+                with self._lock:
+                    self.backend_hits += 1
+                self._store(key, answer, version)
+                return answer
+
+        with self._lock:
+            self.misses += 1
+        return None
+
+    def put(self, key: str, answer: str, version: Optional[str]):
+        if not self._store(key, answer, version):
+            return
+        if self.backend is not None and version is not None:
+            try:
+                self.backend.put(version, key, answer)
+            except sqlite3.Error:
+                pass
+
+    def _store(self, key: str, answer: str, version: Optional[str]) -> bool:
+        size = self._size(key, answer)
+        with self._lock:
+            if version is None or version != self.version or size > self.max_bytes:
+                return False
+            old = self._entries.pop(key, None)
+            if old is not None:
+                self._bytes -= self._size(key, old)
+            self._entries[key] = answer
+            self._bytes += size
+            while len(self._entries) > self.max_entries or self._bytes > self.max_bytes:
+                old_key, old_answer = self._entries.popitem(last=False)
+                self._bytes -= self._size(old_key, old_answer)
+                self.evictions += 1
+            return True
+
+    def invalidate(self, version: Optional[str]):
+        """Vide le cache et adopte la nouvelle version de la base (atomique)."""
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+            self.version = version
+        if self.backend is not None and version is not None:
+            try:
+                self.backend.invalidate(version)
+            except sqlite3.Error:
+                pass
+
+    def stats(self) -> dict:
+        with self._lock:
+            lookups = self.hits + self.backend_hits + self.misses
+            return {
+                "version": self.version,
+                "entries": len(self._entries),
+                "bytes": self._bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "backend_hits": self.backend_hits,
+                "hit_ratio": ((self.hits + self.backend_hits) / lookups) if lookups else 0.0,
+            }
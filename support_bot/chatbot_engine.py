@@ -1,15 +1,23 @@
 # support_bot/chatbot_engine.py
-# VERSION SIMPLIFIÉE (TF-IDF + NearestNeighbors)
+# VERSION SIMPLIFIÉE (TF-IDF + index inversé)
 # Ce code n'utilise PAS sentence-transformers et est TRÈS LÉGER.
 from __future__ import annotations
+import contextlib
+import json
 import logging
+import os
 import threading
+import time
 from pathlib import Path
-from typing import Optional, Tuple
+from typing import Iterable, List, Optional, Tuple
 
-import pandas as pd
-from sklearn.feature_extraction.text import TfidfVectorizer
-from sklearn.neighbors import NearestNeighbors
+from . import metrics, profiling
+from .answer_cache import AnswerCache, SQLiteCacheBackend, normalize_query
+from .kb_artifact import KBArtifact, StaleArtifactError, build_artifact, memory_artifact, open_artifact
+from .kb_delta import KBDelta, clean_entry
+from .retrieval import (ClassifierReranker, DenseEngine, HybridEngine, InvertedIndex, PartitionedEngine,
+                        RetrievalEngine, TfidfEngine, partition_index)
+from .tfidf import QueryVectorizer
 
 # --- Configuration du Logger ---
 logger = logging.getLogger(__name__)
@@ -30,6 +38,21 @@ except Exception:
 
 DATA_DIR = BASE_DIR / "support_bot" / "data"
 FAQ_CSV = DATA_DIR / "faq.csv"
+KB_ARTIFACT = DATA_DIR / "kb.bin"  # compilé par `python manage.py build_kb`
+CORPUS_DELTA = DATA_DIR / "qa_corpus.kb_delta.json"  # scripts/build_qa.py (recrawl incrémental)
+MODELS_DIR = BASE_DIR / "support_bot" / "models"
+FAQ_EMBEDDINGS = MODELS_DIR / "faq_embeddings.npy"  # scripts/train_embed_index.py faq
+FAQ_FAISS_INDEX = MODELS_DIR / "faq.index"
+CLASSIFIER_VECTORIZER = DATA_DIR / "vectorizer.pkl"  # scripts/train_model.py
+CLASSIFIER_MODEL = DATA_DIR / "model.pkl"
+
+def _setting(name: str, default):
+    """Lit un réglage Django CHATBOT_* (valeur par défaut hors Django)."""
+    try:
+        from django.conf import settings
+        return getattr(settings, name, default)
+    except Exception:
+        return default
 
 # --- Constantes du Modèle ---
 # Seuil de similarité (de 0.0 à 1.0)
@@ -37,142 +60,849 @@ FAQ_CSV = DATA_DIR / "faq.csv"
 # Vous pouvez le baisser à 0.2 ou 0.3 si le bot est trop strict.
 SIMILARITY_THRESHOLD = 0.2
 
+# Moteur de recherche : "tfidf" (défaut), "dense" (embeddings précalculés)
+# ou "hybrid" (fusion des deux + reranking)
+RETRIEVAL_ENGINE = _setting("CHATBOT_RETRIEVAL_ENGINE", "tfidf")
+DENSE_CONFIG = _setting("CHATBOT_DENSE", {})
+HYBRID_CONFIG = _setting("CHATBOT_HYBRID", {})
+
+# Regroupement des quasi-doublons au build de kb.bin (désactivé par défaut)
+NEAR_DUP_CONFIG = _setting("CHATBOT_NEAR_DUP", {})
+
+def near_dup_params() -> Optional[dict]:
+    """Paramètres de near_dup.cluster tirés de settings.CHATBOT_NEAR_DUP (None si désactivé)."""
+    if not NEAR_DUP_CONFIG.get("ENABLED"):
+        return None
+    from .near_dup import DEFAULTS
+    return {name: NEAR_DUP_CONFIG.get(name.upper(), default) for name, default in DEFAULTS.items()}
+
+# Compression (zlib) de chaque réponse distincte dans kb.bin : None ou "zlib"
+KB_ANSWERS_CODEC = _setting("CHATBOT_KB_ANSWERS_CODEC", None)
+
+# Analyseur de texte (build de kb.bin et questions) : profil de analyzer.PROFILES ou dict
+KB_ANALYZER = _setting("CHATBOT_ANALYZER", "default")
+
+# Correction orthographique des mots hors vocabulaire (spelling.SpellIndex) : désactivée par défaut
+SPELLING_CONFIG = _setting("CHATBOT_SPELLING", {})
+
+def _make_speller(kb: KBArtifact):
+    """Correcteur construit depuis le vocabulaire de kb (None si désactivé)."""
+    if not SPELLING_CONFIG.get("ENABLED"):
+        return None
+    t0 = time.perf_counter()
+    speller = kb.make_speller(SPELLING_CONFIG.get("MAX_DISTANCE", 1), SPELLING_CONFIG.get("PREFIX_LENGTH", 7),
+                              SPELLING_CONFIG.get("MIN_LENGTH", 6), SPELLING_CONFIG.get("MIN_FREQUENCY", 2))
+    stats = speller.stats()
+    logger.info("Correcteur: %d termes, %d suppressions (%.3fs).", stats["terms"], stats["deletes"],
+                time.perf_counter() - t0)
+    return speller
+
+# Index partitionné par sujet (intents.py) : désactivé par défaut
+INTENT_INDEX_CONFIG = _setting("CHATBOT_INTENT_INDEX", {})
+
+# Intervalle (secondes) de surveillance de faq.csv / kb.bin ; 0 = désactivé
+KB_POLL_INTERVAL = _setting("CHATBOT_KB_POLL_INTERVAL", 5.0)
+
+# Dérive (IDF ou part de documents modifiés) au-delà de laquelle les
+# modifications à chaud (add_entries...) déclenchent un refit en arrière-plan
+KB_REFIT_DRIFT = _setting("CHATBOT_KB_REFIT_DRIFT", 0.1)
+
+class KBSnapshot:
+    """
+    Base de connaissances immuable : artefact memmap + vectorizer + index
+    TF-IDF + moteur de recherche sélectionné.
+    Un rechargement construit un nouveau snapshot puis le publie par un
+    simple échange de référence ; les requêtes en cours finissent sur
+    l'ancien.
+    Après add_entries/remove_entries, `delta` porte les modifications
+    appliquées depuis le fit et `index` est un OverlayIndex.
+    """
+    __slots__ = ("kb", "vectorizer", "index", "engine", "version", "loaded_at", "load_seconds", "delta")
+
+    def __init__(self, kb: KBArtifact, vectorizer: QueryVectorizer, index: InvertedIndex,
+                 engine: RetrievalEngine, load_seconds: float, delta: Optional[KBDelta] = None):
+        self.kb = kb
+        self.vectorizer = vectorizer
+        self.index = index
+        self.engine = engine
+        self.version = kb.version if delta is None else delta.version
+        self.loaded_at = time.time()
+        self.load_seconds = load_seconds
+        self.delta = delta
+
+    def answer(self, doc: int) -> str:
+        return self.kb.answers[doc] if self.delta is None else self.delta.answer(doc)
+
+    def question(self, doc: int) -> str:
+        return self.kb.questions[doc] if self.delta is None else self.delta.question(doc)
+
+    def answer_id(self, doc: int) -> Optional[int]:
+        """Id de la réponse dans la table de kb.bin (None pour une entrée ajoutée à chaud)."""
+        return int(self.kb.answers.ids[doc]) if doc < self.kb.n_docs else None
+
+    def label(self, name: str, doc: int) -> Optional[str]:
+        """Colonne intent/source de faq.csv pour ce document (None si absente)."""
+        table = self.kb.labels.get(name)
+        return table[doc] if table is not None and doc < self.kb.n_docs else None
+
 # --- États Globaux (pour le cache) ---
-_lock = threading.Lock()
-_df: Optional[pd.DataFrame] = None
-_vectorizer: Optional[TfidfVectorizer] = None
-_index: Optional[NearestNeighbors] = None
-_question_vectors = None  # C'est la matrice TF-IDF
+_lock = threading.Lock()  # sérialise les constructions de snapshot (pas les lectures)
+_snapshot: Optional[KBSnapshot] = None  # snapshot publié, lu sans verrou
 _init_error: Optional[Exception] = None
+_watcher: Optional["_KBWatcher"] = None
+_refit_thread: Optional[threading.Thread] = None
+
+def _config_fingerprint() -> str:
+    """Empreinte des réglages qui changent les réponses (lignes du cache SQLite partagé)."""
+    import hashlib
+    conf = {"engine": RETRIEVAL_ENGINE, "threshold": SIMILARITY_THRESHOLD, "analyzer": KB_ANALYZER,
+            "spelling": SPELLING_CONFIG, "intent_index": INTENT_INDEX_CONFIG, "near_dup": NEAR_DUP_CONFIG,
+            "dense": DENSE_CONFIG, "hybrid": HYBRID_CONFIG}
+    return hashlib.sha256(json.dumps(conf, sort_keys=True, default=str).encode("utf-8")).hexdigest()[:16]
+
+def _make_answer_cache() -> AnswerCache:
+    """Cache de réponses configuré par settings.CHATBOT_ANSWER_CACHE."""
+    conf = _setting("CHATBOT_ANSWER_CACHE", {})
+    backend = None
+    if conf.get("BACKEND") == "sqlite":
+        backend = SQLiteCacheBackend(Path(conf.get("PATH", DATA_DIR / "answer_cache.sqlite3")),
+                                     max_entries=conf.get("BACKEND_MAX_ENTRIES", 50_000),
+                                     config=_config_fingerprint(), ttl=conf.get("BACKEND_TTL", 86_400))
+    return AnswerCache(max_entries=conf.get("MAX_ENTRIES", 2048),
+                       max_bytes=conf.get("MAX_BYTES", 8 * 1024 * 1024),
+                       backend=backend)
+
+# Réponses déjà calculées, par question normalisée (vidé à chaque rechargement)
+_answer_cache = _make_answer_cache()
+
+def _open_or_build_artifact() -> KBArtifact:
+    """
+    Ouvre l'artefact compilé. S'il est absent ou périmé (faq.csv modifié,
+    format changé), il est recompilé puis rouvert. Un verrou fichier évite
+    que tous les workers recompilent en même temps.
+    """
+    near_dup = near_dup_params()
+    try:
+        return open_artifact(KB_ARTIFACT, FAQ_CSV, near_dup, KB_ANSWERS_CODEC, KB_ANALYZER)
+    except StaleArtifactError as e:
+        logger.warning("%s -> recompilation de l'artefact.", e)
+
+    with _artifact_file_lock():
+        # Un autre worker a peut-être recompilé pendant qu'on attendait le verrou
+        try:
+            return open_artifact(KB_ARTIFACT, FAQ_CSV, near_dup, KB_ANSWERS_CODEC, KB_ANALYZER)
+        except StaleArtifactError:
+            pass
+        build_artifact(FAQ_CSV, KB_ARTIFACT, near_dup, KB_ANSWERS_CODEC, KB_ANALYZER)
+    return open_artifact(KB_ARTIFACT, FAQ_CSV, near_dup, KB_ANSWERS_CODEC, KB_ANALYZER)
+
+@contextlib.contextmanager
+def _artifact_file_lock():
+    """Verrou exclusif inter-processus sur kb.bin.lock (sans effet hors POSIX)."""
+    try:
+        import fcntl
+    except ImportError:
+        yield
+        return
+    KB_ARTIFACT.parent.mkdir(parents=True, exist_ok=True)
+    with open(KB_ARTIFACT.with_suffix(".lock"), "a") as f:
+        fcntl.flock(f, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(f, fcntl.LOCK_UN)
+
+def _build_snapshot() -> KBSnapshot:
+    """
+    Ouvre l'artefact compilé de la base de connaissances (memmap) et
+    reconstruit le vectorizer et l'index inversé sans refaire de fit.
+    """
+    t0 = time.perf_counter()
+
+    # 1) Vérifier si le dossier data existe
+    if not DATA_DIR.exists():
+        raise FileNotFoundError(f"Dossier 'data' introuvable: {DATA_DIR}")
+
+    # 2) Vérifier le fichier FAQ (faq.csv), source de l'artefact
+    if not FAQ_CSV.exists():
+        raise FileNotFoundError(f"Fichier FAQ introuvable: {FAQ_CSV}")
+
+    # 3) Ouvrir l'artefact (recompilé si absent ou périmé)
+    kb = _open_or_build_artifact()
+    logger.info("Artefact %s (version %s): %d questions.", KB_ARTIFACT.name, kb.version, kb.n_docs)
+
+    # 4) Restaurer le vectorizer et l'index inversé depuis les tableaux memmap
+    arrays = kb.arrays
+    vectorizer = kb.make_vectorizer(_make_speller(kb))
+    index = InvertedIndex(arrays["postings_indptr"], arrays["postings_docs"],
+                          arrays["postings_weights"], kb.n_docs)
+
+    # 5) Moteur de recherche choisi dans les settings (TF-IDF par défaut)
+    engine = _make_engine(kb, vectorizer, index)
+    snapshot = KBSnapshot(kb, vectorizer, index, engine, time.perf_counter() - t0)
+    metrics.observe(metrics.KB_LOADS, snapshot.load_seconds)
+    return snapshot
+
+def _make_engine(kb: KBArtifact, vectorizer, index: InvertedIndex) -> RetrievalEngine:
+    """Instancie le moteur de settings.CHATBOT_RETRIEVAL_ENGINE (repli sur TF-IDF)."""
+    tfidf = _make_tfidf_engine(kb, vectorizer, index)
+    if RETRIEVAL_ENGINE == "tfidf":
+        return tfidf
+    if RETRIEVAL_ENGINE in ("dense", "hybrid"):
+        try:
+            dense = _load_dense_engine(kb)
+        except Exception as e:
+            logger.error("Moteur dense indisponible (%s), repli sur TF-IDF.", e)
+            return tfidf
+        if RETRIEVAL_ENGINE == "dense":
+            return dense
+        return HybridEngine(
+            tfidf, dense, reranker=_load_reranker(kb),
+            candidates=HYBRID_CONFIG.get("CANDIDATES", 30),
+            fusion=HYBRID_CONFIG.get("FUSION", "rrf"),
+            rrf_k=HYBRID_CONFIG.get("RRF_K", 60),
+            dense_weight=HYBRID_CONFIG.get("DENSE_WEIGHT", 0.5),
+            rerank_weight=HYBRID_CONFIG.get("RERANK_WEIGHT", 0.5),
+        )
+    logger.error("Moteur de recherche inconnu: %r, repli sur TF-IDF.", RETRIEVAL_ENGINE)
+    return tfidf
+
+def _make_tfidf_engine(kb: KBArtifact, vectorizer, index: InvertedIndex) -> TfidfEngine:
+    """TF-IDF global, ou partitionné par sujet si settings.CHATBOT_INTENT_INDEX['ENABLED']."""
+    if not INTENT_INDEX_CONFIG.get("ENABLED"):
+        return TfidfEngine(vectorizer, index, SIMILARITY_THRESHOLD)
+    import numpy as np
+    from . import intents
+
+    t0 = time.perf_counter()
+    # sujet de chaque question, fixé au build (colonne intent de faq.csv ou règles)
+    table = kb.labels["intent"]
+    codes, names = np.asarray(table.ids), list(table.texts)
+    parts = partition_index(index, codes, len(names))
+    partitions = dict(zip(names, parts))
+
+    router = intents.RuleRouter()
+    if INTENT_INDEX_CONFIG.get("ROUTER", "rules") == "classifier":
+        try:
+            import joblib
+            router = intents.ClassifierRouter(
+                joblib.load(CLASSIFIER_VECTORIZER), joblib.load(CLASSIFIER_MODEL),
+                intents.intent_of_answers(kb.answers.ids, list(kb.answer_texts), codes, names),
+                INTENT_INDEX_CONFIG.get("MIN_CONFIDENCE", 0.5),
+            )
+        except Exception as e:
+            logger.error("Routeur classifieur indisponible (%s), repli sur les règles.", e)
+    logger.info("Index partitionné (%s): %s (%.3fs).", router.name,
+                ", ".join(f"{name}={len(docs)}" for name, (_, docs) in partitions.items()),
+                time.perf_counter() - t0)
+    return PartitionedEngine(vectorizer, index, SIMILARITY_THRESHOLD, partitions, router)
+
+def _load_reranker(kb: KBArtifact):
+    """
+    Reranker du mode hybride (settings.CHATBOT_HYBRID['RERANKER']) :
+    "classifier" (model.pkl de train_model.py, chargé une fois par snapshot),
+    None, ou chemin pointé vers un callable (questions, candidats) -> scores.
+    """
+    name = HYBRID_CONFIG.get("RERANKER", "classifier")
+    if not name:
+        return None
+    if name != "classifier":
+        from django.utils.module_loading import import_string
+        return import_string(name)
+    try:
+        import joblib
+        return ClassifierReranker(joblib.load(CLASSIFIER_VECTORIZER), joblib.load(CLASSIFIER_MODEL), kb.answers)
+    except Exception as e:
+        logger.error("Reranker indisponible (%s), fusion sans reranking.", e)
+        return None
+
+def _load_dense_engine(kb: KBArtifact) -> DenseEngine:
+    """
+    Ouvre la matrice d'embeddings (memmap) alignée sur les questions de
+    l'artefact, l'encodeur de questions et, si demandé, l'index FAISS.
+    """
+    import numpy as np
+    from django.utils.module_loading import import_string
+
+    path = Path(DENSE_CONFIG.get("EMBEDDINGS", FAQ_EMBEDDINGS))
+    embeddings = np.load(path, mmap_mode="r")
+    n_rows = kb.header.get("n_source_rows", kb.n_docs)  # embeddings calculés avant regroupement
+    if embeddings.ndim != 2 or embeddings.shape[0] != n_rows:
+        raise ValueError(
+            f"{path.name}: {embeddings.shape[0]} vecteurs pour {n_rows} questions "
+            "(relancer scripts/train_embed_index.py faq)"
+        )
+    meta_path = path.with_suffix(".json")
+    if meta_path.exists():
+        meta = json.loads(meta_path.read_text(encoding="utf-8"))
+        if meta.get("source_sha256") != kb.header["source_sha256"]:
+            raise ValueError(f"{path.name} a été calculé sur une autre version de faq.csv")
+
+    encoder = import_string(DENSE_CONFIG.get("ENCODER", "support_bot.retrieval.encode_minilm"))
+    faiss_index = None
+    if "source_rows" in kb.arrays:
+        # quasi-doublons regroupés : seules les lignes des questions canoniques
+        embeddings = np.ascontiguousarray(embeddings[kb.arrays["source_rows"]])
+        if DENSE_CONFIG.get("USE_FAISS"):
+            logger.warning("Index FAISS non aligné sur les questions regroupées : recherche dense en NumPy.")
+    elif DENSE_CONFIG.get("USE_FAISS"):
+        try:
+            import faiss
+            faiss_index = faiss.read_index(str(DENSE_CONFIG.get("FAISS_INDEX", FAQ_FAISS_INDEX)))
+        except ImportError:
+            logger.warning("faiss non installé : recherche dense en NumPy.")
+    return DenseEngine(embeddings, encoder, DENSE_CONFIG.get("THRESHOLD", 0.5), faiss_index)
+
+def _publish(snapshot: KBSnapshot):
+    """
+    Rend le snapshot visible. Le cache change de version d'abord : une
+    réponse calculée sur l'ancien snapshot ne peut plus y être stockée.
+    """
+    global _snapshot, _init_error
+    _answer_cache.invalidate(snapshot.version)
+    _snapshot = snapshot
+    _init_error = None
+    metrics.set_info(version=snapshot.version, engine=snapshot.engine.name, loaded_at=snapshot.loaded_at,
+                     last_load_seconds=snapshot.load_seconds,
+                     n_docs=snapshot.delta.n_alive if snapshot.delta else snapshot.kb.n_docs)
 
 def _lazy_load():
     """
-    Charge le CSV, entraîne le TfidfVectorizer et l'index NearestNeighbors.
-    Ne s'exécute qu'une seule fois au démarrage.
+    Construit et publie le premier snapshot.
+    Ne s'exécute qu'une seule fois au démarrage (réessaie tant qu'il échoue).
     """
-    global _df, _vectorizer, _index, _question_vectors, _init_error
+    global _init_error
 
     # Vérifie si c'est déjà chargé
-    if _df is not None and _index is not None:
+    if _snapshot is not None:
         return
     
     with _lock:
         # Re-vérifie à l'intérieur du 'lock' (au cas où un autre thread attendait)
-        if _df is not None and _index is not None:
+        if _snapshot is not None:
             return
         
         try:
             logger.info("Démarrage du chargement du modèle léger (TF-IDF)...")
-            
-            # 1) Vérifier si le dossier data existe
-            if not DATA_DIR.exists():
-                raise FileNotFoundError(f"Dossier 'data' introuvable: {DATA_DIR}")
-            
-            # 2) Lire le fichier FAQ (faq.csv)
-            if not FAQ_CSV.exists():
-                raise FileNotFoundError(f"Fichier FAQ introuvable: {FAQ_CSV}")
-            
-            logger.info("Lecture de %s...", FAQ_CSV)
-            df = pd.read_csv(FAQ_CSV)
-            
-            # 3) Nettoyer les données (très important)
-            if not {"question", "answer"}.issubset(df.columns):
-                raise ValueError("Le CSV doit contenir les colonnes 'question' et 'answer'.")
-            
-            df = df.dropna(subset=["question", "answer"]).astype({"question": str, "answer": str})
-            df["question"] = df["question"].str.strip().str.lower() # Mettre en minuscule
-            df["answer"] = df["answer"].str.strip()
-            df = df.drop_duplicates(subset=["question"]).reset_index(drop=True)
-            
-            if len(df) == 0:
-                raise ValueError("Le fichier 'faq.csv' est valide mais vide après nettoyage.")
-            
-            _df = df
-            logger.info("CSV chargé et nettoyé: %d questions trouvées.", len(_df))
-
-            # 4) Entraîner le Vectorizer (TF-IDF)
-            logger.info("Entraînement du TfidfVectorizer...")
-            _vectorizer = TfidfVectorizer(stop_words=None) # Vous pouvez changer 'french'
-            _question_vectors = _vectorizer.fit_transform(_df["question"])
-            
-            # 5) Entraîner l'Index de recherche (NearestNeighbors)
-            logger.info("Entraînement de l'index NearestNeighbors...")
-            _index = NearestNeighbors(n_neighbors=1, metric="cosine")
-            _index.fit(_question_vectors)
-            
+            # une fois par worker : toujours profilé quand le profilage est actif
+            with profiling.profile("lazy_load", rate=1.0):
+                _publish(_build_snapshot())
+                _start_watcher()
             logger.info("====== CHATBOT PRÊT (Mode Léger) ======")
 
         except Exception as e:
             _init_error = e
             logger.exception("!!!!!! ERREUR D'INITIALISATION DU CHATBOT !!!!!!: %s", e)
+            return
+
+    # hors du verrou : l'application passe par _mutate
+    _apply_pending_corpus_delta()
+
+class _KBWatcher(threading.Thread):
+    """
+    Surveille (mtime, taille) de faq.csv et kb.bin et déclenche un
+    rechargement à chaud quand l'un d'eux change ; un nouveau delta de
+    recrawl (CORPUS_DELTA) est appliqué sans rechargement. Chaque worker a le sien,
+    donc une mise à jour du fichier est reprise par tous les workers.
+    """
+
+    def __init__(self, interval: float):
+        super().__init__(name="kb-watcher", daemon=True)
+        self.interval = interval
+        self.pid = os.getpid()
+        self._stop_event = threading.Event()
+        self._last = self._stamp()
+
+    @staticmethod
+    def _stamp():
+        stamp = []
+        for p in (FAQ_CSV, KB_ARTIFACT, CORPUS_DELTA):
+            try:
+                st = p.stat()
+                stamp.append((st.st_mtime_ns, st.st_size))
+            except OSError:
+                stamp.append(None)
+        return tuple(stamp)
+
+    def run(self):
+        while not self._stop_event.wait(self.interval):
+            stamp = self._stamp()
+            if stamp == self._last:
+                continue
+            previous, self._last = self._last, stamp
+            if stamp[:2] == previous[:2]:
+                # seul le delta de recrawl a changé : appliqué à chaud, sans recharger
+                _apply_pending_corpus_delta()
+                continue
+            logger.info("Changement détecté sur la base de connaissances, rechargement à chaud...")
+            reload_kb()
+            # kb.bin vient peut-être d'être recompilé par nous-mêmes
+            self._last = self._stamp()
+
+    def stop(self):
+        self._stop_event.set()
+
+def _start_watcher():
+    """Démarre la surveillance dans ce processus (une fois par worker, après fork)."""
+    global _watcher
+    if not KB_POLL_INTERVAL or KB_POLL_INTERVAL <= 0:
+        return
+    if _watcher is not None and _watcher.pid == os.getpid() and _watcher.is_alive():
+        return
+    _watcher = _KBWatcher(float(KB_POLL_INTERVAL))
+    _watcher.start()
+
+# --- Messages renvoyés à l'utilisateur ---
+MSG_EMPTY = "Pouvez-vous préciser votre question ?"
+MSG_NOT_UNDERSTOOD = "Je n'ai pas bien compris votre question. Pouvez-vous la reformuler différemment ?"
+MSG_NOT_INITIALIZED = "Désolé, le chatbot n'est pas correctement initialisé."
+MSG_ERROR = "Désolé, une erreur s'est produite. Réessayez ou reformulez votre question."
+
+def _current_snapshot() -> Tuple[Optional[KBSnapshot], Optional[str]]:
+    """
+    Charge le modèle si besoin et retourne (snapshot, None), ou
+    (None, message d'erreur) s'il n'est pas utilisable.
+    """
+    # Charge le modèle s'il n'est pas encore en mémoire
+    _lazy_load()
+
+    # Une seule lecture de la référence : toute la requête utilise ce snapshot
+    snapshot = _snapshot
+    if snapshot is not None:
+        return snapshot, None
+
+    # Si le chargement a échoué (ex: faq.csv non trouvé)
+    if _init_error:
+        logger.error("Erreur lazy_load: %s", _init_error)
+        # Affiche l'erreur à l'utilisateur pour le débogage
+        return None, f"Le chatbot n'est pas prêt: {_init_error}"
+
+    # Si les modèles ne sont pas chargés pour une raison inconnue
+    logger.error("Composants du chatbot non initialisés.")
+    return None, MSG_NOT_INITIALIZED
+
+def _best_match(snapshot: KBSnapshot, hits) -> Tuple[Optional[int], Optional[float], str]:
+    """Applique le seuil de similarité : (document ou None, meilleur score, issue pour metrics)."""
+    if not hits:
+        # Aucun terme connu : similarité nulle avec toute la base
+        logger.info("Aucun match (aucun terme connu dans la question)")
+        return None, None, "no_terms"
+
+    # 'similarité' cosinus (1 = identique, 0 = aucun terme commun)
+    match_index, match_similarity = hits[0]
+
+    # Vérifier si la similarité est suffisante (seuil propre au moteur)
+    threshold = snapshot.engine.threshold
+    if match_similarity >= threshold:
+        # Optionnel : logguer le match
+        # matched_q = snapshot.kb.questions[match_index]
+        # logger.info("Match (Conf: %.2f): '%s' -> '%s'", match_similarity, q, matched_q)
+        return match_index, match_similarity, "match"
+
+    # Réponse si le score est trop bas
+    logger.info("Aucun match (Meilleur score: %.2f < %.2f)", match_similarity, threshold)
+    return None, match_similarity, "below_threshold"
+
+def _answer_for(snapshot: KBSnapshot, hits) -> str:
+    """Réponse au meilleur résultat de recherche (ou message si sous le seuil)."""
+    doc = _best_match(snapshot, hits)[0]
+    return MSG_NOT_UNDERSTOOD if doc is None else str(snapshot.answer(doc))
 
 # ---- API publique ----
-def get_chatbot_response(user_input: str) -> str:
+def _topics(engine: RetrievalEngine, topic: Optional[str]) -> Optional[List[str]]:
+    """Sujet imposé par le client (chat.js), s'il désigne une partition de l'index."""
+    if topic and isinstance(engine, PartitionedEngine) and topic in engine.partitions:
+        return [topic]
+    return None
+
+def _cache_key(snapshot: KBSnapshot, question: str, topic: Optional[str] = None) -> str:
+    """
+    Clé du cache de réponses : deux questions de même clé ont la même réponse.
+    Les accents ne sont retirés que si l'analyseur TF-IDF les retire aussi
+    (profil "fr") : avec le profil par défaut "c'est note" et "c'est noté"
+    ne partagent pas les mêmes termes.
+    """
+    fold = isinstance(snapshot.engine, TfidfEngine) and snapshot.vectorizer.analyzer.profile["fold_accents"]
+    key = normalize_query(question, fold_accents=fold)
+    return key if topic is None else f"{key}\x00{topic}"
+
+def get_chatbot_response(user_input: str, topic: Optional[str] = None) -> str:
     """
     Prend une question, la vectorise, et trouve la réponse la plus proche.
+    topic : sujet choisi dans l'interface (index partitionné seulement).
+    Chaque étape est chronométrée pour metrics (route /metrics/).
     """
+    t0 = time.perf_counter()
     try:
         q = (user_input or "").strip()
         if not q:
-            return "Pouvez-vous préciser votre question ?"
+            metrics.record_answer("single", "empty", ())
+            return MSG_EMPTY
 
-        # Charge le modèle s'il n'est pas encore en mémoire
-        _lazy_load()
+        snapshot, not_ready = _current_snapshot()
+        if not_ready:
+            metrics.record_answer("single", "error", ())
+            return not_ready
+        # les étapes commencent après un éventuel chargement (mesuré par chatbot_kb_load_seconds)
+        ts = time.perf_counter()
 
-        # Si le chargement a échoué (ex: faq.csv non trouvé)
-        if _init_error:
-            logger.error("Erreur lazy_load: %s", _init_error)
-            # Affiche l'erreur à l'utilisateur pour le débogage
-            return f"Le chatbot n'est pas prêt: {_init_error}"
-        
-        # Si les modèles ne sont pas chargés pour une raison inconnue
-        if _vectorizer is None or _index is None or _df is None:
-            logger.error("Composants du chatbot non initialisés.")
-            return "Désolé, le chatbot n'est pas correctement initialisé."
+        # 0. Question déjà posée (même forme normalisée, même sujet imposé) ?
+        engine = snapshot.engine
+        topics = _topics(engine, topic)
+        key = _cache_key(snapshot, q, None if topics is None else topic)
+        t1 = time.perf_counter()
+        cached = _answer_cache.get(key)
+        t2 = time.perf_counter()
+        if cached is not None:
+            metrics.inc(metrics.CACHE_HIT)
+            metrics.record_answer("single", "cached", (ts, t1, t2), total=t2 - t0)
+            return cached
+        metrics.inc(metrics.CACHE_MISS)
 
-        # 1. Transformer la question de l'utilisateur
-        q_vec = _vectorizer.transform([q.lower()]) # Mettre en minuscule aussi
+        # 1-2. Vectoriser la question et chercher la plus proche
+        # (TF-IDF : seules les questions qui partagent un terme sont scorées)
+        vectors = engine.vectorize([q])
+        t3 = time.perf_counter()
+        hits = engine.search_vectors([q], vectors, k=1, topics=topics)[0]
+        t4 = time.perf_counter()
 
-        # 2. Chercher la question la plus proche dans l'index
-        distances, idxs = _index.kneighbors(q_vec, n_neighbors=1)
-        
-        match_index = idxs[0][0]
-        match_distance = distances[0][0]
-        
-        # 'distance' est la distance cosinus (0 = identique, 1 = opposé)
-        # 'similarité' est l'inverse (1 = identique, 0 = opposé)
-        match_similarity = 1.0 - match_distance
-
-        # 3. Vérifier si la similarité est suffisante
-        if match_similarity >= SIMILARITY_THRESHOLD:
-            answer = _df.iloc[match_index]["answer"]
-            # Optionnel : logguer le match
-            # matched_q = _df.iloc[match_index]["question"]
-            # logger.info("Match (Conf: %.2f): '%s' -> '%s'", match_similarity, q, matched_q)
-            return str(answer)
-        else:
-            # 4. Réponse si le score est trop bas
-            logger.info("Aucun match (Meilleur score: %.2f < %.2f)", match_similarity, SIMILARITY_THRESHOLD)
-            return "Je n'ai pas bien compris votre question. Pouvez-vous la reformuler différemment ?"
+        # 3. Seuil de similarité et réponse
+        doc, score, result = _best_match(snapshot, hits)
+        t5 = time.perf_counter()
+        answer = MSG_NOT_UNDERSTOOD if doc is None else str(snapshot.answer(doc))
+        _answer_cache.put(key, answer, snapshot.version)
+        t6 = time.perf_counter()
+        metrics.record_answer("single", result, (ts, t1, t2, t3, t4, t5, t6), score, t6 - t0)
+        return answer
 
     except Exception as e:
         logger.exception("CHAT ERROR: %s", e)
-        return "Désolé, une erreur s'est produite. Réessayez ou reformulez votre question."
+        metrics.record_answer("single", "error", ())
+        return MSG_ERROR
+
+def get_chatbot_responses(user_inputs: List[str]) -> List[str]:
+    """
+    Version groupée de get_chatbot_response (rejeu de transcripts, jeux
+    d'évaluation) : un seul transform et un seul produit creux pour tout le
+    lot (ou un seul encodage groupé pour le moteur dense). Retourne une
+    réponse par question, dans le même ordre.
+    """
+    t0 = time.perf_counter()
+    questions = [(q or "").strip() for q in user_inputs]
+    responses = [MSG_EMPTY] * len(questions)
+    todo = [i for i, q in enumerate(questions) if q]
+    for _ in range(len(questions) - len(todo)):
+        metrics.record_answer("batch", "empty", ())
+    if not todo:
+        return responses
+
+    try:
+        snapshot, not_ready = _current_snapshot()
+        if not_ready:
+            for i in todo:
+                responses[i] = not_ready
+                metrics.record_answer("batch", "error", ())
+            return responses
+        ts = time.perf_counter()  # après un éventuel chargement
+
+        # Seules les questions absentes du cache passent par la recherche
+        keys = {i: _cache_key(snapshot, questions[i]) for i in todo}
+        t1 = time.perf_counter()
+        misses = []
+        for i in todo:
+            cached = _answer_cache.get(keys[i])
+            if cached is None:
+                misses.append(i)
+            else:
+                responses[i] = cached
+                metrics.record_answer("batch", "cached", ())
+        t2 = time.perf_counter()
+        metrics.inc(metrics.CACHE_HIT, len(todo) - len(misses))
+        metrics.inc(metrics.CACHE_MISS, len(misses))
+        if not misses:
+            _observe_stages("batch", (ts, t1, t2))
+            return responses
+
+        # Étapes chronométrées pour tout le lot (une mesure par lot)
+        engine = snapshot.engine
+        batch = [questions[i] for i in misses]
+        vectors = engine.vectorize(batch)
+        t3 = time.perf_counter()
+        batch_hits = engine.search_vectors(batch, vectors, k=1)
+        t4 = time.perf_counter()
+        matches = [_best_match(snapshot, hits) for hits in batch_hits]
+        t5 = time.perf_counter()
+        for i, (doc, score, result) in zip(misses, matches):
+            responses[i] = MSG_NOT_UNDERSTOOD if doc is None else str(snapshot.answer(doc))
+            _answer_cache.put(keys[i], responses[i], snapshot.version)
+            metrics.record_answer("batch", result, (), score)
+        _observe_stages("batch", (ts, t1, t2, t3, t4, t5, time.perf_counter()))
+        return responses
+
+    except Exception as e:
+        logger.exception("CHAT ERROR (lot): %s", e)
+        for i in todo:
+            responses[i] = MSG_ERROR
+            metrics.record_answer("batch", "error", ())
+        return responses
 
-def reload_kb() -> str:
-    """Forcer le rechargement (après mise à jour de faq.csv)."""
-    global _df, _vectorizer, _index, _question_vectors, _init_error
+def get_chatbot_matches(user_input: str, k: int = 5, topic: Optional[str] = None) -> dict:
+    """
+    Les k documents les plus proches en une seule recherche, pour le front
+    et l'évaluation :
+      answer    : réponse servie (seuil appliqué au premier, comme get_chatbot_response)
+      result    : issue (match, below_threshold, no_terms, empty, error)
+      matches   : [{doc, question, score, answer_id, answer, intent, source}],
+                  scores décroissants, y compris sous le seuil
+      threshold : seuil du moteur ; timings : secondes par étape atteinte.
+    topic : comme get_chatbot_response. Ne passe pas par le cache de
+    réponses (qui ne garde que le texte).
+    """
+    t0 = time.perf_counter()
+    out = {"answer": MSG_EMPTY, "result": "empty", "matches": [], "threshold": None, "timings": {},
+           "version": None}
+    try:
+        q = (user_input or "").strip()
+        if not q:
+            metrics.record_answer("topk", "empty", ())
+            return out
+
+        snapshot, not_ready = _current_snapshot()
+        if not_ready:
+            metrics.record_answer("topk", "error", ())
+            out.update(answer=not_ready, result="error")
+            return out
+        t1 = time.perf_counter()
+
+        # Une seule recherche pour les k résultats
+        engine = snapshot.engine
+        vectors = engine.vectorize([q])
+        t3 = time.perf_counter()
+        hits = engine.search_vectors([q], vectors, k=max(1, k), topics=_topics(engine, topic))[0]
+        t4 = time.perf_counter()
+
+        doc, score, result = _best_match(snapshot, hits)
+        t5 = time.perf_counter()
+        matches = [{"doc": int(d), "question": snapshot.question(d), "score": float(s),
+                    "answer_id": snapshot.answer_id(d), "answer": str(snapshot.answer(d)),
+                    "intent": snapshot.label("intent", d), "source": snapshot.label("source", d)}
+                   for d, s in hits]
+        t6 = time.perf_counter()
+        # ni normalisation ni cache : étapes de durée nulle (t1 : après un éventuel chargement)
+        times = (t1, t1, t1, t3, t4, t5, t6)
+        metrics.record_answer("topk", result, times, score, t6 - t0)
+        out.update(answer=MSG_NOT_UNDERSTOOD if doc is None else matches[0]["answer"], result=result,
+                   matches=matches, threshold=engine.threshold, version=snapshot.version,
+                   timings={stage: end - start for stage, start, end in zip(metrics.STAGES, times, times[1:])
+                            if stage != "cache"})
+        return out
+
+    except Exception as e:
+        logger.exception("CHAT ERROR (top-k): %s", e)
+        metrics.record_answer("topk", "error", ())
+        out.update(answer=MSG_ERROR, result="error", matches=[])
+        return out
+
+def _observe_stages(path: str, times: Tuple[float, ...]):
+    """Durée de chaque étape atteinte (instants successifs, dans l'ordre de metrics.STAGES)."""
+    for stage, start, end in zip(metrics.STAGES, times, times[1:]):
+        metrics.inc(metrics.STAGE_SLOTS[path, stage], end - start)
+
+def reload_kb(background: bool = False) -> str:
+    """
+    Recharge la base (après mise à jour de faq.csv, l'artefact est recompilé)
+    sans interruption : le nouveau snapshot est construit à côté de l'ancien,
+    qui continue de servir, puis publié d'un coup. En cas d'échec l'ancien
+    reste en place. background=True lance la construction dans un thread.
+    """
+    global _init_error
+    if background:
+        threading.Thread(target=reload_kb, name="kb-reload", daemon=True).start()
+        return "Rechargement de la base de connaissances lancé en arrière-plan."
+
+    logger.info("Rechargement à chaud de la base de connaissances...")
     with _lock:
-        _df = None
-        _vectorizer = None
-        _index = None
-        _question_vectors = None
-        _init_error = None
-    
-    logger.info("Forçage du rechargement de la base de connaissances...")
-    _lazy_load()
-    
-    if _init_error:
-        return f"Échec du rechargement: {_init_error}"
+        try:
+            snapshot = _build_snapshot()
+        except Exception as e:
+            logger.exception("Échec du rechargement (ancienne base conservée): %s", e)
+            if _snapshot is None:
+                _init_error = e
+            return f"Échec du rechargement: {e}"
+        previous = _snapshot
+        _publish(snapshot)
+        _start_watcher()
+
+    logger.info("Base de connaissances publiée: version %s -> %s (%.2fs).",
+                previous.version if previous else None, snapshot.version, snapshot.load_seconds)
+    _apply_pending_corpus_delta()
     return "Base de connaissances (TF-IDF) rechargée."
+
+# ---- Modifications à chaud (sans refit) ----
+# Propres au processus : un rechargement depuis faq.csv (reload_kb, watcher)
+# repart du fichier. Pour une modification durable, mettre à jour faq.csv.
+
+def _delta_snapshot(base: KBSnapshot, delta: KBDelta) -> KBSnapshot:
+    vectorizer, index = delta.view()
+    engine = TfidfEngine(vectorizer, index, SIMILARITY_THRESHOLD)
+    return KBSnapshot(base.kb, vectorizer, index, engine, base.load_seconds, delta)
+
+def _mutate(apply):
+    """Applique apply(delta) sous le verrou et publie le snapshot qui en résulte."""
+    _lazy_load()
+    with _lock:
+        snapshot = _snapshot
+        if snapshot is None:
+            raise RuntimeError(f"Le chatbot n'est pas prêt: {_init_error}")
+        # index partitionné : les partitions ne suivent pas le delta (routage et sujet perdus)
+        if type(snapshot.engine) is not TfidfEngine:
+            raise RuntimeError(f"Modifications à chaud indisponibles avec le moteur {snapshot.engine.name!r} "
+                               "(tfidf uniquement) : mettre à jour faq.csv.")
+        delta = snapshot.delta or KBDelta(snapshot.kb, snapshot.vectorizer, snapshot.index)
+        result = apply(delta)
+        _publish(_delta_snapshot(snapshot, delta))
+    _maybe_refit(delta)
+    return result
+
+def add_entries(entries: Iterable[Tuple[str, str]]) -> int:
+    """Ajoute des paires (question, réponse) ; une question déjà présente est remplacée."""
+    entries = [clean_entry(q, a) for q, a in entries]
+    entries = [(q, a) for q, a in entries if q and a]
+
+    def apply(delta: KBDelta):
+        for q, a in entries:
+            delta.add(q, a)
+        return len(entries)
+    return _mutate(apply)
+
+def remove_entries(questions: Iterable[str]) -> int:
+    """Retire des questions de la base ; retourne le nombre effectivement retiré."""
+    questions = [clean_entry(q, "")[0] for q in questions]
+    return _mutate(lambda delta: sum(delta.remove(q) for q in questions))
+
+def update_entry(question: str, answer: Optional[str] = None, new_question: Optional[str] = None) -> bool:
+    """Change la réponse et/ou le libellé d'une question ; False si elle est absente."""
+    question = clean_entry(question, "")[0]
+
+    def apply(delta: KBDelta):
+        doc = delta.doc_of(question)
+        if doc is None:
+            return False
+        q, a = clean_entry(new_question if new_question is not None else question,
+                           answer if answer is not None else delta.answer(doc))
+        delta.remove(question)
+        delta.add(q, a)
+        return True
+    return _mutate(apply)
+
+def apply_corpus_delta(delta: dict) -> Tuple[int, int]:
+    """
+    Delta de lignes d'un recrawl (scripts/build_qa.py : "remove" = questions
+    retirées, "add" = paires ajoutées) appliqué à chaud en une seule
+    publication. Retourne (questions retirées, questions ajoutées).
+    """
+    removed = [clean_entry(q, "")[0] for q in delta.get("remove", ())]
+    added = [clean_entry(q, a) for q, a in delta.get("add", ())]
+    added = [(q, a) for q, a in added if q and a]
+
+    def apply(kb_delta: KBDelta):
+        n = sum(kb_delta.remove(q) for q in removed)
+        for q, a in added:
+            kb_delta.add(q, a)
+        return n, len(added)
+    return _mutate(apply)
+
+def _apply_pending_corpus_delta():
+    """
+    Applique CORPUS_DELTA s'il est plus récent que faq.csv (sinon faq.csv,
+    reconstruit après le recrawl, le contient déjà). Appelé après chaque
+    chargement et par la surveillance quand le fichier change.
+    """
+    try:
+        if CORPUS_DELTA.stat().st_mtime_ns <= FAQ_CSV.stat().st_mtime_ns:
+            return
+        delta = json.loads(CORPUS_DELTA.read_text(encoding="utf-8"))
+        removed, added = apply_corpus_delta(delta)
+    except FileNotFoundError:
+        return
+    except (OSError, ValueError, TypeError, RuntimeError) as e:
+        logger.error("Delta de recrawl %s non appliqué: %s", CORPUS_DELTA.name, e)
+        return
+    logger.info("Delta de recrawl (génération %s -> %s) appliqué: %d questions retirées, %d ajoutées.",
+                delta.get("from"), delta.get("to"), removed, added)
+
+def _maybe_refit(delta: KBDelta):
+    """Refit complet en arrière-plan quand la dérive dépasse KB_REFIT_DRIFT."""
+    global _refit_thread
+    if not KB_REFIT_DRIFT or max(delta.drift().values()) < KB_REFIT_DRIFT:
+        return
+    with _lock:
+        if _refit_thread is not None and _refit_thread.is_alive():
+            return
+        _refit_thread = threading.Thread(target=_refit, name="kb-refit", daemon=True)
+        _refit_thread.start()
+
+def _refit():
+    """
+    Recompile (en mémoire) la base modifiée : nouveau vocabulaire, IDF et
+    poids. Les requêtes continuent sur le snapshot courant pendant le fit ;
+    les modifications arrivées entre-temps sont rejouées sur le résultat.
+    """
+    with _lock:
+        snapshot = _snapshot
+        delta = snapshot.delta if snapshot is not None else None
+        if delta is None:
+            return
+        questions, answers = delta.entries()
+        labels = delta.entry_labels()
+        aliases = delta.entry_aliases()
+        mark = len(delta.log)
+    if not questions:
+        logger.warning("Refit ignoré : la base modifiée est vide.")
+        return
+
+    t0 = time.perf_counter()
+    try:
+        kb = memory_artifact(questions, answers, delta.kb.header.get("analyzer"), labels, aliases)
+        vectorizer = kb.make_vectorizer(_make_speller(kb))
+        index = InvertedIndex(kb.arrays["postings_indptr"], kb.arrays["postings_docs"],
+                              kb.arrays["postings_weights"], kb.n_docs)
+    except Exception as e:
+        logger.exception("Échec du refit (modifications conservées en delta): %s", e)
+        return
+
+    with _lock:
+        current = _snapshot
+        if current is None or current.delta is not delta:
+            return  # rechargé depuis faq.csv entre-temps
+        fresh = KBSnapshot(kb, vectorizer, index, _make_tfidf_engine(kb, vectorizer, index),
+                           time.perf_counter() - t0)
+        pending = delta.log[mark:]
+        if pending:
+            replayed = KBDelta(kb, vectorizer, index)
+            replayed.replay(pending)
+            fresh = _delta_snapshot(fresh, replayed)
+        _publish(fresh)
+    metrics.observe(metrics.KB_REFITS, time.perf_counter() - t0)
+    logger.info("Refit de la base modifiée: %d questions, version %s (%.2fs).",
+                kb.n_docs, fresh.version, fresh.load_seconds)
+
+def kb_info() -> dict:
+    """Version et date de chargement du snapshot servi par ce worker."""
+    snapshot = _snapshot
+    if snapshot is None:
+        return {"version": None, "engine": None, "loaded_at": None, "load_seconds": None, "n_docs": 0,
+                "n_aliases": 0, "n_added": 0, "n_removed": 0, "drift": None, "spelling": None}
+    kb, delta = snapshot.kb, snapshot.delta
+    speller = snapshot.vectorizer.speller
+    return {"version": snapshot.version, "engine": snapshot.engine.name, "loaded_at": snapshot.loaded_at,
+            "load_seconds": snapshot.load_seconds, "n_docs": delta.n_alive if delta else kb.n_docs,
+            "n_aliases": len(kb.aliases) if kb.aliases is not None else 0,
+            "n_added": delta.n_added if delta else 0, "n_removed": delta.n_removed if delta else 0,
+            "drift": delta.drift() if delta else None,
+            "spelling": speller.stats() if speller is not None else None}
+
+def cache_stats() -> dict:
+    """Compteurs du cache de réponses (hits, misses, évictions, taille)."""
+    return _answer_cache.stats()
 # ---- Fin du module chatbot_engine.py ----
\ No newline at end of file
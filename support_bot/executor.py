@@ -0,0 +1,68 @@
+# support_bot/executor.py
+# Pool borné pour exécuter la recherche (CPU) hors de la boucle d'événements
+# des vues async. Au-delà de `workers + queue` tâches en cours, la soumission
+# est refusée immédiatement (PoolSaturated -> 503 + Retry-After) au lieu de
+# laisser la file grossir sans limite.
+from __future__ import annotations
+import asyncio
+import os
+import threading
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
+from typing import Optional
+
+from .profiling import attach
+
+
+class PoolSaturated(Exception):
+    """Toutes les places du pool (en cours + en attente) sont occupées."""
+
+
+class BoundedExecutor:
+    def __init__(self, kind: str = "thread", workers: int = 4, queue: int = 64):
+        self.kind = kind
+        self.workers = workers
+        self.queue = queue
+        self._slots = threading.BoundedSemaphore(workers + queue)
+        self._executor: Executor
+        if kind == "process":
+            self._executor = ProcessPoolExecutor(max_workers=workers)
+        else:
+            self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="chatbot")
+
+    async def run(self, fn, *args):
+        """Exécute fn(*args) dans le pool et attend le résultat sans bloquer la boucle."""
+        if not self._slots.acquire(blocking=False):
+            raise PoolSaturated()
+        if self.kind == "thread":
+            fn = attach(fn)  # profilage de la requête en cours (profiling), sans effet sinon
+        try:
+            future = self._executor.submit(fn, *args)
+        except BaseException:
+            self._slots.release()
+            raise
+        # La place est rendue quand la tâche se termine, même si le client
+        # s'est déconnecté entre-temps (la tâche continue dans le pool).
+        future.add_done_callback(lambda _: self._slots.release())
+        return await asyncio.wrap_future(future)
+
+    def shutdown(self):
+        self._executor.shutdown(wait=False, cancel_futures=True)
+
+
+_pool: Optional[BoundedExecutor] = None
+_pool_pid: Optional[int] = None
+_pool_lock = threading.Lock()
+
+
+def get_pool() -> BoundedExecutor:
+    """Pool du processus courant (recréé après un fork), configuré par settings.CHATBOT_API_POOL."""
+    global _pool, _pool_pid
+    if _pool is not None and _pool_pid == os.getpid():
+        return _pool
+    with _pool_lock:
+        if _pool is None or _pool_pid != os.getpid():
+            from django.conf import settings
+            conf = getattr(settings, "CHATBOT_API_POOL", {})
+            _pool = BoundedExecutor(conf.get("KIND", "thread"), conf.get("WORKERS", 4), conf.get("QUEUE", 64))
+            _pool_pid = os.getpid()
+    return _pool
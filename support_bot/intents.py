@@ -0,0 +1,104 @@
+# support_bot/intents.py
+# Intentions (sujets) des questions : règles partagées par scripts/build_qa.py
+# (colonne intent du corpus) et par le routeur de l'index partitionné
+# (retrieval.PartitionedEngine), qui ne cherche une question que dans les
+# documents de son sujet.
+#   RuleRouter       : règles INTENT_RULES sur la question normalisée (forme
+#                      de la clé du cache de réponses : même clé, même sujet) ;
+#   ClassifierRouter : model.pkl de scripts/train_model.py (question ->
+#                      réponse), probabilités cumulées par sujet des réponses.
+# Les questions de faq.csv sans intent sont étiquetées au build de kb.bin
+# (rule_intent), pour que le chargement n'ait rien à calculer.
+from __future__ import annotations
+import re
+from typing import Dict, List, Sequence
+
+import numpy as np
+
+from .analyzer import fold_accents
+from .answer_cache import normalize_query
+
+INTENT_RULES = [
+    ("wifi|réseau|internet|wlan", "wifi"),
+    ("imprimante|print", "imprimante"),
+    ("mise.?à.?jour|windows update|update", "windows"),
+    ("installer|installation|setup|msi|exe", "installation_logiciel"),
+    ("navigateur|firefox|chrome|edge", "navigateur"),
+    ("antivirus|sécurité|protection", "securite"),
+]
+DEFAULT_INTENT = "depannage_pc"  # aucune règle ne correspond
+
+_COMPILED = [(re.compile(pattern), intent) for pattern, intent in INTENT_RULES]
+# mêmes règles sans accents, pour les questions normalisées
+_FOLDED = [(re.compile(fold_accents(pattern)), intent) for pattern, intent in INTENT_RULES]
+
+
+def match_intents(text: str) -> List[str]:
+    """Sujets dont une règle correspond à la question normalisée, dans l'ordre de INTENT_RULES."""
+    key = normalize_query(text)
+    return [intent for pattern, intent in _FOLDED if pattern.search(key)]
+
+
+def guess_intent(text: str) -> str:
+    """Premier sujet dont la règle correspond (DEFAULT_INTENT sinon)."""
+    low = text.lower()
+    for pattern, intent in _COMPILED:
+        if pattern.search(low):
+            return intent
+    return DEFAULT_INTENT
+
+
+class RuleRouter:
+    """Questions -> sujets à explorer (liste vide : index global)."""
+    name = "rules"
+
+    def __call__(self, questions: Sequence[str]) -> List[List[str]]:
+        return [match_intents(q) for q in questions]
+
+
+class ClassifierRouter:
+    """
+    Sujets dont la probabilité cumulée (somme des probabilités prédites pour
+    les réponses de ce sujet) atteint min_confidence, du plus probable au
+    moins probable.
+    """
+    name = "classifier"
+
+    def __init__(self, vectorizer, model, intent_of_answer: Dict[str, str], min_confidence: float = 0.5):
+        self.vectorizer = vectorizer
+        self.model = model
+        self.min_confidence = min_confidence
+        self.intents = sorted(set(intent_of_answer.values()))
+        code = {intent: i for i, intent in enumerate(self.intents)}
+        # sujet de chaque classe du modèle (-1 : réponse absente de la base)
+        self._class_intent = np.array([code.get(intent_of_answer.get(str(c)), -1) for c in model.classes_])
+        self._known = self._class_intent >= 0
+
+    def __call__(self, questions: Sequence[str]) -> List[List[str]]:
+        proba = self.model.predict_proba(self.vectorizer.transform(list(questions)))
+        out = []
+        for row in proba:
+            mass = np.bincount(self._class_intent[self._known], weights=row[self._known],
+                               minlength=len(self.intents))
+            order = np.argsort(-mass, kind="stable")
+            out.append([self.intents[i] for i in order if mass[i] >= self.min_confidence])
+        return out
+
+
+def intent_of_answers(answer_ids: np.ndarray, answer_texts: Sequence[str], doc_intents: np.ndarray,
+                      intents: Sequence[str]) -> Dict[str, str]:
+    """Réponse -> sujet majoritaire des questions qui y mènent (doc_intents : code par document, -1 = aucun)."""
+    labelled = doc_intents >= 0
+    pairs = np.stack((np.asarray(answer_ids)[labelled], doc_intents[labelled]), axis=1)
+    uniq, counts = np.unique(pairs, axis=0, return_counts=True)
+    best: Dict[int, tuple] = {}
+    for (answer, intent), n in zip(uniq.tolist(), counts.tolist()):
+        if answer not in best or n > best[answer][0]:
+            best[answer] = (n, intent)
+    return {answer_texts[a]: intents[i] for a, (_, i) in best.items()}
+
+
+def rule_intent(question: str) -> str:
+    """Sujet d'une question de la base selon les règles du routeur (cellule intent vide ou absente)."""
+    matched = match_intents(question)
+    return matched[0] if matched else DEFAULT_INTENT
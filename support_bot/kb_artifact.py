@@ -0,0 +1,396 @@
+# support_bot/kb_artifact.py
+# Artefact compilé de la base de connaissances (un seul fichier versionné).
+#
+# Format :
+#   MAGIC (8 octets) | taille de l'en-tête (uint64) | en-tête JSON | tableaux
+# Chaque tableau est aligné sur 64 octets et ouvert avec numpy.memmap : les
+# workers gunicorn partagent la même copie en page-cache et le premier appel
+# ne paie plus le fit du TfidfVectorizer.
+#
+# Les réponses sont stockées une seule fois (le corpus de build_qa répète la
+# même réponse pour chaque variante de question) : table de réponses
+# distinctes + answer_ids (int32, un par question), chaque réponse pouvant
+# être compressée séparément (zlib) et décompressée à la lecture.
+# Les colonnes optionnelles intent/source (corpus de build_qa) sont gardées de
+# la même façon : libellés distincts + un id int32 par question (-1 = vide) ;
+# une question sans intent reçoit celui des règles de intents.py.
+from __future__ import annotations
+import hashlib
+import json
+import os
+import tempfile
+import time
+import zlib
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+
+from .analyzer import Analyzer, resolve_profile
+from .intents import INTENT_RULES
+
+MAGIC = b"SBKB\x00\x01\r\n"
+FORMAT_VERSION = 4
+ALIGN = 64
+
+# Paramètres du TfidfVectorizer utilisés au build (et restaurés au chargement) ;
+# les termes viennent de analyzer.Analyzer, dont le profil est dans l'en-tête
+VECTORIZER_PARAMS = {"stop_words": None}
+
+# Compression des réponses : None ou "zlib" (une réponse = un flux zlib)
+ANSWER_CODECS = (None, "zlib")
+
+# Colonnes optionnelles de faq.csv conservées par question
+LABEL_COLUMNS = ("intent", "source")
+
+
+class StaleArtifactError(Exception):
+    """L'artefact est absent, corrompu ou ne correspond plus à faq.csv."""
+
+
+class StringTable:
+    """Table de chaînes à plat : un blob UTF-8 (éventuellement zlib par chaîne) + un tableau d'offsets."""
+
+    def __init__(self, blob: np.ndarray, offsets: np.ndarray, codec: Optional[str] = None):
+        self.blob = blob
+        self.offsets = offsets
+        self.codec = codec
+
+    @staticmethod
+    def encode(strings: List[str], codec: Optional[str] = None):
+        """Retourne (blob uint8, offsets int64) pour une liste de chaînes."""
+        encoded = [s.encode("utf-8") for s in strings]
+        if codec == "zlib":
+            encoded = [zlib.compress(b, 6) for b in encoded]
+        offsets = np.zeros(len(encoded) + 1, dtype=np.int64)
+        np.cumsum([len(b) for b in encoded], out=offsets[1:])
+        blob = np.frombuffer(b"".join(encoded), dtype=np.uint8)
+        return blob, offsets
+
+    def __len__(self) -> int:
+        return len(self.offsets) - 1
+
+    def __getitem__(self, i: int) -> str:
+        start, end = self.offsets[i], self.offsets[i + 1]
+        raw = self.blob[start:end].tobytes()
+        return (zlib.decompress(raw) if self.codec else raw).decode("utf-8")
+
+    def __iter__(self):
+        for i in range(len(self)):
+            yield self[i]
+
+
+class AnswerTable:
+    """Réponse de chaque question : answer_ids[doc] dans la table des réponses distinctes."""
+
+    def __init__(self, texts: StringTable, ids: np.ndarray):
+        self.texts = texts
+        self.ids = ids
+
+    def __len__(self) -> int:
+        return len(self.ids)
+
+    def __getitem__(self, doc: int) -> str:
+        return self.texts[self.ids[doc]]
+
+    def __iter__(self):
+        for i in range(len(self)):
+            yield self[i]
+
+
+class LabelTable(AnswerTable):
+    """Libellé (intent, source) de chaque question ; None si la cellule était vide."""
+
+    def __getitem__(self, doc: int) -> Optional[str]:
+        i = self.ids[doc]
+        return None if i < 0 else self.texts[i]
+
+
+class KBArtifact:
+    """Vue en lecture seule (memmap) sur un artefact compilé."""
+
+    def __init__(self, path: Path, header: dict, arrays: Dict[str, np.ndarray]):
+        self.path = path
+        self.header = header
+        self.arrays = arrays
+        self.version: str = header["source_sha256"][:12]
+        self.n_docs: int = header["n_docs"]
+        self.questions = StringTable(arrays["questions_blob"], arrays["questions_offsets"])
+        self.answer_texts = StringTable(arrays["answers_blob"], arrays["answers_offsets"],
+                                        header.get("answers_codec"))
+        self.answers = AnswerTable(self.answer_texts, arrays["answer_ids"])
+        self.vocabulary = StringTable(arrays["vocab_blob"], arrays["vocab_offsets"])
+        self.idf = arrays["idf"]
+        # Quasi-doublons regroupés au build (near_dup) : question alias -> document canonique
+        self.aliases = (StringTable(arrays["aliases_blob"], arrays["aliases_offsets"])
+                        if "aliases_blob" in arrays else None)
+        self.alias_docs = arrays.get("alias_docs")
+        # Colonnes optionnelles (LABEL_COLUMNS) présentes dans faq.csv
+        self.labels = {name: LabelTable(StringTable(arrays[f"{name}_blob"], arrays[f"{name}_offsets"]),
+                                        arrays[f"{name}_ids"])
+                       for name in header.get("labels", ())}
+
+    @property
+    def analyzer_profile(self) -> dict:
+        # artefacts antérieurs au profil : analyseur par défaut de sklearn
+        return resolve_profile(self.header.get("analyzer"))
+
+    def make_vectorizer(self, speller=None):
+        """Vectorizer de service (vocabulaire + IDF, sans sklearn ni fit), équivalent au TfidfVectorizer du build."""
+        from .tfidf import QueryVectorizer
+
+        return QueryVectorizer({term: i for i, term in enumerate(self.vocabulary)}, self.idf,
+                               Analyzer(self.analyzer_profile), speller)
+
+    def make_speller(self, max_distance: int = 1, prefix_length: int = 7, min_length: int = 6,
+                     min_frequency: int = 2):
+        """Correcteur (spelling.SpellIndex) du vocabulaire, fréquence = nombre de questions du terme."""
+        from .spelling import SpellIndex
+
+        df = np.diff(np.asarray(self.arrays["postings_indptr"]))
+        return SpellIndex(self.vocabulary, df, max_distance, prefix_length, min_length, min_frequency)
+
+
+def file_sha256(path: Path) -> str:
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1 << 20), b""):
+            h.update(chunk)
+    return h.hexdigest()
+
+
+def load_faq_frame(faq_csv: Path):
+    """Lit et nettoie faq.csv (mêmes règles que l'ancien _lazy_load)."""
+    import pandas as pd
+
+    df = pd.read_csv(faq_csv)
+    if not {"question", "answer"}.issubset(df.columns):
+        raise ValueError("Le CSV doit contenir les colonnes 'question' et 'answer'.")
+
+    df = df.dropna(subset=["question", "answer"]).astype({"question": str, "answer": str})
+    df["question"] = df["question"].str.strip().str.lower()  # Mettre en minuscule
+    df["answer"] = df["answer"].str.strip()
+    for name in LABEL_COLUMNS:
+        if name in df.columns:
+            df[name] = df[name].fillna("").astype(str).str.strip()
+    df = df.drop_duplicates(subset=["question"]).reset_index(drop=True)
+
+    if len(df) == 0:
+        raise ValueError("Le fichier 'faq.csv' est valide mais vide après nettoyage.")
+    return df
+
+
+def build_artifact(faq_csv: Path, out_path: Path, near_dup: Optional[dict] = None,
+                   answers_codec: Optional[str] = None, analyzer=None) -> dict:
+    """
+    Compile faq.csv en artefact : vocabulaire, IDF, postings (matrice TF-IDF
+    en CSC), table des questions et table des réponses distinctes. Écriture
+    atomique (fichier temporaire + os.replace) pour ne jamais exposer un
+    fichier partiel.
+
+    near_dup (paramètres de near_dup.cluster) : n'indexe qu'une question par
+    groupe de quasi-doublons ; les autres sont gardées comme alias.
+    answers_codec ("zlib") : chaque réponse distincte est compressée.
+    analyzer : profil de analyzer.Analyzer (nom ou dict), "default" si None.
+    """
+    source_sha256 = file_sha256(faq_csv)
+    header, arrays = compile_kb(load_faq_frame(faq_csv), faq_csv.name, source_sha256, near_dup, answers_codec,
+                                analyzer)
+    _write(out_path, header, arrays)
+    return header
+
+
+def memory_artifact(questions: List[str], answers: List[str], analyzer=None,
+                    labels: Optional[Dict[str, List[Optional[str]]]] = None,
+                    aliases: Optional[Tuple[List[str], List[int]]] = None) -> KBArtifact:
+    """
+    Artefact compilé en mémoire (sans fichier) depuis des questions déjà
+    nettoyées : sert au refit d'une base modifiée à chaud. La version est
+    l'empreinte du contenu. labels : colonne (LABEL_COLUMNS) -> valeur par question ;
+    aliases : (questions alias near_dup, document canonique de chacune), gardés tels quels.
+    """
+    import pandas as pd
+
+    h = hashlib.sha256()
+    for q, a in zip(questions, answers):
+        h.update(q.encode("utf-8") + b"\x00" + a.encode("utf-8") + b"\x00")
+    frame = pd.DataFrame({"question": questions, "answer": answers})
+    for name, values in (labels or {}).items():
+        frame[name] = [v or "" for v in values]
+    header, arrays = compile_kb(frame, None, h.hexdigest(), analyzer=analyzer)
+    if aliases and aliases[0]:
+        arrays["aliases_blob"], arrays["aliases_offsets"] = StringTable.encode(list(aliases[0]))
+        arrays["alias_docs"] = np.asarray(aliases[1], dtype=np.int32)
+    return KBArtifact(None, header, arrays)
+
+
+def compile_kb(df, source: Optional[str], source_sha256: str, near_dup: Optional[dict] = None,
+               answers_codec: Optional[str] = None, analyzer=None):
+    """(en-tête, tableaux) de l'artefact pour un frame question/answer nettoyé."""
+    import pandas as pd
+    import scipy.sparse as sp
+    from sklearn.feature_extraction.text import TfidfVectorizer
+
+    if answers_codec not in ANSWER_CODECS:
+        raise ValueError(f"Compression des réponses inconnue: {answers_codec!r} (attendu: {ANSWER_CODECS})")
+    n_source_rows = len(df)
+
+    extra: Dict[str, np.ndarray] = {}
+    near_dup_stats = None
+    if near_dup:
+        from .near_dup import cluster
+
+        t = time.perf_counter()
+        labels = cluster(df["question"].tolist(), df["answer"].tolist(), **near_dup)
+        canonical = labels == np.arange(len(df))
+        doc_of_row = np.cumsum(canonical) - 1
+        aliases = ~canonical
+        extra["source_rows"] = np.flatnonzero(canonical).astype(np.int32)  # ligne de faq.csv nettoyé
+        extra["alias_docs"] = doc_of_row[labels[aliases]].astype(np.int32)
+        extra["aliases_blob"], extra["aliases_offsets"] = StringTable.encode(df["question"][aliases].tolist())
+        near_dup_stats = {"aliases": int(aliases.sum()),
+                          "clusters": int(len(np.unique(labels[aliases]))),
+                          "seconds": round(time.perf_counter() - t, 3)}
+        df = df[canonical].reset_index(drop=True)
+
+    profile = resolve_profile(analyzer)
+    vectorizer = TfidfVectorizer(**VECTORIZER_PARAMS, analyzer=Analyzer(profile))
+    matrix = vectorizer.fit_transform(df["question"])
+    csc = sp.csc_matrix(matrix, dtype=np.float64)
+    csc.sort_indices()
+
+    terms = [""] * len(vectorizer.vocabulary_)
+    for term, i in vectorizer.vocabulary_.items():
+        terms[i] = term
+
+    arrays: Dict[str, np.ndarray] = {
+        "idf": np.asarray(vectorizer.idf_, dtype=np.float64),
+        "postings_indptr": csc.indptr.astype(np.int64),
+        "postings_docs": csc.indices.astype(np.int32),
+        "postings_weights": csc.data,
+    }
+    for name, strings in (("vocab", terms), ("questions", df["question"].tolist())):
+        arrays[f"{name}_blob"], arrays[f"{name}_offsets"] = StringTable.encode(strings)
+    # réponses distinctes, dans l'ordre de première apparition
+    answer_ids, answers = pd.factorize(df["answer"])
+    arrays["answer_ids"] = answer_ids.astype(np.int32)
+    arrays["answers_blob"], arrays["answers_offsets"] = StringTable.encode(answers.tolist(), answers_codec)
+    # sujet des questions sans colonne intent (ou cellule vide) : règles du routeur
+    from .intents import rule_intent
+
+    intent = df["intent"] if "intent" in df.columns else pd.Series("", index=df.index)
+    missing = intent == ""
+    intent_rules = [list(rule) for rule in INTENT_RULES] if missing.any() else None
+    if intent_rules:
+        df = df.assign(intent=intent.where(~missing, df["question"][missing].map(rule_intent)))
+    labels = [name for name in LABEL_COLUMNS if name in df.columns]
+    for name in labels:
+        ids, values = pd.factorize(df[name].where(df[name] != ""))  # vide -> -1
+        arrays[f"{name}_ids"] = ids.astype(np.int32)
+        arrays[f"{name}_blob"], arrays[f"{name}_offsets"] = StringTable.encode(values.tolist())
+    arrays.update(extra)
+
+    header = {
+        "format": FORMAT_VERSION,
+        "source": source,
+        "source_sha256": source_sha256,
+        "built_at": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "n_docs": int(matrix.shape[0]),
+        "n_terms": int(matrix.shape[1]),
+        "n_answers": len(answers),
+        "answers_codec": answers_codec,
+        "labels": labels,
+        "intent_rules": intent_rules,
+        "vectorizer": VECTORIZER_PARAMS,
+        "analyzer": profile,
+        "n_source_rows": n_source_rows,
+        "near_dup": near_dup or None,
+        "near_dup_stats": near_dup_stats,
+        "arrays": {},
+    }
+    return header, arrays
+
+
+def _align(n: int) -> int:
+    return (n + ALIGN - 1) // ALIGN * ALIGN
+
+
+def _write(out_path: Path, header: dict, arrays: Dict[str, np.ndarray]):
+    # 1) Calculer les offsets : l'en-tête doit les contenir, sa taille en dépend
+    layout = {}
+    for name, arr in arrays.items():
+        layout[name] = {"dtype": arr.dtype.str, "shape": list(arr.shape), "offset": 0}
+    header["arrays"] = layout
+    while True:
+        header_bytes = json.dumps(header, ensure_ascii=False).encode("utf-8")
+        pos = _align(len(MAGIC) + 8 + len(header_bytes))
+        changed = False
+        for name, arr in arrays.items():
+            if layout[name]["offset"] != pos:
+                layout[name]["offset"] = pos
+                changed = True
+            pos = _align(pos + arr.nbytes)
+        if not changed:
+            break
+
+    # 2) Écrire dans un fichier temporaire puis remplacer atomiquement
+    out_path.parent.mkdir(parents=True, exist_ok=True)
+    fd, tmp = tempfile.mkstemp(prefix=out_path.name + ".", dir=out_path.parent)
+    try:
+        with os.fdopen(fd, "wb") as f:
+            f.write(MAGIC)
+            f.write(np.uint64(len(header_bytes)).tobytes())
+            f.write(header_bytes)
+            for name, arr in arrays.items():
+                f.write(b"\x00" * (layout[name]["offset"] - f.tell()))
+                f.write(np.ascontiguousarray(arr).tobytes())
+        os.replace(tmp, out_path)
+    except BaseException:
+        if os.path.exists(tmp):
+            os.unlink(tmp)
+        raise
+
+
+def read_header(path: Path) -> dict:
+    with open(path, "rb") as f:
+        if f.read(len(MAGIC)) != MAGIC:
+            raise StaleArtifactError(f"Artefact invalide (en-tête): {path}")
+        size = int(np.frombuffer(f.read(8), dtype=np.uint64)[0])
+        return json.loads(f.read(size).decode("utf-8"))
+
+
+def open_artifact(path: Path, faq_csv: Optional[Path] = None, near_dup: Optional[dict] = None,
+                  answers_codec: Optional[str] = None, analyzer=None) -> KBArtifact:
+    """
+    Ouvre l'artefact en memmap. Si faq_csv est fourni, vérifie que l'artefact
+    a bien été compilé depuis ce fichier (sha256) avec le format courant et
+    les mêmes réglages (quasi-doublons, compression des réponses, profil de
+    l'analyseur), sinon lève StaleArtifactError.
+    """
+    if not path.exists():
+        raise StaleArtifactError(f"Artefact introuvable: {path}")
+    header = read_header(path)
+    if header.get("format") != FORMAT_VERSION:
+        raise StaleArtifactError(f"Format d'artefact {header.get('format')} != {FORMAT_VERSION}")
+    if header.get("vectorizer") != VECTORIZER_PARAMS:
+        raise StaleArtifactError("Paramètres du vectorizer modifiés depuis le build.")
+    if faq_csv is not None and header.get("source_sha256") != file_sha256(faq_csv):
+        raise StaleArtifactError(f"Artefact périmé: {faq_csv.name} a changé depuis le build.")
+    if faq_csv is not None and header.get("near_dup") != (near_dup or None):
+        raise StaleArtifactError("Réglages de regroupement des quasi-doublons modifiés depuis le build.")
+    if faq_csv is not None and header.get("answers_codec") != answers_codec:
+        raise StaleArtifactError("Compression des réponses modifiée depuis le build.")
+    if faq_csv is not None and resolve_profile(header.get("analyzer")) != resolve_profile(analyzer):
+        raise StaleArtifactError("Profil de l'analyseur modifié depuis le build.")
+    if faq_csv is not None and header.get("intent_rules") not in (None, [list(r) for r in INTENT_RULES]):
+        raise StaleArtifactError("Règles de sujets (intents.INTENT_RULES) modifiées depuis le build.")
+
+    arrays = {}
+    for name, spec in header["arrays"].items():
+        shape = tuple(spec["shape"])
+        if 0 in shape:
+            arrays[name] = np.zeros(shape, dtype=spec["dtype"])
+            continue
+        arrays[name] = np.memmap(path, dtype=spec["dtype"], mode="r",
+                                 offset=spec["offset"], shape=shape)
+    return KBArtifact(path, header, arrays)
@@ -0,0 +1,214 @@
+# support_bot/kb_delta.py
+# Modifications à chaud de la base de connaissances, sans refit.
+#
+# Le snapshot publié reste immuable : KBDelta garde, à côté de la base
+# (artefact memmap + index inversé), les questions ajoutées (postings à part),
+# les documents supprimés (masque) et les statistiques de fréquence des
+# termes à jour. Chaque modification produit une vue (vectorizer, OverlayIndex)
+# publiée dans un nouveau snapshot ; les poids des documents de la base ne
+# sont recalculés qu'au refit complet, lancé quand la dérive des IDF ou la
+# part de documents modifiés dépasse un seuil.
+from __future__ import annotations
+import hashlib
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+import scipy.sparse as sp
+
+from .kb_artifact import KBArtifact
+from .retrieval import InvertedIndex, OverlayIndex
+from .tfidf import QueryVectorizer
+
+
+def smooth_idf(n_docs, df):
+    """IDF lissé de TfidfVectorizer (smooth_idf=True)."""
+    return np.log((1 + n_docs) / (1 + np.asarray(df, dtype=np.float64))) + 1
+
+
+def clean_entry(question: str, answer: str) -> Tuple[str, str]:
+    """Mêmes règles que load_faq_frame (question en minuscules, espaces retirés)."""
+    return str(question).strip().lower(), str(answer).strip()
+
+
+class KBDelta:
+    """
+    Modifications appliquées à une base depuis son dernier fit. Mutable :
+    toujours utilisé sous le verrou de chatbot_engine ; les vues rendues par
+    view() ne changent plus ensuite (les listes ne font que s'allonger).
+    """
+
+    def __init__(self, kb: KBArtifact, vectorizer, index: InvertedIndex):
+        self.kb = kb
+        self.base_index = index
+        self.n_base = kb.n_docs
+        self.vectorizer = vectorizer
+        self._analyzer = vectorizer.build_analyzer()
+        self.idf_fit = np.asarray(vectorizer.idf_, dtype=np.float64)  # IDF des poids indexés
+        self.df = np.diff(np.asarray(index.indptr)).astype(np.int64)   # fréquences à jour
+        self.n_alive = self.n_base
+        self.alive = np.ones(self.n_base, dtype=bool)
+        # documents ajoutés (ids n_base + i) : postings en CSR documents x termes
+        self.questions: List[str] = []
+        self.answers: List[str] = []
+        self._indptr = [0]
+        self._terms: List[np.ndarray] = []
+        self._weights: List[np.ndarray] = []
+        self._doc_of: Optional[Dict[str, int]] = None
+        self.log: List[tuple] = []  # opérations depuis le fit (rejouées après un refit)
+        self._digest = hashlib.sha256()  # empreinte du log (version du snapshot)
+        self.n_added = 0
+        self.n_removed = 0
+
+    @property
+    def version(self) -> str:
+        """
+        Version de la base modifiée : celle du fit, le nombre d'opérations et
+        l'empreinte de leur contenu. Deux workers n'ont la même version que
+        s'ils ont appliqué les mêmes modifications (cache SQLite partagé).
+        """
+        return f"{self.kb.version}+{len(self.log)}.{self._digest.hexdigest()[:8]}"
+
+    def _record(self, op: tuple):
+        self.log.append(op)
+        for part in op:
+            self._digest.update(part.encode("utf-8") + b"\x00")
+
+    # ---- Accès ----
+    def doc_of(self, question: str) -> Optional[int]:
+        if self._doc_of is None:
+            # construit une fois, au premier accès par question
+            self._doc_of = {q: i for i, q in enumerate(self.kb.questions)}
+            for i, q in enumerate(self.questions):
+                if self.alive[self.n_base + i]:
+                    self._doc_of[q] = self.n_base + i
+        doc = self._doc_of.get(question)
+        return doc if doc is not None and self.alive[doc] else None
+
+    def question(self, doc: int) -> str:
+        return self.kb.questions[doc] if doc < self.n_base else self.questions[doc - self.n_base]
+
+    def answer(self, doc: int) -> str:
+        return self.kb.answers[doc] if doc < self.n_base else self.answers[doc - self.n_base]
+
+    def label(self, name: str, doc: int) -> Optional[str]:
+        """Colonne intent/source du document (None pour une entrée ajoutée à chaud)."""
+        table = self.kb.labels.get(name)
+        return table[doc] if table is not None and doc < self.n_base else None
+
+    # ---- Modifications ----
+    def _term_ids(self, question: str) -> Tuple[List[str], np.ndarray]:
+        """Termes distincts de la question et leurs ids ; les nouveaux étendent le vocabulaire."""
+        vocab = self.vectorizer.vocabulary_
+        tokens = set(self._analyzer(question))
+        new = sorted(t for t in tokens if t not in vocab)
+        if new:
+            # nouveau vectorizer (les vues déjà publiées gardent l'ancien)
+            vocab = dict(vocab)
+            for t in new:
+                vocab[t] = len(vocab)
+            # IDF d'un terme ajouté : statistiques à jour au moment de l'ajout
+            self.idf_fit = np.concatenate((self.idf_fit, smooth_idf(self.n_alive + 1, np.ones(len(new)))))
+            self.df = np.concatenate((self.df, np.zeros(len(new), dtype=np.int64)))
+            self.vectorizer = QueryVectorizer(vocab, self.idf_fit, self._analyzer, self.vectorizer.speller)
+        tokens = sorted(tokens)
+        return tokens, np.fromiter((vocab[t] for t in tokens), dtype=np.int64, count=len(tokens))
+
+    def add(self, question: str, answer: str) -> int:
+        """Ajoute (ou remplace) une entrée ; retourne son id de document."""
+        self.remove(question)
+        tokens, terms = self._term_ids(question)
+        row = self.vectorizer.transform([question])
+        doc = self.n_base + len(self.questions)
+        self.questions.append(question)
+        self.answers.append(answer)
+        self._terms.append(row.indices.astype(np.int32))
+        self._weights.append(row.data.astype(np.float64))
+        self._indptr.append(self._indptr[-1] + row.nnz)
+        self.alive = np.append(self.alive, True)
+        self.df[terms] += 1
+        self._extend_speller(tokens, terms)
+        self.n_alive += 1
+        self.n_added += 1
+        if self._doc_of is not None:
+            self._doc_of[question] = doc
+        self._record(("add", question, answer))
+        return doc
+
+    def _extend_speller(self, tokens: List[str], terms: np.ndarray):
+        """Le correcteur apprend les termes ajoutés dès qu'ils atteignent sa fréquence minimale."""
+        speller = self.vectorizer.speller
+        if speller is None:
+            return
+        extended = speller.extended(tokens, self.df[terms])
+        if extended is not speller:
+            v = self.vectorizer
+            self.vectorizer = QueryVectorizer(v.vocabulary_, v.idf_, self._analyzer, extended)
+
+    def remove(self, question: str) -> bool:
+        doc = self.doc_of(question)
+        if doc is None:
+            return False
+        self.alive = self.alive.copy()  # les vues publiées gardent leur masque
+        self.alive[doc] = False
+        vocab = self.vectorizer.vocabulary_
+        terms = {vocab[t] for t in self._analyzer(question) if t in vocab}
+        self.df[np.fromiter(terms, dtype=np.int64, count=len(terms))] -= 1
+        self.n_alive -= 1
+        self.n_removed += 1
+        del self._doc_of[question]
+        self._record(("remove", question))
+        return True
+
+    def replay(self, ops) -> None:
+        for op in ops:
+            if op[0] == "add":
+                self.add(op[1], op[2])
+            else:
+                self.remove(op[1])
+
+    # ---- Vue publiée et dérive ----
+    def view(self):
+        """(vectorizer, OverlayIndex) figés pour un snapshot."""
+        n_terms = len(self.idf_fit)
+        rows = len(self.questions)
+        terms = np.concatenate(self._terms) if self._terms else np.empty(0, dtype=np.int32)
+        weights = np.concatenate(self._weights) if self._weights else np.empty(0)
+        added = sp.csr_matrix((weights, terms, np.asarray(self._indptr, dtype=np.int64)), shape=(rows, n_terms))
+        return self.vectorizer, OverlayIndex(self.base_index, added.T.tocsr(), self.alive)
+
+    def drift(self) -> Dict[str, float]:
+        """
+        idf : variation relative de la masse IDF des postings (IDF à jour vs
+        IDF des poids indexés, pondérée par la fréquence des termes) ;
+        docs : part de documents ajoutés ou supprimés depuis le fit.
+        """
+        live = smooth_idf(self.n_alive, self.df)
+        mass = float((self.df * self.idf_fit).sum())
+        idf = float((self.df * np.abs(live - self.idf_fit)).sum()) / mass if mass else 0.0
+        docs = (self.n_added + self.n_removed) / max(self.n_base, 1)
+        return {"idf": idf, "docs": docs}
+
+    def entries(self) -> Tuple[List[str], List[str]]:
+        """Questions/réponses vivantes, dans l'ordre des ids (entrée du refit)."""
+        questions, answers = [], []
+        for doc in np.flatnonzero(self.alive).tolist():
+            questions.append(self.question(doc))
+            answers.append(self.answer(doc))
+        return questions, answers
+
+    def entry_aliases(self) -> Tuple[List[str], List[int]]:
+        """Alias near_dup de la base dont la question canonique est vivante, avec son id dans entries()."""
+        if self.kb.aliases is None:
+            return [], []
+        new_id = np.cumsum(self.alive) - 1
+        aliases, docs = [], []
+        for alias, doc in zip(self.kb.aliases, np.asarray(self.kb.alias_docs).tolist()):
+            if self.alive[doc]:
+                aliases.append(alias)
+                docs.append(int(new_id[doc]))
+        return aliases, docs
+
+    def entry_labels(self) -> Dict[str, List[Optional[str]]]:
+        """Colonnes intent/source des entrées vivantes, dans l'ordre de entries()."""
+        docs = np.flatnonzero(self.alive).tolist()
+        return {name: [self.label(name, doc) for doc in docs] for name in self.kb.labels}
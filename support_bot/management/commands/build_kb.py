@@ -0,0 +1,54 @@
+import json
+from pathlib import Path
+
+from django.core.management.base import BaseCommand, CommandError
+
+from support_bot.chatbot_engine import FAQ_CSV, KB_ANALYZER, KB_ANSWERS_CODEC, KB_ARTIFACT, near_dup_params
+from support_bot.kb_artifact import StaleArtifactError, build_artifact, open_artifact
+
+
+class Command(BaseCommand):
+    help = "Compile faq.csv en artefact memmap (kb.bin) chargé par les workers."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--source", default=str(FAQ_CSV), help="Fichier FAQ source (CSV question,answer).")
+        parser.add_argument("--output", default=str(KB_ARTIFACT), help="Chemin de l'artefact compilé.")
+        parser.add_argument("--force", action="store_true", help="Recompiler même si l'artefact est à jour.")
+        parser.add_argument("--near-dup-report", metavar="JSON",
+                            help="Écrire les groupes de quasi-doublons (settings.CHATBOT_NEAR_DUP) dans ce fichier.")
+
+    def handle(self, *args, **opts):
+        source, output = Path(opts["source"]), Path(opts["output"])
+        if not source.exists():
+            raise CommandError(f"Fichier FAQ introuvable: {source}")
+        near_dup = near_dup_params()
+
+        kb = None
+        if not opts["force"]:
+            try:
+                kb = open_artifact(output, source, near_dup, KB_ANSWERS_CODEC, KB_ANALYZER)
+                self.stdout.write(f"Artefact à jour (version {kb.version}): {output}")
+            except StaleArtifactError as e:
+                self.stdout.write(f"{e}")
+
+        if kb is None:
+            header = build_artifact(source, output, near_dup, KB_ANSWERS_CODEC, KB_ANALYZER)
+            self.stdout.write(self.style.SUCCESS(
+                f"✅ Artefact compilé: {output} — {header['n_docs']} questions, "
+                f"{header['n_terms']} termes, {header['n_answers']} réponses distinctes "
+                f"(version {header['source_sha256'][:12]})"
+            ))
+            if header["near_dup_stats"]:
+                stats = header["near_dup_stats"]
+                self.stdout.write(f"Quasi-doublons: {header['n_source_rows']} -> {header['n_docs']} questions "
+                                  f"({stats['clusters']} groupes, {stats['aliases']} alias, {stats['seconds']}s)")
+            kb = open_artifact(output)
+
+        if opts["near_dup_report"]:
+            if kb.aliases is None:
+                raise CommandError("Aucun regroupement dans l'artefact (settings.CHATBOT_NEAR_DUP['ENABLED']).")
+            from support_bot.near_dup import cluster_report
+
+            report = cluster_report(kb.questions, kb.answers, kb.aliases, kb.alias_docs)
+            Path(opts["near_dup_report"]).write_text(json.dumps(report, ensure_ascii=False, indent=1), encoding="utf-8")
+            self.stdout.write(f"Rapport: {opts['near_dup_report']} ({len(report)} groupes)")
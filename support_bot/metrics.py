@@ -0,0 +1,301 @@
+# support_bot/metrics.py
+# Métriques du moteur (format texte Prometheus, route /metrics/).
+#
+# Chaque série est une case float64 d'un tableau propre au processus. Avec
+# settings.CHATBOT_METRICS['DIR'] (ou la variable d'environnement
+# CHATBOT_METRICS_DIR), ce tableau est un fichier mmap <pid>.bin dans ce
+# répertoire : la route /metrics/ de n'importe quel worker additionne les
+# fichiers de tous les workers. Sans répertoire, seules les valeurs du
+# processus courant sont exposées.
+#
+# Le chemin chaud (record_answer) ne fait que des additions sur un
+# memoryview : pas de verrou ni d'appel système, ~3 µs par question.
+# Sans verrou, deux threads d'un même worker peuvent perdre un incrément
+# concurrent : acceptable pour des métriques.
+from __future__ import annotations
+import json
+import math
+import mmap
+import os
+import threading
+from bisect import bisect_left
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+
+# ---- Schéma : séries déclarées à l'import, une case chacune ----
+_series: List[str] = []          # nom complet (avec labels) de chaque case
+_families: Dict[str, dict] = {}  # nom de métrique -> type, aide, cases
+
+
+def _family(name: str, kind: str, help_text: str) -> dict:
+    return _families.setdefault(name, {"type": kind, "help": help_text, "slots": []})
+
+
+def _slot(family: dict, series: str) -> int:
+    _series.append(series)
+    family["slots"].append(len(_series) - 1)
+    return len(_series) - 1
+
+
+def _labels(**labels) -> str:
+    return "{" + ",".join(f'{k}="{v}"' for k, v in labels.items()) + "}" if labels else ""
+
+
+def counter(name: str, help_text: str, **labels) -> int:
+    return _slot(_family(name, "counter", help_text), name + _labels(**labels))
+
+
+def summary(name: str, help_text: str, **labels) -> int:
+    """Cases (somme, nombre) consécutives ; retourne l'indice de la somme."""
+    family = _family(name, "summary", help_text)
+    first = _slot(family, f"{name}_sum{_labels(**labels)}")
+    _slot(family, f"{name}_count{_labels(**labels)}")
+    return first
+
+
+def histogram(name: str, help_text: str, bounds: Tuple[float, ...]) -> Tuple[int, Tuple[float, ...], int]:
+    """
+    Une case par intervalle (non cumulée) + +Inf, puis la somme ; retourne
+    (première case, bornes, décalage de la somme).
+    """
+    family = _family(name, "histogram", help_text)
+    first = len(_series)
+    for b in bounds + (math.inf,):
+        _slot(family, f'{name}_bucket{{le="{_le(b)}"}}')
+    _slot(family, f"{name}_sum")
+    return first, bounds, len(bounds) + 1
+
+
+def _le(b: float) -> str:
+    return "+Inf" if b == math.inf else repr(float(b))
+
+
+STAGES = ("normalize", "cache", "vectorize", "search", "threshold", "answer")
+RESULTS = ("match", "below_threshold", "no_terms", "empty", "error", "cached")
+PATHS = ("single", "batch", "topk")  # get_chatbot_response(s), get_chatbot_matches
+
+# Temps cumulé par étape (moyenne par question : rapport avec chatbot_answers_total)
+STAGE_SLOTS = {(path, stage): counter("chatbot_stage_seconds_total", "Temps cumulé passé par étape de réponse.",
+                                      stage=stage, path=path)
+               for path in PATHS for stage in STAGES}
+_STAGE_LISTS = {path: [STAGE_SLOTS[path, stage] for stage in STAGES] for path in PATHS}
+RESULT_SLOTS = {r: counter("chatbot_answers_total", "Questions traitées, par issue.", result=r) for r in RESULTS}
+CACHE_HIT = counter("chatbot_answer_cache_total", "Consultations du cache de réponses.", outcome="hit")
+CACHE_MISS = counter("chatbot_answer_cache_total", "Consultations du cache de réponses.", outcome="miss")
+SCORE_HIST = histogram("chatbot_match_score", "Score du meilleur document (échelle du moteur).",
+                       (0.05, 0.1, 0.15, 0.2, 0.3, 0.4, 0.5, 0.6, 0.7, 0.8, 0.9, 1.0))
+LATENCY_HIST = histogram("chatbot_response_seconds", "Durée de get_chatbot_response (réponses du cache comprises).",
+                         (0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 1.0))
+KB_LOADS = summary("chatbot_kb_load_seconds", "Durée des constructions de snapshot de la base.")
+KB_REFITS = summary("chatbot_kb_refit_seconds", "Durée des refits en arrière-plan de la base modifiée.")
+ANALYZER_SECONDS = counter("chatbot_analyzer_seconds_total", "Temps passé dans l'analyseur de texte (analyzer.py).")
+SPELL_CORRECTED = counter("chatbot_spell_tokens_total", "Mots hors vocabulaire soumis au correcteur.",
+                          outcome="corrected")
+SPELL_UNKNOWN = counter("chatbot_spell_tokens_total", "Mots hors vocabulaire soumis au correcteur.",
+                        outcome="unknown")
+ROUTE_SLOTS = {o: counter("chatbot_intent_routes_total", "Questions par issue du routage par sujet "
+                          "(partition, repli sur l'index global, sans sujet).", outcome=o)
+               for o in ("partition", "fallback", "global")}
+API_REJECTED = counter("chatbot_api_rejected_total", "Requêtes refusées (pool de recherche saturé, 503).")
+
+N_SLOTS = len(_series)
+
+
+# ---- Stockage (par processus) ----
+_values: Optional[memoryview] = None
+_info: dict = {}
+_init_lock = threading.Lock()
+_enabled = True
+_dir: Optional[Path] = None
+
+
+def _config():
+    try:
+        from django.conf import settings
+        conf = getattr(settings, "CHATBOT_METRICS", {})
+    except Exception:
+        conf = {}
+    directory = conf.get("DIR") or os.environ.get("CHATBOT_METRICS_DIR")
+    return conf.get("ENABLED", True), Path(directory) if directory else None
+
+
+def _storage() -> memoryview:
+    """Tableau du processus (créé au premier usage, et de nouveau après un fork)."""
+    global _values, _enabled, _dir
+    with _init_lock:
+        if _values is None:
+            _enabled, _dir = _config()
+            if _dir is None:
+                _values = memoryview(bytearray(8 * N_SLOTS)).cast("d")
+            else:
+                _dir.mkdir(parents=True, exist_ok=True)
+                path = _dir / f"{os.getpid()}.bin"
+                with open(path, "wb") as f:
+                    f.write(b"\x00" * (8 * N_SLOTS))
+                with open(path, "r+b") as f:
+                    _values = memoryview(mmap.mmap(f.fileno(), 8 * N_SLOTS)).cast("d")
+                _write_schema()
+    return _values
+
+
+def _reset_after_fork():
+    global _values, _info
+    _values = None
+    _info = {}
+
+
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=_reset_after_fork)
+
+
+def _write_schema():
+    """<pid>.json : noms des cases (le lecteur ne dépend pas de l'ordre) + infos du processus."""
+    path = _dir / f"{os.getpid()}.json"
+    tmp = path.with_suffix(".json.tmp")
+    tmp.write_text(json.dumps({"series": _series, "info": _info}, ensure_ascii=False), encoding="utf-8")
+    os.replace(tmp, path)
+
+
+# ---- Enregistrement ----
+def record_answer(path: str, result: str, times: Tuple[float, ...], score: Optional[float] = None,
+                  total: Optional[float] = None, _stages=_STAGE_LISTS, _results=RESULT_SLOTS,
+                  _score=SCORE_HIST, _latency=LATENCY_HIST):
+    """
+    Une question traitée : `times` = instants (perf_counter) de début puis de
+    fin de chaque étape de STAGES atteinte ; score = meilleur score trouvé.
+    """
+    v = _values if _values is not None else _storage()
+    if not _enabled:
+        return
+    v[_results[result]] += 1
+    if times:
+        start = times[0]
+        for slot, end in zip(_stages[path], times[1:]):
+            v[slot] += end - start
+            start = end
+    if score is not None:
+        first, bounds, n = _score
+        v[first + bisect_left(bounds, score)] += 1
+        v[first + n] += score
+    if total is not None:
+        first, bounds, n = _latency
+        v[first + bisect_left(bounds, total)] += 1
+        v[first + n] += total
+
+
+def inc(slot: int, value: float = 1.0):
+    v = _values if _values is not None else _storage()
+    if _enabled:
+        v[slot] += value
+
+
+def observe(slot: int, seconds: float):
+    """Ajoute une mesure à un summary (somme + nombre)."""
+    v = _values if _values is not None else _storage()
+    if _enabled:
+        v[slot] += seconds
+        v[slot + 1] += 1
+
+
+def set_info(**info):
+    """Informations du processus (version de la base, moteur, taille...), exposées en gauges."""
+    _storage()
+    _info.update(info)
+    if _dir is not None and _enabled:
+        _write_schema()
+
+
+# ---- Exposition ----
+def _alive(pid: int) -> bool:
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+def _collect() -> Tuple[Dict[str, float], Dict[int, dict]]:
+    """Somme des cases de tous les processus (par nom de série) et infos des processus vivants."""
+    values = _storage()
+    if _dir is None:
+        return dict(zip(_series, values.tolist())), {os.getpid(): dict(_info)}
+    totals: Dict[str, float] = {}
+    infos: Dict[int, dict] = {}
+    for schema_path in _dir.glob("*.json"):
+        try:
+            pid = int(schema_path.stem)
+            schema = json.loads(schema_path.read_text(encoding="utf-8"))
+            raw = (_dir / f"{pid}.bin").read_bytes()
+        except (OSError, ValueError):
+            continue
+        counts = memoryview(raw).cast("d")[:len(schema["series"])]
+        for name, value in zip(schema["series"], counts.tolist()):
+            totals[name] = totals.get(name, 0.0) + value
+        if schema.get("info") and _alive(pid):
+            infos[pid] = schema["info"]
+    return totals, infos
+
+
+def _fmt(value: float) -> str:
+    return str(int(value)) if value == int(value) else repr(value)
+
+
+def render() -> str:
+    """Texte Prometheus (version 0.0.4) agrégé sur les workers."""
+    totals, infos = _collect()
+    lines: List[str] = []
+    for name, family in _families.items():
+        lines.append(f"# HELP {name} {family['help']}")
+        lines.append(f"# TYPE {name} {family['type']}")
+        series = [_series[i] for i in family["slots"]]
+        if family["type"] != "histogram":
+            lines.extend(f"{s} {_fmt(totals.get(s, 0.0))}" for s in series)
+            continue
+        # compteurs par intervalle -> cumulés, puis _count = +Inf
+        cumulative = 0.0
+        for s in series[:-1]:
+            cumulative += totals.get(s, 0.0)
+            lines.append(f"{s} {_fmt(cumulative)}")
+        lines.append(f"{series[-1]} {_fmt(totals.get(series[-1], 0.0))}")
+        lines.append(f"{name}_count {_fmt(cumulative)}")
+
+    # ratios dérivés (aussi calculables en PromQL à partir des compteurs)
+    answered = sum(totals.get(f'chatbot_answers_total{{result="{r}"}}', 0.0)
+                   for r in ("match", "below_threshold", "no_terms"))
+    below = sum(totals.get(f'chatbot_answers_total{{result="{r}"}}', 0.0) for r in ("below_threshold", "no_terms"))
+    hits = totals.get(_series[CACHE_HIT], 0.0)
+    lookups = hits + totals.get(_series[CACHE_MISS], 0.0)
+    corrected = totals.get(_series[SPELL_CORRECTED], 0.0)
+    misspelled = corrected + totals.get(_series[SPELL_UNKNOWN], 0.0)
+    lines += ["# HELP chatbot_below_threshold_ratio Part des recherches sans réponse (score sous le seuil).",
+              "# TYPE chatbot_below_threshold_ratio gauge",
+              f"chatbot_below_threshold_ratio {_fmt(below / answered if answered else 0.0)}",
+              "# HELP chatbot_answer_cache_hit_ratio Part des questions servies par le cache de réponses.",
+              "# TYPE chatbot_answer_cache_hit_ratio gauge",
+              f"chatbot_answer_cache_hit_ratio {_fmt(hits / lookups if lookups else 0.0)}",
+              "# HELP chatbot_spell_hit_ratio Part des mots hors vocabulaire corrigés.",
+              "# TYPE chatbot_spell_hit_ratio gauge",
+              f"chatbot_spell_hit_ratio {_fmt(corrected / misspelled if misspelled else 0.0)}"]
+
+    # infos par worker vivant
+    gauges = {"n_docs": "Questions indexées.", "last_load_seconds": "Durée du dernier chargement de la base.",
+              "loaded_at": "Date (epoch) du dernier chargement de la base."}
+    lines += ["# HELP chatbot_kb_info Base servie par chaque worker.", "# TYPE chatbot_kb_info gauge"]
+    lines += [f'chatbot_kb_info{{pid="{pid}",version="{info.get("version")}",engine="{info.get("engine")}"}} 1'
+              for pid, info in sorted(infos.items())]
+    for key, help_text in gauges.items():
+        lines += [f"# HELP chatbot_kb_{key} {help_text}", f"# TYPE chatbot_kb_{key} gauge"]
+        lines += [f'chatbot_kb_{key}{{pid="{pid}"}} {_fmt(float(info[key]))}'
+                  for pid, info in sorted(infos.items()) if info.get(key) is not None]
+    return "\n".join(lines) + "\n"
+
+
+def clear_dir(directory) -> None:
+    """Vide le répertoire multiprocessus (au démarrage du maître gunicorn)."""
+    directory = Path(directory)
+    if directory.is_dir():
+        for p in directory.iterdir():
+            if p.suffix in (".bin", ".json", ".tmp"):
+                p.unlink(missing_ok=True)
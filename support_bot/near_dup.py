@@ -0,0 +1,201 @@
+# support_bot/near_dup.py
+# Regroupement des quasi-doublons de questions (MinHash + LSH par bandes).
+#
+# build_qa.py produit une dizaine de variantes par article avec la même
+# réponse : l'index se remplit de questions presque identiques. Ici chaque
+# question devient une signature MinHash de ses n-grammes de caractères ; les
+# signatures sont découpées en bandes et seules les questions qui partagent
+# une bande sont comparées (pas de comparaison de toutes les paires). Les
+# candidates dont la similarité de Jaccard dépasse le seuil sont reliées, et
+# chaque composante connexe garde sa première question comme canonique.
+from __future__ import annotations
+from itertools import combinations
+from typing import Dict, List, Optional, Sequence
+
+import numpy as np
+
+from .answer_cache import normalize_query
+
+MAX_BUCKET = 32  # au-delà, un seau est relié en étoile + chaîne au lieu de toutes ses paires
+DEFAULTS = {"threshold": 0.8, "num_perm": 128, "shingle": 4, "same_answer": True}
+
+
+def shingle_sets(questions: Sequence[str], size: int = 4):
+    """
+    n-grammes de caractères de chaque question normalisée, hachés sur 32 bits,
+    en format CSR : (indptr, hashes), hashes[indptr[i]:indptr[i+1]] triés et
+    uniques. Calculé d'un bloc sur tout le corpus (hachage polynomial glissant
+    sur les points de code), sans boucle Python par n-gramme.
+    """
+    texts = [normalize_query(q).ljust(size, "\0") for q in questions]
+    lens = np.fromiter((len(t) for t in texts), dtype=np.int64, count=len(texts))
+    codes = np.frombuffer("".join(texts).encode("utf-32-le"), dtype=np.uint32).astype(np.uint64)
+    n_pos = len(codes) - size + 1
+    h = np.zeros(n_pos, dtype=np.uint64)
+    for k in range(size):
+        h = h * np.uint64(1_000_003) + codes[k:k + n_pos]
+    # mélange (finaliseur splitmix64) : des n-grammes voisins donneraient des
+    # valeurs proches, mal dispersées par le hachage linéaire du MinHash
+    h = (h ^ (h >> np.uint64(30))) * np.uint64(0xBF58476D1CE4E5B9)
+    h = (h ^ (h >> np.uint64(27))) * np.uint64(0x94D049BB133111EB)
+    h = (h ^ (h >> np.uint64(31))) >> np.uint64(32)
+
+    # fenêtres entièrement contenues dans une question
+    starts = np.cumsum(lens) - lens
+    n_grams = lens - size + 1
+    pos = np.repeat(starts - (np.cumsum(n_grams) - n_grams), n_grams) + np.arange(n_grams.sum())
+    docs = np.repeat(np.arange(len(texts)), n_grams)
+    hashes = h[pos]
+
+    order = np.lexsort((hashes, docs))
+    docs, hashes = docs[order], hashes[order]
+    first = np.ones(len(hashes), dtype=bool)
+    first[1:] = (docs[1:] != docs[:-1]) | (hashes[1:] != hashes[:-1])
+    docs, hashes = docs[first], hashes[first]
+    indptr = np.zeros(len(texts) + 1, dtype=np.int64)
+    np.cumsum(np.bincount(docs, minlength=len(texts)), out=indptr[1:])
+    return indptr, hashes
+
+
+def minhash_signatures(indptr: np.ndarray, hashes: np.ndarray, num_perm: int = 128,
+                       seed: int = 1, batch_shingles: int = 1 << 16) -> np.ndarray:
+    """
+    Signatures MinHash (n, num_perm) : minimum de num_perm hachages
+    multiply-shift ((a * x + b) mod 2**64) >> 32, sans division.
+    """
+    rng = np.random.default_rng(seed)
+    a = (rng.integers(0, 1 << 63, num_perm, dtype=np.uint64) | np.uint64(1))[:, None]
+    b = rng.integers(0, 1 << 63, num_perm, dtype=np.uint64)[:, None]
+    n = len(indptr) - 1
+    sig = np.empty((n, num_perm), dtype=np.uint32)
+    start = 0
+    while start < n:
+        # assez de questions pour ~batch_shingles n-grammes (mémoire bornée)
+        end = max(int(np.searchsorted(indptr, indptr[start] + batch_shingles, side="right")) - 1, start + 1)
+        lo, hi = indptr[start], indptr[end]
+        h = (a * hashes[lo:hi] + b) >> np.uint64(32)
+        sig[start:end] = np.minimum.reduceat(h, indptr[start:end] - lo, axis=1).T
+        start = end
+    return sig
+
+
+def _ranges(starts: np.ndarray, lengths: np.ndarray) -> np.ndarray:
+    """Concaténation des arange(s, s + l)."""
+    return np.repeat(starts - (np.cumsum(lengths) - lengths), lengths) + np.arange(lengths.sum())
+
+
+def jaccard_pairs(indptr: np.ndarray, hashes: np.ndarray, pairs: np.ndarray,
+                  batch: int = 65536) -> np.ndarray:
+    """Jaccard exact des ensembles de n-grammes pour chaque paire (i, j)."""
+    out = np.empty(len(pairs), dtype=np.float64)
+    for start in range(0, len(pairs), batch):
+        p = pairs[start:start + batch]
+        k = len(p)
+        li, lj = indptr[p[:, 0] + 1] - indptr[p[:, 0]], indptr[p[:, 1] + 1] - indptr[p[:, 1]]
+        pid = np.concatenate((np.repeat(np.arange(k, dtype=np.uint64), li),
+                              np.repeat(np.arange(k, dtype=np.uint64), lj)))
+        vals = np.concatenate((hashes[_ranges(indptr[p[:, 0]], li)], hashes[_ranges(indptr[p[:, 1]], lj)]))
+        # clé unique (paire, n-gramme) ; chaque ensemble est sans doublon :
+        # une clé répétée = un n-gramme commun aux deux questions
+        keys = np.sort((pid << np.uint64(32)) | vals)
+        common = keys[1:][keys[1:] == keys[:-1]]
+        inter = np.bincount((common >> np.uint64(32)).astype(np.int64), minlength=k)
+        out[start:start + k] = inter / (li + lj - inter)
+    return out
+
+
+def lsh_params(threshold: float, num_perm: int, fn_weight: float = 0.9):
+    """
+    (bandes, lignes par bande), bandes * lignes <= num_perm, qui minimisent les
+    aires de faux positifs (sous le seuil) et de faux négatifs (au-dessus), ces
+    derniers pesant fn_weight : un faux positif est écarté à la vérification,
+    un faux négatif est perdu.
+    """
+    def cost(bands, rows):
+        below = np.linspace(0, threshold, 101)
+        above = np.linspace(threshold, 1, 101)
+        fp = (1 - (1 - below ** rows) ** bands).mean() * threshold
+        fn = ((1 - above ** rows) ** bands).mean() * (1 - threshold)
+        return (1 - fn_weight) * fp + fn_weight * fn
+
+    return min(((b, r) for b in range(1, num_perm + 1) for r in range(1, num_perm // b + 1)),
+               key=lambda br: cost(*br))
+
+
+def candidate_pairs(sig: np.ndarray, bands: int, rows: int,
+                    groups: Optional[np.ndarray] = None) -> np.ndarray:
+    """
+    Paires (i, j), i < j, qui partagent au moins une bande (et le même groupe,
+    ex. la même réponse). Retourne un tableau (m, 2) sans doublon.
+    Dans un seau de plus de MAX_BUCKET questions, chacune n'est comparée qu'à
+    la première et à sa voisine : le coût reste linéaire en la taille du seau.
+    """
+    n = sig.shape[0]
+    groups = np.zeros(n, dtype=np.uint64) if groups is None else groups.astype(np.uint64)
+    coefs = np.random.default_rng(0).integers(1, 1 << 61, rows + 1, dtype=np.uint64)
+    found = []
+    for band in range(bands):
+        cols = sig[:, band * rows:(band + 1) * rows].astype(np.uint64)
+        # clé de seau : hachage polynomial de la bande (une collision ne fait
+        # qu'ajouter un candidat, vérifié ensuite)
+        key = (cols * coefs[:rows]).sum(axis=1) + groups * coefs[rows]
+        order = np.argsort(key, kind="stable")
+        sorted_key = key[order]
+        bounds = np.flatnonzero(np.diff(sorted_key)) + 1
+        starts = np.concatenate(([0], bounds))
+        ends = np.concatenate((bounds, [n]))
+        sizes = ends - starts
+        for s, e in zip(starts[(sizes > 1) & (sizes <= MAX_BUCKET)], ends[(sizes > 1) & (sizes <= MAX_BUCKET)]):
+            found.append(np.array(list(combinations(order[s:e].tolist(), 2)), dtype=np.int64))
+        for s, e in zip(starts[sizes > MAX_BUCKET], ends[sizes > MAX_BUCKET]):
+            members = order[s:e]
+            found.append(np.column_stack((np.full(len(members) - 1, members[0]), members[1:])))
+            found.append(np.column_stack((members[1:-1], members[2:])))
+    if not found:
+        return np.empty((0, 2), dtype=np.int64)
+    pairs = np.sort(np.concatenate(found).astype(np.int64), axis=1)
+    return np.unique(pairs, axis=0)
+
+
+def cluster(questions: Sequence[str], answers: Optional[Sequence[str]] = None,
+            threshold: float = 0.8, num_perm: int = 128, shingle: int = 4,
+            same_answer: bool = True) -> np.ndarray:
+    """
+    Pour chaque question, l'indice de la question canonique de son groupe
+    (la première du groupe ; elle-même si elle n'a pas de quasi-doublon).
+    Avec same_answer, seules les questions de même réponse sont regroupées.
+    """
+    import scipy.sparse as sp
+    from scipy.sparse.csgraph import connected_components
+
+    n = len(questions)
+    if n == 0:
+        return np.empty(0, dtype=np.int64)
+    indptr, hashes = shingle_sets(questions, shingle)
+    sig = minhash_signatures(indptr, hashes, num_perm)
+    groups = None
+    if same_answer and answers is not None:
+        ids: Dict[str, int] = {}
+        groups = np.fromiter((ids.setdefault(str(a), len(ids)) for a in answers), dtype=np.int64, count=n)
+    pairs = candidate_pairs(sig, *lsh_params(threshold, num_perm), groups=groups)
+
+    # Vérification des candidats par le Jaccard exact des n-grammes
+    pairs = pairs[jaccard_pairs(indptr, hashes, pairs) >= threshold]
+
+    graph = sp.coo_matrix((np.ones(len(pairs)), (pairs[:, 0], pairs[:, 1])), shape=(n, n))
+    _, comp = connected_components(graph, directed=False)
+    canonical = np.full(comp.max() + 1, n, dtype=np.int64)
+    np.minimum.at(canonical, comp, np.arange(n))
+    return canonical[comp]
+
+
+def cluster_report(questions: Sequence[str], answers: Sequence[str],
+                   aliases: Sequence[str], alias_docs: Sequence[int]) -> List[Dict]:
+    """Groupes de plus d'une question, du plus gros au plus petit."""
+    by_doc: Dict[int, List[str]] = {}
+    for alias, doc in zip(aliases, alias_docs):
+        by_doc.setdefault(int(doc), []).append(alias)
+    report = [{"canonical": questions[d], "answer": answers[d], "size": len(a) + 1, "aliases": a}
+              for d, a in by_doc.items()]
+    report.sort(key=lambda c: -c["size"])
+    return report
@@ -0,0 +1,234 @@
+# support_bot/profiling.py
+# Profilage intégré du chemin de requête et des scripts hors ligne.
+#
+# Activé par settings.CHATBOT_PROFILE['MODE'] ou la variable d'environnement
+# CHATBOT_PROFILE (les variables CHATBOT_PROFILE_DIR / _RATE / _INTERVAL
+# l'emportent sur les settings, pour les scripts lancés hors Django) :
+#   "sample"   : échantillonneur de piles (un thread lit sys._current_frames
+#                toutes les INTERVAL secondes) -> <nom>-....collapsed, format
+#                « piles repliées » de flamegraph.pl / speedscope ;
+#   "cprofile" : cProfile -> <nom>-....prof (pstats, snakeviz).
+# RATE est la part des appels profilés (ex. 0.01 en production) ; désactivé,
+# le décorateur rend la fonction telle quelle (aucun surcoût).
+#
+# Pour une vue async, seul le travail envoyé au pool de recherche
+# (executor.BoundedExecutor, pool de threads) est profilé : c'est là que
+# tourne le chargement de la base à la première requête.
+from __future__ import annotations
+import asyncio
+import contextlib
+import contextvars
+import cProfile
+import functools
+import inspect
+import itertools
+import logging
+import os
+import random
+import sys
+import threading
+import time
+from collections import Counter
+from pathlib import Path
+from typing import Optional
+
+logger = logging.getLogger(__name__)
+
+MODES = ("sample", "cprofile")
+DEFAULT_DIR = Path(__file__).resolve().parent / "data" / "profiles"
+
+_current: contextvars.ContextVar[Optional["_Session"]] = contextvars.ContextVar("chatbot_profile", default=None)
+_local = threading.local()  # .active : le thread courant est déjà profilé
+_seq = itertools.count()
+
+
+@functools.lru_cache(maxsize=1)
+def config() -> dict:
+    """Réglages effectifs (settings.CHATBOT_PROFILE puis variables d'environnement)."""
+    try:
+        from django.conf import settings
+        conf = dict(getattr(settings, "CHATBOT_PROFILE", {}))
+    except Exception:
+        conf = {}  # script lancé hors Django
+    env = os.environ
+    mode = env.get("CHATBOT_PROFILE", conf.get("MODE")) or None
+    if mode is not None and mode not in MODES:
+        logger.warning("CHATBOT_PROFILE=%r inconnu (attendu: %s) : profilage désactivé.", mode, ", ".join(MODES))
+        mode = None
+    return {
+        "mode": mode,
+        "dir": Path(env.get("CHATBOT_PROFILE_DIR") or conf.get("DIR") or DEFAULT_DIR),
+        "rate": float(env.get("CHATBOT_PROFILE_RATE") or conf.get("RATE", 1.0)),
+        "interval": float(env.get("CHATBOT_PROFILE_INTERVAL") or conf.get("INTERVAL", 0.005)),
+    }
+
+
+def _label(frame) -> str:
+    return f"{frame.f_globals.get('__name__', '?')}:{frame.f_code.co_name}"
+
+
+def _collapse(frame) -> str:
+    """Pile d'un thread, de la racine vers la feuille, séparée par des ';'."""
+    labels = []
+    while frame is not None:
+        labels.append(_label(frame))
+        frame = frame.f_back
+    return ";".join(reversed(labels))
+
+
+class _Session:
+    """Un profil (une requête ou un run) : un ou plusieurs threads, un fichier."""
+
+    def __init__(self, name: str, conf: dict):
+        self.name = name
+        self.mode = conf["mode"]
+        self.dir = conf["dir"]
+        self.interval = conf["interval"]
+        self.started = time.time()
+        self._lock = threading.Lock()
+        self._threads = set()
+        self._stacks: Counter = Counter()
+        self._profiles = []
+        self._sampler: Optional[threading.Thread] = None
+        self._stop = threading.Event()
+
+    @contextlib.contextmanager
+    def thread(self):
+        """Profile le thread courant pendant le bloc (sans effet s'il l'est déjà)."""
+        if getattr(_local, "active", False):
+            yield
+            return
+        _local.active = True
+        try:
+            if self.mode == "cprofile":
+                prof = cProfile.Profile()
+                prof.enable()
+                try:
+                    yield
+                finally:
+                    prof.disable()
+                    with self._lock:
+                        self._profiles.append(prof)
+            else:
+                tid = threading.get_ident()
+                with self._lock:
+                    self._threads.add(tid)
+                    if self._sampler is None:
+                        self._sampler = threading.Thread(target=self._sample, name="chatbot-profiler", daemon=True)
+                        self._sampler.start()
+                try:
+                    yield
+                finally:
+                    with self._lock:
+                        self._threads.discard(tid)
+        finally:
+            _local.active = False
+
+    def _sample(self):
+        # premier échantillon à une phase aléatoire : une requête plus courte
+        # que l'intervalle a une chance proportionnelle à sa durée d'être vue
+        wait = random.uniform(0, self.interval)
+        while not self._stop.wait(wait):
+            wait = self.interval
+            frames = sys._current_frames()
+            with self._lock:
+                threads = list(self._threads)
+            for tid in threads:
+                frame = frames.get(tid)
+                if frame is not None:
+                    self._stacks[_collapse(frame)] += 1
+
+    def close(self) -> Optional[Path]:
+        """Arrête l'échantillonneur et écrit le profil ; retourne son chemin (None si vide)."""
+        if self._sampler is not None:
+            self._stop.set()
+            self._sampler.join()
+        if not self._stacks and not self._profiles:
+            return None
+        stamp = time.strftime("%Y%m%dT%H%M%S", time.localtime(self.started))
+        self.dir.mkdir(parents=True, exist_ok=True)
+        base = self.dir / f"{self.name}-{stamp}-{os.getpid()}-{next(_seq)}"
+        if self.mode == "cprofile":
+            import pstats
+
+            path = base.with_suffix(".prof")
+            stats = pstats.Stats(self._profiles[0])
+            for prof in self._profiles[1:]:
+                stats.add(prof)
+            stats.dump_stats(path)
+        else:
+            path = base.with_suffix(".collapsed")
+            with open(path, "w", encoding="utf-8") as f:
+                for stack, count in self._stacks.most_common():
+                    f.write(f"{stack} {count}\n")
+        logger.info("Profil %s écrit: %s", self.name, path)
+        return path
+
+
+def _start(name: str, rate: Optional[float]) -> Optional[_Session]:
+    conf = config()
+    if conf["mode"] is None or getattr(_local, "active", False):
+        return None
+    if random.random() >= (conf["rate"] if rate is None else rate):
+        return None
+    return _Session(name, conf)
+
+
+@contextlib.contextmanager
+def profile(name: str, rate: Optional[float] = None):
+    """Profile le bloc dans le thread courant ; rate=None : RATE des réglages."""
+    session = _start(name, rate)
+    if session is None:
+        yield
+        return
+    try:
+        with session.thread():
+            yield
+    finally:
+        session.close()
+
+
+def profiled(name: str, rate: Optional[float] = None):
+    """
+    Décorateur : profile chaque appel (un fichier par appel) selon les
+    réglages lus à la décoration. Fonctions async : une session est ouverte
+    pour la durée de la coroutine et le pool de recherche y rattache ses
+    tâches (attach).
+    """
+    def decorate(fn):
+        if config()["mode"] is None:
+            return fn
+        if inspect.iscoroutinefunction(fn):
+            @functools.wraps(fn)
+            async def async_wrapper(*args, **kwargs):
+                session = _start(name, rate)
+                if session is None:
+                    return await fn(*args, **kwargs)
+                token = _current.set(session)
+                try:
+                    return await fn(*args, **kwargs)
+                finally:
+                    _current.reset(token)
+                    # arrêt de l'échantillonneur et écriture du fichier hors de la boucle d'événements
+                    await asyncio.get_running_loop().run_in_executor(None, session.close)
+            return async_wrapper
+
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            with profile(name, rate):
+                return fn(*args, **kwargs)
+        return wrapper
+    return decorate
+
+
+def attach(fn):
+    """fn à exécuter dans un autre thread, profilée dans la session async courante (s'il y en a une)."""
+    session = _current.get()
+    if session is None:
+        return fn
+
+    @functools.wraps(fn)
+    def run(*args, **kwargs):
+        with session.thread():
+            return fn(*args, **kwargs)
+    return run
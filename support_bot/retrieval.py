@@ -0,0 +1,456 @@
+# support_bot/retrieval.py
+# Index inversé (listes de postings) sur la matrice TF-IDF.
+# Seuls les documents qui partagent au moins un terme avec la question sont
+# scorés : le coût d'une recherche dépend du nombre de postings touchés,
+# pas de la taille de faq.csv.
+from __future__ import annotations
+import heapq
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+import scipy.sparse as sp
+
+from . import metrics
+
+
+class InvertedIndex:
+    """
+    Une liste de postings par terme du vocabulaire : (documents, poids TF-IDF).
+    Les lignes de la matrice sont normalisées L2 par le TfidfVectorizer, donc
+    le produit scalaire accumulé est directement la similarité cosinus.
+    """
+
+    def __init__(self, indptr: np.ndarray, doc_ids: np.ndarray, weights: np.ndarray, n_docs: int):
+        self.indptr = indptr      # début/fin des postings de chaque terme
+        self.doc_ids = doc_ids    # documents, triés par terme puis par id
+        self.weights = weights    # poids TF-IDF (terme, document)
+        self.n_docs = int(n_docs)
+        self.n_terms = len(indptr) - 1
+        self._transposed: Optional[sp.csr_matrix] = None  # construit au premier lot
+
+    @classmethod
+    def from_matrix(cls, doc_term) -> "InvertedIndex":
+        """Construit l'index depuis une matrice documents x termes (CSR)."""
+        csc = sp.csc_matrix(doc_term, dtype=np.float64)
+        csc.sort_indices()
+        return cls(csc.indptr, csc.indices.astype(np.int32), csc.data, csc.shape[0])
+
+    def _accumulate(self, term_ids, term_weights) -> Tuple[np.ndarray, np.ndarray]:
+        """Somme les contributions des postings de chaque terme de la question."""
+        docs, contribs = [], []
+        for t, w in zip(term_ids, term_weights):
+            start, end = self.indptr[t], self.indptr[t + 1]
+            if start == end:
+                continue
+            docs.append(self.doc_ids[start:end])
+            contribs.append(self.weights[start:end] * w)
+        if not docs:
+            return np.empty(0, dtype=np.int32), np.empty(0, dtype=np.float64)
+        if len(docs) == 1:
+            return docs[0], contribs[0]
+        hit_docs, inverse = np.unique(np.concatenate(docs), return_inverse=True)
+        scores = np.bincount(inverse, weights=np.concatenate(contribs))
+        return hit_docs, scores
+
+    def search(self, q_vec, k: int = 1) -> List[Tuple[int, float]]:
+        """
+        Retourne les k meilleurs (document, similarité), par score décroissant.
+        À score égal, le plus petit id de document l'emporte.
+        Liste vide si aucun terme de la question n'est dans le vocabulaire.
+        """
+        row = sp.csr_matrix(q_vec)
+        hit_docs, scores = self._accumulate(row.indices, row.data)
+        if len(hit_docs) == 0:
+            return []
+        top = heapq.nlargest(k, zip(scores.tolist(), (-hit_docs).tolist()))
+        return [(-neg_doc, score) for score, neg_doc in top]
+
+    def transposed(self) -> sp.csr_matrix:
+        """Matrice termes x documents (CSR) partageant les tableaux de postings."""
+        return sp.csr_matrix((self.weights, self.doc_ids, self.indptr),
+                             shape=(self.n_terms, self.n_docs), copy=False)
+
+    def score_matrix(self, q_matrix) -> sp.csr_matrix:
+        """Similarités (questions x documents) : un seul produit creux pour tout le lot."""
+        if self._transposed is None:
+            self._transposed = self.transposed()
+        return sp.csr_matrix(q_matrix @ self._transposed)
+
+    def search_batch(self, q_matrix, k: int = 1) -> List[List[Tuple[int, float]]]:
+        """
+        Recherche groupée : un seul produit creux (questions x termes) @
+        (termes x documents) pour tout le lot, puis top-k par ligne.
+        Mêmes règles que search() (départage par plus petit id, liste vide
+        si aucun terme connu).
+        """
+        return top_k_rows(self.score_matrix(q_matrix), k)
+
+
+def top_k_rows(scores: sp.csr_matrix, k: int = 1) -> List[List[Tuple[int, float]]]:
+    """Top-k (document, score) de chaque ligne d'une matrice de scores creuse."""
+    scores.sort_indices()
+    indptr, docs, data = scores.indptr, scores.indices, scores.data
+    results: List[List[Tuple[int, float]]] = [[] for _ in range(scores.shape[0])]
+
+    if k == 1 and scores.nnz:
+        # Top-1 vectorisé : max par ligne puis premier document qui l'atteint
+        rows = np.flatnonzero(np.diff(indptr))
+        row_max = np.maximum.reduceat(data, indptr[rows])
+        row_of = np.repeat(np.arange(len(indptr) - 1), np.diff(indptr))
+        is_max = data == row_max[np.searchsorted(rows, row_of)]
+        positions = np.flatnonzero(is_max)
+        _, first = np.unique(row_of[positions], return_index=True)
+        for pos in positions[first].tolist():
+            results[row_of[pos]] = [(int(docs[pos]), float(data[pos]))]
+        return results
+
+    for r in range(scores.shape[0]):
+        start, end = indptr[r], indptr[r + 1]
+        if start == end:
+            continue
+        top = heapq.nlargest(k, zip(data[start:end].tolist(), (-docs[start:end]).tolist()))
+        results[r] = [(-neg_doc, score) for score, neg_doc in top]
+    return results
+
+
+class OverlayIndex:
+    """
+    Index de base (immuable, memmap) + documents ajoutés depuis le dernier fit
+    + documents supprimés (masque), sans reconstruire la base : mêmes
+    search/search_batch que InvertedIndex. Les documents ajoutés ont les ids
+    base.n_docs, base.n_docs + 1, ... ; un document masqué n'est jamais renvoyé.
+    """
+
+    def __init__(self, base: InvertedIndex, delta_t: sp.csr_matrix, alive: np.ndarray):
+        self.base = base
+        self.delta_t = delta_t    # termes (vocabulaire étendu) x documents ajoutés
+        self.alive = alive        # bool par document (base puis ajoutés)
+        self.n_docs = base.n_docs + delta_t.shape[1]
+        self.n_terms = delta_t.shape[0]
+
+    def score_matrix(self, q_matrix) -> sp.csr_matrix:
+        q = sp.csr_matrix(q_matrix)
+        # les termes ajoutés au vocabulaire n'ont pas de postings dans la base
+        scores = sp.hstack([self.base.score_matrix(q[:, :self.base.n_terms]), q @ self.delta_t], format="csr")
+        scores.data *= self.alive[scores.indices]
+        scores.eliminate_zeros()
+        return scores
+
+    def search(self, q_vec, k: int = 1) -> List[Tuple[int, float]]:
+        row = sp.csr_matrix(q_vec)
+        in_base = row.indices < self.base.n_terms
+        docs, scores = self.base._accumulate(row.indices[in_base], row.data[in_base])
+        if self.delta_t.shape[1]:
+            added = sp.csr_matrix(row @ self.delta_t)
+            docs = np.concatenate((docs, added.indices + self.base.n_docs))
+            scores = np.concatenate((scores, added.data))
+        keep = self.alive[docs]
+        docs, scores = docs[keep], scores[keep]
+        if len(docs) == 0:
+            return []
+        top = heapq.nlargest(k, zip(scores.tolist(), (-docs).tolist()))
+        return [(-neg_doc, score) for score, neg_doc in top]
+
+    def search_batch(self, q_matrix, k: int = 1) -> List[List[Tuple[int, float]]]:
+        return top_k_rows(self.score_matrix(q_matrix), k)
+
+
+# ---- Moteurs de recherche interchangeables ----
+# Interface commune : search(question, k) et search_batch(questions, k)
+# retournent des listes de (document, similarité) triées par score décroissant.
+# `threshold` est le seuil de similarité propre à l'échelle de scores du moteur.
+# Les deux étapes sont aussi accessibles séparément (mesurées par metrics) :
+# vectorize(questions) puis search_vectors(questions, vecteurs, k).
+
+class RetrievalEngine:
+    name = "base"
+    threshold = 0.0
+
+    def vectorize(self, questions: List[str]):
+        return questions
+
+    def search_vectors(self, questions: List[str], vectors, k: int = 1, topics=None) -> List[List[Tuple[int, float]]]:
+        """topics : sujet indiqué par le client pour chaque question (PartitionedEngine seulement)."""
+        raise NotImplementedError
+
+    def search(self, question: str, k: int = 1) -> List[Tuple[int, float]]:
+        return self.search_batch([question], k)[0]
+
+    def search_batch(self, questions: List[str], k: int = 1) -> List[List[Tuple[int, float]]]:
+        return self.search_vectors(questions, self.vectorize(questions), k)
+
+
+class TfidfEngine(RetrievalEngine):
+    """TF-IDF (vectorizer) + index inversé."""
+    name = "tfidf"
+
+    def __init__(self, vectorizer, index: InvertedIndex, threshold: float):
+        self.vectorizer = vectorizer
+        self.index = index
+        self.threshold = threshold
+
+    def vectorize(self, questions: List[str]):
+        return self.vectorizer.transform([q.lower() for q in questions])  # Mettre en minuscule aussi
+
+    def search_vectors(self, questions: List[str], vectors, k: int = 1, topics=None) -> List[List[Tuple[int, float]]]:
+        if vectors.shape[0] == 1:
+            return [self.index.search(vectors, k=k)]
+        return self.index.search_batch(vectors, k=k)
+
+    def search(self, question: str, k: int = 1) -> List[Tuple[int, float]]:
+        return self.index.search(self.vectorize([question]), k=k)
+
+
+def partition_index(index: InvertedIndex, part_of_doc: np.ndarray, n_parts: int):
+    """
+    Un InvertedIndex par partition (documents de même sujet), ids locaux
+    croissants avec les ids globaux (même départage), mêmes poids : un score
+    dans une partition est le score global du document. Retourne
+    [(index, ids globaux)] dans l'ordre des partitions.
+    """
+    indptr = np.asarray(index.indptr)
+    doc_ids = np.asarray(index.doc_ids)
+    weights = np.asarray(index.weights)
+    part_of_doc = np.asarray(part_of_doc)
+    term_of = np.repeat(np.arange(index.n_terms), np.diff(indptr))
+    part_of_posting = part_of_doc[doc_ids]
+    local = np.empty(index.n_docs, dtype=np.int32)
+    parts = []
+    for p in range(n_parts):
+        docs = np.flatnonzero(part_of_doc == p)
+        local[docs] = np.arange(len(docs), dtype=np.int32)
+        sel = part_of_posting == p
+        sub_indptr = np.zeros(index.n_terms + 1, dtype=np.int64)
+        np.cumsum(np.bincount(term_of[sel], minlength=index.n_terms), out=sub_indptr[1:])
+        parts.append((InvertedIndex(sub_indptr, local[doc_ids[sel]], weights[sel], len(docs)), docs))
+    return parts
+
+
+class PartitionedEngine(TfidfEngine):
+    """
+    TF-IDF partitionné par sujet : router(questions) donne les sujets de
+    chaque question (ou un sujet imposé par le client, topics) ; la
+    recherche ne parcourt que les postings de ces partitions. Si aucun
+    résultat n'y atteint le seuil, ou sans sujet, repli sur l'index global.
+    """
+    name = "tfidf-intent"
+
+    def __init__(self, vectorizer, index: InvertedIndex, threshold: float,
+                 partitions: Dict[str, Tuple[InvertedIndex, np.ndarray]], router):
+        super().__init__(vectorizer, index, threshold)
+        self.partitions = partitions
+        self.router = router
+
+    def _routes(self, questions: List[str], topics) -> List[List[str]]:
+        routed = self.router(questions)
+        if topics is not None:
+            routed = [[t] if t in self.partitions else r for r, t in zip(routed, topics)]
+        return [[name for name in r if name in self.partitions] for r in routed]
+
+    def search_vectors(self, questions: List[str], vectors, k: int = 1, topics=None) -> List[List[Tuple[int, float]]]:
+        routes = self._routes(questions, topics)
+        results: List[List[Tuple[int, float]]] = [[] for _ in questions]
+        rows_of: Dict[str, List[int]] = {}
+        for row, names in enumerate(routes):
+            for name in names:
+                rows_of.setdefault(name, []).append(row)
+
+        # Une recherche par partition pour toutes les questions qui y vont
+        # (sans extraire de lignes quand il n'y a qu'une question)
+        single = len(questions) == 1
+        candidates: Dict[int, List[Tuple[int, float]]] = {}
+        for name, rows in rows_of.items():
+            sub, docs = self.partitions[name]
+            if len(rows) == 1:
+                hits = [sub.search(vectors if single else vectors[rows[0]], k=k)]
+            else:
+                hits = sub.search_batch(vectors[rows], k=k)
+            for row, row_hits in zip(rows, hits):
+                candidates.setdefault(row, []).extend((int(docs[d]), s) for d, s in row_hits)
+
+        fallback = []
+        for row, names in enumerate(routes):
+            found = candidates.get(row, [])
+            if len(names) > 1:
+                top = heapq.nlargest(k, ((s, -d) for d, s in found))
+                found = [(-neg_doc, s) for s, neg_doc in top]
+            if found and found[0][1] >= self.threshold:
+                results[row] = found
+                metrics.inc(metrics.ROUTE_SLOTS["partition"])
+            else:
+                fallback.append(row)
+                metrics.inc(metrics.ROUTE_SLOTS["fallback" if names else "global"])
+
+        if fallback:
+            rest = vectors if len(fallback) == len(questions) else vectors[fallback]
+            hits = super().search_vectors([questions[r] for r in fallback], rest, k)
+            for row, row_hits in zip(fallback, hits):
+                results[row] = row_hits
+        return results
+
+
+class DenseEngine(RetrievalEngine):
+    """
+    Embeddings denses précalculés (float32, normalisés L2, ouverts en memmap)
+    et produit scalaire NumPy. `encoder(questions) -> ndarray (n, d)` est le
+    point d'accroche pour encoder les questions (modèle local). Si un index
+    FAISS est fourni, il remplace le produit NumPy.
+    """
+    name = "dense"
+
+    def __init__(self, embeddings: np.ndarray, encoder, threshold: float, faiss_index=None):
+        self.embeddings = embeddings
+        self.encoder = encoder
+        self.threshold = threshold
+        self.faiss_index = faiss_index
+        self.n_docs = embeddings.shape[0]
+
+    def encode(self, questions: List[str]) -> np.ndarray:
+        q = np.asarray(self.encoder(questions), dtype=np.float32)
+        if q.ndim == 1:
+            q = q[None, :]
+        norms = np.linalg.norm(q, axis=1, keepdims=True)
+        return q / np.maximum(norms, 1e-12)
+
+    def vectorize(self, questions: List[str]) -> np.ndarray:
+        return self.encode(questions)
+
+    def search_vectors(self, questions: List[str], q: np.ndarray, k: int = 1, topics=None) -> List[List[Tuple[int, float]]]:
+        k = min(k, self.n_docs)
+        if self.faiss_index is not None:
+            scores, ids = self.faiss_index.search(q, k)
+            return [[(int(d), float(s)) for d, s in zip(row_ids, row_scores) if d >= 0]
+                    for row_ids, row_scores in zip(ids, scores)]
+        return [top_k_dense(row, k) for row in q @ self.embeddings.T]
+
+
+class HybridEngine(RetrievalEngine):
+    """
+    Recherche hybride : top-N du moteur lexical (TF-IDF) et du moteur dense,
+    fusion par rang réciproque (RRF) ou par somme pondérée des scores, puis
+    reranking de cette courte liste seulement. Un candidat n'est retenu que
+    si au moins un des deux moteurs le place au-dessus de son propre seuil.
+    Les scores retournés sont ceux de la fusion (après reranking).
+    """
+    name = "hybrid"
+    threshold = 0.0  # le seuil est appliqué par moteur, avant la fusion
+
+    def __init__(self, lexical: RetrievalEngine, dense: RetrievalEngine, reranker=None,
+                 candidates: int = 30, fusion: str = "rrf", rrf_k: int = 60,
+                 dense_weight: float = 0.5, rerank_weight: float = 0.5):
+        self.lexical = lexical
+        self.dense = dense
+        self.reranker = reranker
+        self.candidates = candidates
+        self.fusion = fusion
+        self.rrf_k = rrf_k
+        self.dense_weight = dense_weight
+        self.rerank_weight = rerank_weight
+
+    def _fuse(self, lex_hits, dense_hits) -> Dict[int, float]:
+        eligible = {d for d, s in lex_hits if s >= self.lexical.threshold}
+        eligible |= {d for d, s in dense_hits if s >= self.dense.threshold}
+        fused: Dict[int, float] = {}
+        for hits, weight in ((lex_hits, 1.0 - self.dense_weight), (dense_hits, self.dense_weight)):
+            for rank, (doc, score) in enumerate(hits):
+                if doc not in eligible:
+                    continue
+                if self.fusion == "rrf":
+                    contrib = weight / (self.rrf_k + rank + 1)
+                else:
+                    contrib = weight * score
+                fused[doc] = fused.get(doc, 0.0) + contrib
+        return fused
+
+    def vectorize(self, questions: List[str]):
+        return self.lexical.vectorize(questions), self.dense.vectorize(questions)
+
+    def search_vectors(self, questions: List[str], vectors, k: int = 1, topics=None) -> List[List[Tuple[int, float]]]:
+        n = max(k, self.candidates)
+        lex = self.lexical.search_vectors(questions, vectors[0], n, topics)
+        dense = self.dense.search_vectors(questions, vectors[1], n)
+        fused = [self._fuse(l, d) for l, d in zip(lex, dense)]
+
+        if self.reranker is not None:
+            todo = [i for i, f in enumerate(fused) if len(f) > 1]
+            if todo:
+                # Reranking coûteux limité aux quelques dizaines de candidats fusionnés
+                cand_lists = [sorted(fused[i]) for i in todo]
+                rerank_scores = self.reranker([questions[i] for i in todo], cand_lists)
+                for i, cands, scores in zip(todo, cand_lists, rerank_scores):
+                    fused[i] = self._combine(fused[i], cands, scores)
+
+        return [heapq.nlargest(k, f.items(), key=lambda item: (item[1], -item[0])) for f in fused]
+
+    def _combine(self, fused: Dict[int, float], cands: List[int], scores) -> Dict[int, float]:
+        """
+        Mélange score de fusion et score du reranker, chacun ramené à [0, 1].
+        Un score None (candidat inconnu du reranker) laisse le score de fusion.
+        """
+        top_fused = max(fused.values()) or 1.0
+        known = [r for r in scores if r is not None]
+        top_rerank = max(known) if known else 0.0
+        w = self.rerank_weight
+        out = {}
+        for doc, r in zip(cands, scores):
+            f_norm = fused[doc] / top_fused
+            if r is None or top_rerank <= 0:
+                out[doc] = f_norm
+            else:
+                out[doc] = (1.0 - w) * f_norm + w * r / top_rerank
+        return out
+
+
+class ClassifierReranker:
+    """
+    Reranker fondé sur le classifieur de scripts/train_model.py
+    (vectorizer.pkl + model.pkl, LogisticRegression question -> réponse) :
+    le score d'un candidat est la probabilité prédite pour sa réponse
+    (None si cette réponse n'était pas dans les données d'entraînement).
+    """
+
+    def __init__(self, vectorizer, model, answers):
+        self.vectorizer = vectorizer
+        self.model = model
+        self.answers = answers
+        self._class_of = {str(c): i for i, c in enumerate(model.classes_)}
+
+    def __call__(self, questions: List[str], candidates: List[List[int]]) -> List[List[Optional[float]]]:
+        proba = self.model.predict_proba(self.vectorizer.transform(questions))
+        out = []
+        for row, cands in zip(proba, candidates):
+            cls = [self._class_of.get(self.answers[d]) for d in cands]
+            out.append([float(row[c]) if c is not None else None for c in cls])
+        return out
+
+
+def top_k_dense(scores: np.ndarray, k: int) -> List[Tuple[int, float]]:
+    """Top-k d'un vecteur de scores dense (départage par plus petit id)."""
+    if k <= 0 or len(scores) == 0:
+        return []
+    if k < len(scores):
+        candidates = np.argpartition(-scores, k - 1)[:k]
+        # Les ex aequo au k-ième score peuvent être hors de la partition
+        kth = scores[candidates].min()
+        candidates = np.flatnonzero(scores >= kth)
+    else:
+        candidates = np.arange(len(scores))
+    order = np.lexsort((candidates, -scores[candidates]))[:k]
+    return [(int(candidates[i]), float(scores[candidates[i]])) for i in order]
+
+
+MINILM_MODEL = "sentence-transformers/paraphrase-multilingual-MiniLM-L12-v2"
+_minilm = None
+
+
+def encode_minilm(questions: List[str]) -> np.ndarray:
+    """
+    Encodeur de questions par défaut pour le moteur dense : le même modèle
+    que scripts/train_embed_index.py (sentence-transformers, chargé une fois).
+    """
+    global _minilm
+    if _minilm is None:
+        from sentence_transformers import SentenceTransformer
+        _minilm = SentenceTransformer(MINILM_MODEL)
+    return _minilm.encode(questions, normalize_embeddings=True)
+
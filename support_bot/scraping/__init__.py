@@ -0,0 +1,11 @@
+# support_bot/scraping : récupération HTTP (session partagée, concurrence,
+# limite par hôte, cache conditionnel, reprises) et extraction communes aux
+# scripts de scraping (support_bot/scripts/scrape_*.py, merge_datasets.py).
+# Dépendances : requests, beautifulsoup4 (requirements.txt).
+from .cache import CacheEntry, HttpCache
+from .fetcher import DEFAULT_CACHE_DIR, FetchError, FetchResult, Fetcher, HostRateLimiter
+
+__all__ = [
+    "CacheEntry", "HttpCache",
+    "DEFAULT_CACHE_DIR", "FetchError", "FetchResult", "Fetcher", "HostRateLimiter",
+]
@@ -0,0 +1,79 @@
+# support_bot/scraping/cache.py
+# Cache HTTP sur disque : une entrée par URL (corps + métadonnées ETag /
+# Last-Modified). Sert aux requêtes conditionnelles et au rejeu hors ligne :
+# un répertoire de cache enregistré fait office de jeu de fixtures.
+from __future__ import annotations
+import hashlib
+import json
+import os
+import tempfile
+import time
+from pathlib import Path
+from typing import Optional
+
+
+class CacheEntry:
+    __slots__ = ("url", "status", "encoding", "etag", "last_modified", "fetched_at", "body")
+
+    def __init__(self, url: str, status: int, encoding: Optional[str], etag: Optional[str],
+                 last_modified: Optional[str], fetched_at: float, body: bytes):
+        self.url = url
+        self.status = status
+        self.encoding = encoding
+        self.etag = etag
+        self.last_modified = last_modified
+        self.fetched_at = fetched_at
+        self.body = body
+
+    def age(self) -> float:
+        return time.time() - self.fetched_at
+
+
+class HttpCache:
+    """Répertoire <root>/<2 car.>/<sha256 de l'URL>.{json,body}, écrit de façon atomique."""
+
+    def __init__(self, root: Path):
+        self.root = Path(root)
+
+    def _paths(self, url: str):
+        key = hashlib.sha256(url.encode("utf-8")).hexdigest()
+        base = self.root / key[:2] / key
+        return base.with_suffix(".json"), base.with_suffix(".body")
+
+    def get(self, url: str) -> Optional[CacheEntry]:
+        meta_path, body_path = self._paths(url)
+        try:
+            meta = json.loads(meta_path.read_text(encoding="utf-8"))
+            body = body_path.read_bytes()
+        except (OSError, ValueError):
+            return None
+        if meta.get("url") != url:
+            return None
+        return CacheEntry(url, meta["status"], meta.get("encoding"), meta.get("etag"),
+                          meta.get("last_modified"), meta["fetched_at"], body)
+
+    def put(self, entry: CacheEntry):
+        meta_path, body_path = self._paths(entry.url)
+        meta = {"url": entry.url, "status": entry.status, "encoding": entry.encoding,
+                "etag": entry.etag, "last_modified": entry.last_modified, "fetched_at": entry.fetched_at}
+        # corps d'abord : une métadonnée visible a toujours son corps
+        _atomic_write(body_path, entry.body)
+        _atomic_write(meta_path, json.dumps(meta, ensure_ascii=False).encode("utf-8"))
+
+    def touch(self, entry: CacheEntry):
+        """Revalidée (304) : seule la date de récupération change."""
+        entry.fetched_at = time.time()
+        self.put(entry)
+
+
+def _atomic_write(path: Path, data: bytes):
+    path.parent.mkdir(parents=True, exist_ok=True)
+    fd, tmp = tempfile.mkstemp(prefix=path.name + ".", dir=path.parent)
+    try:
+        with os.fdopen(fd, "wb") as f:
+            f.write(data)
+        os.replace(tmp, path)
+    except BaseException:
+        if os.path.exists(tmp):
+            os.unlink(tmp)
+        raise
@@ -0,0 +1,50 @@
+# support_bot/scraping/extract.py
+# Extraction commune aux sources : une page d'aide devient un article
+# {"source", "titre", "contenu"}. Les variantes par source (balises de titre,
+# longueur minimale d'un bloc, espaces normalisés ou non) sont des paramètres.
+from __future__ import annotations
+from typing import Dict, List, Optional, Sequence
+
+from bs4 import BeautifulSoup
+
+BLOCKS = "h2, h3, p, li"
+
+
+def soup_of(html: str) -> BeautifulSoup:
+    return BeautifulSoup(html, "html.parser")
+
+
+def extract_article(html: str, url: str, title_tags: Sequence[str] = ("h1",), blocks: str = BLOCKS,
+                    min_len: int = 40, collapse_ws: bool = True) -> Optional[Dict[str, str]]:
+    """
+    Titre = première balise de title_tags ; contenu = blocs `blocks` d'au
+    moins min_len caractères, un par ligne. None si l'un des deux manque.
+    """
+    soup = soup_of(html)
+    title = soup.find(list(title_tags))
+    buf = []
+    for b in soup.select(blocks):
+        t = b.get_text(" ", strip=True)
+        if collapse_ws:
+            t = " ".join(t.split())
+        if len(t) >= min_len:
+            buf.append(t)
+    if title and buf:
+        return {"source": url, "titre": title.get_text(strip=True), "contenu": "\n".join(buf)}
+    return None
+
+
+def extract_items(html: str, source: str, title_sel: str, body_sel: str,
+                  item_sel: Optional[str] = None) -> List[Dict[str, str]]:
+    """
+    Fiches titre + description : une par élément item_sel (ou une seule pour
+    la page entière si item_sel est None) ayant les deux sélecteurs.
+    """
+    soup = soup_of(html)
+    data = []
+    for item in (soup.select(item_sel) if item_sel else [soup]):
+        titre = item.select_one(title_sel)
+        description = item.select_one(body_sel)
+        if titre and description:
+            data.append({"source": source, "titre": titre.text.strip(), "contenu": description.text.strip()})
+    return data
@@ -0,0 +1,183 @@
+# support_bot/scraping/fetcher.py
+# Récupération HTTP partagée par les scripts de scraping : une session
+# requests (connexions réutilisées), des téléchargements concurrents, un
+# intervalle minimal par hôte (au lieu d'un time.sleep global), des requêtes
+# conditionnelles (ETag / Last-Modified) sur le cache disque et des reprises
+# avec attente exponentielle.
+from __future__ import annotations
+import random
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from email.utils import parsedate_to_datetime
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional, Union
+from urllib.parse import urlsplit
+
+from .cache import CacheEntry, HttpCache
+
+DEFAULT_CACHE_DIR = Path(__file__).resolve().parents[1] / "data" / ".http_cache"
+DEFAULT_HEADERS = {"User-Agent": "Mozilla/5.0"}
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+
+
+class FetchError(Exception):
+    """Échec définitif (statut HTTP d'erreur, réseau, ou absent du cache hors ligne)."""
+
+    def __init__(self, url: str, message: str, status: Optional[int] = None):
+        super().__init__(f"{url}: {message}")
+        self.url = url
+        self.status = status
+
+
+class FetchResult:
+    __slots__ = ("url", "status", "content", "encoding", "from_cache")
+
+    def __init__(self, url: str, status: int, content: bytes, encoding: Optional[str], from_cache: bool):
+        self.url = url
+        self.status = status
+        self.content = content
+        self.encoding = encoding
+        self.from_cache = from_cache  # True : corps servi depuis le cache (304 ou hors ligne)
+
+    @property
+    def text(self) -> str:
+        return self.content.decode(self.encoding or "utf-8", errors="replace")
+
+
+class HostRateLimiter:
+    """Au plus une requête toutes les `interval` secondes par hôte ; hôtes différents en parallèle."""
+
+    def __init__(self, interval: float):
+        self.interval = interval
+        self._next: Dict[str, float] = {}
+        self._lock = threading.Lock()
+
+    def wait(self, host: str):
+        with self._lock:
+            now = time.monotonic()
+            slot = max(now, self._next.get(host, now))
+            self._next[host] = slot + self.interval
+        if slot > now:
+            time.sleep(slot - now)
+
+
+class Fetcher:
+    """
+    Fetcher(workers=8, per_host_interval=1.0) ; get(url) ou fetch_all(urls).
+
+    max_age : une entrée du cache plus récente est servie sans requête.
+    offline : uniquement le cache (FetchError si l'URL n'y est pas) ; permet
+    de rejouer un répertoire de cache enregistré sans réseau.
+    """
+
+    def __init__(self, cache_dir: Optional[Path] = DEFAULT_CACHE_DIR, workers: int = 8,
+                 per_host_interval: float = 1.0, retries: int = 3, backoff: float = 0.5,
+                 timeout: float = 20.0, headers: Optional[dict] = None,
+                 max_age: Optional[float] = None, offline: bool = False, session=None):
+        self.cache = HttpCache(cache_dir) if cache_dir is not None else None
+        self.workers = workers
+        self.retries = retries
+        self.backoff = backoff
+        self.timeout = timeout
+        self.max_age = max_age
+        self.offline = offline
+        self.limiter = HostRateLimiter(per_host_interval)
+        if session is None and not offline:
+            import requests
+            from requests.adapters import HTTPAdapter
+
+            session = requests.Session()
+            adapter = HTTPAdapter(pool_connections=workers, pool_maxsize=workers)
+            session.mount("http://", adapter)
+            session.mount("https://", adapter)
+        if session is not None:
+            session.headers.update(headers or DEFAULT_HEADERS)
+        self.session = session
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def close(self):
+        if self.session is not None:
+            self.session.close()
+
+    def get(self, url: str) -> FetchResult:
+        cached = self.cache.get(url) if self.cache is not None else None
+        if cached is not None and (self.offline or (self.max_age is not None and cached.age() < self.max_age)):
+            return FetchResult(url, cached.status, cached.body, cached.encoding, True)
+        if self.offline:
+            raise FetchError(url, "absent du cache (mode hors ligne)")
+
+        headers = {}
+        if cached is not None:
+            if cached.etag:
+                headers["If-None-Match"] = cached.etag
+            if cached.last_modified:
+                headers["If-Modified-Since"] = cached.last_modified
+
+        r = self._request(url, headers)
+        if r.status_code == 304 and cached is not None:
+            self.cache.touch(cached)
+            return FetchResult(url, cached.status, cached.body, cached.encoding, True)
+        if r.status_code >= 400:
+            raise FetchError(url, f"HTTP {r.status_code}", r.status_code)
+
+        encoding = r.encoding or r.apparent_encoding
+        if self.cache is not None:
+            self.cache.put(CacheEntry(url, r.status_code, encoding, r.headers.get("ETag"),
+                                      r.headers.get("Last-Modified"), time.time(), r.content))
+        return FetchResult(url, r.status_code, r.content, encoding, False)
+
+    def _request(self, url: str, headers: dict):
+        """GET avec reprises : erreurs réseau et statuts RETRY_STATUSES (Retry-After respecté)."""
+        import requests
+
+        host = urlsplit(url).netloc
+        for attempt in range(self.retries + 1):
+            self.limiter.wait(host)
+            try:
+                r = self.session.get(url, headers=headers, timeout=self.timeout)
+            except requests.RequestException as e:
+                if attempt == self.retries:
+                    raise FetchError(url, str(e)) from e
+                time.sleep(self._delay(attempt))
+                continue
+            if r.status_code not in RETRY_STATUSES or attempt == self.retries:
+                return r
+            time.sleep(self._delay(attempt, r.headers.get("Retry-After")))
+        raise AssertionError("unreachable")
+
+    def _delay(self, attempt: int, retry_after: Optional[str] = None) -> float:
+        if retry_after:
+            try:
+                return max(float(retry_after), 0.0)
+            except ValueError:
+                try:
+                    return max(parsedate_to_datetime(retry_after).timestamp() - time.time(), 0.0)
+                except (TypeError, ValueError):
+                    pass
+        return self.backoff * (2 ** attempt) * (1 + random.random() / 2)
+
+    def fetch_all(self, urls: Iterable[str],
+                  return_exceptions: bool = False) -> List[Union[FetchResult, FetchError]]:
+        """
+        Récupère les URLs en parallèle (workers threads, intervalle par hôte) ;
+        résultats dans l'ordre des URLs. Avec return_exceptions, une URL en
+        échec donne son FetchError au lieu d'interrompre le lot.
+        """
+        urls = list(urls)
+
+        def one(url):
+            try:
+                return self.get(url)
+            except FetchError as e:
+                if return_exceptions:
+                    return e
+                raise
+
+        with ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="fetch") as pool:
+            return list(pool.map(one, urls))
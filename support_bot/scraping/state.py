@@ -0,0 +1,101 @@
+# support_bot/scraping/state.py
+# État de crawl persistant et détection des changements.
+#
+# Chaque article a un identifiant dérivé de son URL et de son contenu
+# normalisé : un article inchangé garde son id d'un crawl à l'autre, un
+# article modifié en change. En comparant l'état précédent au crawl courant,
+# un recrawl ne produit que les articles ajoutés, modifiés et supprimés
+# (le delta), que build_qa applique au corpus au lieu de tout régénérer.
+from __future__ import annotations
+import hashlib
+import json
+import os
+import time
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional
+
+
+def normalize_content(text) -> str:
+    return " ".join(str(text).split())
+
+
+def article_id(source, titre, contenu) -> str:
+    """
+    Empreinte de l'URL + du contenu normalisé (32 car. hexadécimaux). Le titre
+    en fait partie : les questions générées par build_qa en dépendent.
+    """
+    key = f"{source}\x00{normalize_content(titre)}\x00{normalize_content(contenu)}"
+    return hashlib.blake2b(key.encode("utf-8"), digest_size=16).hexdigest()
+
+
+class CrawlState:
+    """
+    Dernière version connue de chaque article, par URL, et numéro de
+    génération (incrémenté à chaque crawl). Fichier JSON écrit atomiquement.
+    """
+
+    def __init__(self, path: Path, generation: int = 0, articles: Optional[Dict[str, dict]] = None):
+        self.path = Path(path)
+        self.generation = generation
+        self.articles = articles or {}
+
+    @classmethod
+    def load(cls, path: Path) -> "CrawlState":
+        try:
+            with open(path, encoding="utf-8") as f:
+                data = json.load(f)
+        except FileNotFoundError:
+            return cls(path)
+        return cls(path, data["generation"], data["articles"])
+
+    def save(self):
+        tmp = self.path.with_name(self.path.name + ".tmp")
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump({"generation": self.generation, "articles": self.articles}, f, ensure_ascii=False)
+        os.replace(tmp, self.path)
+
+    def update(self, current: Iterable[dict]) -> dict:
+        """
+        Remplace l'état par les articles `current` ({"source","titre","contenu"},
+        "id" ajouté ici) et retourne le delta ; une URL absente de `current`
+        est supprimée.
+        """
+        previous = self.articles
+        articles: Dict[str, dict] = {}
+        for row in current:
+            row = dict(row, id=article_id(row["source"], row["titre"], row["contenu"]))
+            articles.setdefault(row["source"], row)
+
+        added: List[dict] = []
+        changed: List[dict] = []
+        for url, row in articles.items():
+            old = previous.get(url)
+            if old is None:
+                added.append(row)
+            elif old["id"] != row["id"]:
+                changed.append(dict(row, previous_id=old["id"]))
+        removed = [{"id": old["id"], "source": url} for url, old in previous.items() if url not in articles]
+
+        delta = {"from": self.generation, "to": self.generation + 1, "crawled_at": time.time(),
+                 "added": added, "changed": changed, "removed": removed}
+        self.generation += 1
+        self.articles = articles
+        return delta
+
+    def rows(self) -> List[dict]:
+        return list(self.articles.values())
+
+
+def write_delta(path: Path, delta: dict):
+    tmp = Path(path).with_name(Path(path).name + ".tmp")
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump(delta, f, ensure_ascii=False, indent=2)
+    os.replace(tmp, path)
+
+
+def read_delta(path: Path) -> Optional[dict]:
+    try:
+        with open(path, encoding="utf-8") as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return None
@@ -1,14 +1,29 @@
 from __future__ import annotations
 from pathlib import Path
-import pandas as pd, json, re, csv, io
+from concurrent.futures import ProcessPoolExecutor
+from itertools import chain
+import pandas as pd, numpy as np, json, re, csv, os, sys, hashlib
 
 BASE = Path(__file__).resolve().parents[1]
 DATA = BASE / "data"
 RAW  = DATA / "raw"
 OUT  = DATA / "faq.csv"
 
-Q_CAND = {"question","q","pattern","patterns","utterance","title","titre","heading","topic","subject","query","ask","prompt","intitule"}
-A_CAND = {"answer","a","response","reponse","content","texte","text","body","solution","steps","description","reply","details","paragraph","snippet","summary","note"}
+sys.path.insert(0, str(BASE.parent))  # racine du projet (import support_bot)
+from support_bot.profiling import profiled
+
+# Colonnes candidates, par ordre de priorité (tuples : l'ordre de parcours ne
+# dépend plus du hachage des chaînes quand plusieurs candidates existent)
+Q_ORDER = ("question","q","pattern","patterns","utterance","title","titre","heading","topic","subject","query","ask","prompt","intitule")
+A_ORDER = ("answer","a","response","reponse","content","texte","text","body","solution","steps","description","reply","details","paragraph","snippet","summary","note")
+TITLE_ORDER = ("title","titre","heading","topic","subject")
+CONTENT_ORDER = A_ORDER + ("content_html","html","markdown","md")
+Q_CAND = set(Q_ORDER)
+A_CAND = set(A_ORDER)
+
+_SCRIPT_RE = re.compile(r"<(script|style).*?</\\1>", re.S|re.I)
+_TAG_RE = re.compile(r"<[^>]+>")
+_WS_RE = re.compile(r"\s+")
 
 def strip_html(s:str)->str:
     s = re.sub(r"<(script|style).*?</\\1>", " ", str(s), flags=re.S|re.I)
@@ -24,43 +39,114 @@ def endq(q:str)->str:
     q = clean(q)
     return q if q.endswith("?") else q + " ?"
 
-def read_csv_aggr(p:Path)->pd.DataFrame:
-    encs = ["utf-8-sig","utf-8","cp1252","latin-1"]
-    for enc in encs:
-        try:
-            raw = p.read_bytes()
-            sample = raw[:8192].decode(enc, errors="ignore")
+def _clean_text(s:str)->str:
+    # même résultat que clean() pour une chaîne (str.split() et \s partagent la même
+    # définition des espaces Unicode) ; les regex HTML ne tournent que s'il y a un '<'
+    if "<" in s:
+        s = _TAG_RE.sub(" ", _SCRIPT_RE.sub(" ", s))
+    return " ".join(s.split())
+
+def _as_text(v)->str:
+    if isinstance(v, (list, tuple)) and len(v) == 0:
+        return ""  # liste vide = valeur absente (comme pd.notna([]))
+    return str(v)
+
+def clean_series(s:pd.Series)->np.ndarray:
+    """
+    clean() appliqué à une colonne entière ("" pour les valeurs absentes).
+    Chaque valeur distincte n'est nettoyée qu'une fois (factorize).
+    """
+    vals = s.to_numpy(dtype=object)
+    out = np.full(len(vals), "", dtype=object)
+    present = pd.notna(vals)
+    if present.any():
+        texts = [v if type(v) is str else _as_text(v) for v in vals[present]]
+        codes, uniques = pd.factorize(np.array(texts, dtype=object))
+        out[present] = np.array([_clean_text(u) for u in uniques], dtype=object)[codes]
+    return out
+
+def endq_array(q:np.ndarray)->np.ndarray:
+    """endq() sur des valeurs déjà nettoyées (clean() est idempotent)."""
+    return np.array([x if x.endswith("?") else x + " ?" for x in q], dtype=object)
+
+# ---- Lecture en flux ----
+# Les fichiers bruts sont lus par blocs de CHUNK_ROWS lignes : la mémoire reste
+# bornée quelle que soit la taille de l'export (CSV ou JSON de plusieurs Go).
+CHUNK_ROWS = 20_000
+ENCODINGS = ["utf-8-sig","utf-8","cp1252","latin-1"]
+
+def sniff_sep(sample:str)->str:
+    try:
+        return csv.Sniffer().sniff(sample, delimiters=";,|\t,").delimiter
+    except Exception:
+        return ";" if sample.count(";")>sample.count(",") else ( "|" if sample.count("|")>sample.count(",") else ("\t" if sample.count("\t")>0 else ",") )
+
+def iter_csv_frames(p:Path, enc:str):
+    """Blocs d'un CSV (moteur C, séparateur détecté sur les 8 premiers Ko)."""
+    with open(p, "rb") as f:
+        sample = f.read(8192).decode(enc, errors="ignore")
+    # dtype=str : le texte brut des cellules, indépendant du découpage en blocs
+    with pd.read_csv(p, encoding=enc, sep=sniff_sep(sample), engine="c", dtype=str, chunksize=CHUNK_ROWS) as reader:
+        yield from reader
+
+def iter_json_values(p:Path, enc:str):
+    """
+    Valeurs d'un fichier JSON sans charger tout le texte : éléments d'un tableau
+    (décodés un à un avec raw_decode), lignes JSONL, ou document unique.
+    """
+    dec = json.JSONDecoder()
+    with open(p, encoding=enc, errors="ignore") as f:
+        buf = f.read(1 << 16)
+        if not buf.lstrip().startswith("["):
+            f.seek(0)
+            lines = (l for l in f if l.strip())
+            first = next(lines, None)
+            if first is None: return
             try:
-                dialect = csv.Sniffer().sniff(sample, delimiters=";,|\t,")
-                sep = dialect.delimiter
-            except Exception:
-                sep = ";" if sample.count(";")>sample.count(",") else ( "|" if sample.count("|")>sample.count(",") else ("\t" if sample.count("\t")>0 else ",") )
-            df = pd.read_csv(io.BytesIO(raw), encoding=enc, sep=sep, engine="python")
-            if not df.empty: return df
-        except Exception:
-            continue
-    return pd.DataFrame()
+                yield json.loads(first)
+            except ValueError:
+                f.seek(0)
+                yield json.load(f)  # document unique sur plusieurs lignes (ex. intents.json)
+                return
+            for l in lines:
+                yield json.loads(l)
+            return
 
-def read_json_aggr(p:Path)->pd.DataFrame:
-    encs = ["utf-8-sig","utf-8","cp1252","latin-1"]
-    for enc in encs:
-        try:
-            txt = p.read_text(encoding=enc, errors="ignore")
+        pos, eof, step = buf.index("[") + 1, False, 1 << 16
+        while True:
+            while pos < len(buf) and (buf[pos].isspace() or buf[pos] == ","):
+                pos += 1
+            if pos < len(buf) and buf[pos] == "]":
+                if buf[pos+1:].strip() or any(b.strip() for b in iter(lambda: f.read(1 << 16), "")):
+                    raise ValueError(f"{p.name}: données après la fin du tableau")
+                return
             try:
-                obj = json.loads(txt)
-            except Exception:
-                obj = [json.loads(l) for l in txt.splitlines() if l.strip()]
-            return pd.json_normalize(obj, max_level=2)
-        except Exception:
-            continue
-    return pd.DataFrame()
+                value, end = dec.raw_decode(buf, pos)
+                if end < len(buf) or eof:  # un nombre coupé en fin de tampon n'est pas complet
+                    yield value
+                    pos, step = end, 1 << 16
+                    continue
+            except ValueError:
+                if eof: raise
+            # élément incomplet : on garde la fin du tampon et on lit la suite
+            more = f.read(step)
+            eof, step = not more, step * 2
+            buf, pos = buf[pos:] + more, 0
+            if eof and not buf.strip():
+                raise ValueError(f"{p.name}: tableau JSON non terminé")
 
-def first_nonempty(d:dict, keys:set[str])->str:
-    for k in keys:
-        if k in d and pd.notna(d[k]):
-            s = clean(d[k])
-            if s: return s
-    return ""
+def iter_json_frames(p:Path, enc:str):
+    """Blocs d'enregistrements JSON aplatis (json_normalize)."""
+    batch = []
+    for v in iter_json_values(p, enc):
+        batch.append(v)
+        # le dernier bloc n'a jamais une seule ligne, sauf si le fichier n'a
+        # qu'une valeur : le cas intents.json de harvest_df reste inchangé
+        if len(batch) == 2 * CHUNK_ROWS:
+            yield pd.json_normalize(batch[:CHUNK_ROWS], max_level=2)
+            del batch[:CHUNK_ROWS]
+    if batch:
+        yield pd.json_normalize(batch if len(batch) > 1 else batch[0], max_level=2)
 
 def as_list(x):
     if x is None: return []
@@ -87,84 +173,248 @@ def harvest_df(df:pd.DataFrame)->list[dict]:
                 if q and ans: pairs.append({"question": endq(q), "answer": ans})
         return pairs
 
-    for _, row in df.iterrows():
-        r = {k: row[k] for k in df.columns}
+    # Moisson colonne par colonne : le choix des colonnes candidates est résolu
+    # une fois, chaque colonne est nettoyée une seule fois, puis les règles de
+    # la boucle d'origine sont appliquées sous forme de masques.
+    df = df.loc[:, ~df.columns.duplicated()]
+    if all(pd.api.types.is_numeric_dtype(t) for t in df.dtypes):
+        # iterrows() ramenait chaque ligne au type commun (ex. 1 -> 1.0)
+        df = pd.DataFrame(df.to_numpy(), columns=df.columns)
+    cleaned = {}
 
-        # patterns = liste → plusieurs Q pour la même réponse
-        if isinstance(r.get("patterns"), (list, tuple)):
-            ans = first_nonempty(r, A_CAND)
-            for pat in r["patterns"]:
-                q = clean(pat)
-                if q and ans:
-                    pairs.append({"question": endq(q), "answer": clean(ans)})
-            if ans: continue
+    def first(keys)->np.ndarray:
+        """Première valeur non vide parmi les colonnes candidates (ligne à ligne)."""
+        out = np.full(len(df), "", dtype=object)
+        for k in keys:
+            if k not in df.columns: continue
+            if k not in cleaned: cleaned[k] = clean_series(df[k])
+            empty = out == ""
+            out[empty] = cleaned[k][empty]
+        return out
 
-        q = first_nonempty(r, Q_CAND)
-        a = first_nonempty(r, A_CAND)
+    q, a = first(Q_ORDER), first(A_ORDER)
+    title, content = first(TITLE_ORDER), first(CONTENT_ORDER)
 
-        if q and a:
-            pairs.append({"question": endq(q), "answer": clean(a)})
-            continue
+    # patterns = liste → plusieurs Q pour la même réponse
+    by_patterns = np.zeros(len(df), dtype=bool)
+    if "patterns" in df.columns:
+        patterns = df["patterns"].to_numpy(dtype=object)
+        by_patterns = np.fromiter((isinstance(v, (list, tuple)) for v in patterns), bool, len(df)) & (a != "")
 
-        title = first_nonempty(r, {"title","titre","heading","topic","subject"})
-        content = first_nonempty(r, A_CAND | {"content_html","html","markdown","md","texte","text"})
-        if title and content:
-            pairs.append({"question": endq(title), "answer": clean(content)})
-            continue
+    is_qa = ~by_patterns & (q != "") & (a != "")
+    is_title = ~by_patterns & ~is_qa & (title != "") & (content != "")
+    is_content = ~by_patterns & ~is_qa & ~is_title & (content != "")
+    question = np.where(is_qa, q, np.where(is_title, title, "Informations utiles"))
+    answer = np.where(is_qa, a, content)
+    keep = np.flatnonzero(is_qa | is_title | is_content)
+    rows, sub = keep, np.zeros(len(keep), dtype=np.int64)
+    question, answer = endq_array(question[keep]), answer[keep]
 
-        if content:
-            pairs.append({"question": endq("Informations utiles"), "answer": clean(content)})
+    if by_patterns.any():
+        # équivalent d'explode (qui changerait les None des listes en NaN)
+        lists = patterns[by_patterns]
+        sizes = np.fromiter(map(len, lists), np.int64, len(lists))
+        pat = clean_series(pd.Series([str(v) for v in chain.from_iterable(lists)], dtype=object))
+        ok = pat != ""
+        rows = np.concatenate([rows, np.repeat(np.flatnonzero(by_patterns), sizes)[ok]])
+        sub = np.concatenate([sub, (np.arange(sizes.sum()) - np.repeat(np.cumsum(sizes) - sizes, sizes))[ok]])
+        question = np.concatenate([question, endq_array(pat[ok])])
+        answer = np.concatenate([answer, np.repeat(a[by_patterns], sizes)[ok]])
+        order = np.lexsort((sub, rows))  # ordre des lignes, puis des patterns
+        question, answer = question[order], answer[order]
 
-    return pairs
+    return [{"question": qq, "answer": aa} for qq, aa in zip(question.tolist(), answer.tolist())]
 
-def main():
-    RAW.mkdir(parents=True, exist_ok=True)
-    all_pairs = []
+# ---- Build incrémental ----
+# manifest.json : fichier brut -> (taille, mtime, sha256 du contenu). Les paires
+# moissonnées sont mises en cache par empreinte de contenu (pairs/v<N>/<sha256>.jsonl) :
+# un fichier inchangé n'est ni relu ni re-parsé.
+CACHE = DATA / ".build_cache"
+MANIFEST = CACHE / "manifest.json"
+HARVEST_VERSION = 3  # à incrémenter si la logique de moisson change
+SEED_NAME = "faq_ifoad_support_large.csv"
 
-    # 1) prendre aussi faq_ifoad_support_large.csv comme source
-    seed = DATA / "raw" / "faq_ifoad_support_large.csv"
-    if seed.exists():
+def file_sha256(p:Path)->str:
+    h = hashlib.sha256()
+    with open(p, "rb") as f:
+        for chunk in iter(lambda: f.read(1 << 20), b""):
+            h.update(chunk)
+    return h.hexdigest()
+
+def iter_frames(p:Path, enc:str):
+    return iter_csv_frames(p, enc) if p.suffix.lower()==".csv" else iter_json_frames(p, enc)
+
+def harvest_frames(frames, seed:bool=False):
+    """Paires moissonnées bloc par bloc (générateur)."""
+    for df in frames:
+        if seed:
+            # faq_ifoad_support_large.csv : colonnes question/answer reprises telles quelles
+            if not set(["question","answer"]).issubset(df.columns): return
+            for q, a in zip(df["question"], df["answer"]):
+                yield {"question": "nan" if pd.isna(q) else str(q), "answer": "nan" if pd.isna(a) else str(a)}
+        elif not df.empty:
+            yield from harvest_df(df)
+
+def harvest_file(p:Path, out:Path, seed:bool=False)->int:
+    """
+    Moissonne un fichier brut en flux vers le cache de paires `out` (exécuté dans
+    le pool de processus) et retourne le nombre de paires. Un fichier illisible
+    dans tous les encodages ne produit aucune paire.
+    """
+    for enc in ENCODINGS:
         try:
-            df = read_csv_aggr(seed)
-            if not df.empty and set(["question","answer"]).issubset(df.columns):
-                print(f"→ seed: {len(df)}")
-                all_pairs.extend(df[["question","answer"]].to_dict("records"))
+            n = write_pairs(out, harvest_frames(iter_frames(p, enc), seed))
         except Exception:
-            pass
+            continue
+        if n: return n
+    return write_pairs(out, [])
+
+def load_manifest()->dict:
+    try:
+        m = json.loads(MANIFEST.read_text(encoding="utf-8"))
+        if m.get("version") == HARVEST_VERSION:
+            return m
+    except Exception:
+        pass
+    return {"version": HARVEST_VERSION, "files": {}, "counts": {}}
+
+def save_manifest(m:dict):
+    CACHE.mkdir(parents=True, exist_ok=True)
+    tmp = MANIFEST.with_suffix(".tmp")
+    tmp.write_text(json.dumps(m, ensure_ascii=False, indent=1), encoding="utf-8")
+    os.replace(tmp, MANIFEST)
 
-    # 2) moissonner tout le répertoire raw/
+def pairs_path(cache_id:str)->Path:
+    return CACHE / "pairs" / f"v{HARVEST_VERSION}" / f"{cache_id}.jsonl"
+
+def write_pairs(out:Path, pairs)->int:
+    """Écrit les paires (itérable consommé en flux) ; le fichier n'apparaît que complet."""
+    out.parent.mkdir(parents=True, exist_ok=True)
+    tmp = out.with_suffix(".tmp")
+    n = 0
+    try:
+        with open(tmp, "w", encoding="utf-8") as f:
+            for pr in pairs:
+                f.write(json.dumps(pr, ensure_ascii=False) + "\n")
+                n += 1
+    except BaseException:
+        tmp.unlink(missing_ok=True)
+        raise
+    os.replace(tmp, out)
+    return n
+
+def iter_pairs(cache_id:str):
+    with open(pairs_path(cache_id), encoding="utf-8") as f:
+        for line in f:
+            yield json.loads(line)
+
+def source_files()->list[tuple[Path,bool]]:
+    """(fichier, est_seed) dans l'ordre de moisson : seed d'abord, puis raw/."""
+    files = []
+    seed = RAW / SEED_NAME
+    if seed.exists():
+        files.append((seed, True))
     for p in RAW.glob("**/*"):
-        if p.name == "faq_ifoad_support_large.csv": 
+        if p.name == SEED_NAME:
             continue
-        if p.suffix.lower()==".csv":
-            df = read_csv_aggr(p)
-        elif p.suffix.lower()==".json":
-            df = read_json_aggr(p)
+        if p.is_file() and p.suffix.lower() in (".csv", ".json"):
+            files.append((p, False))
+    return files
+
+def resolve(files, manifest:dict, workers:int|None=None)->list[tuple[Path,str,bool]]:
+    """
+    Retourne (fichier, id de cache, depuis_cache) pour chaque source.
+    L'id de cache est le sha256 du contenu (+ mode seed) : seuls les contenus
+    jamais vus sont moissonnés, en parallèle (pool de processus).
+    """
+    known, counts = manifest["files"], manifest["counts"]
+    sources, todo = [], {}
+    for p, seed in files:
+        key = str(p.relative_to(RAW))
+        st = p.stat()
+        entry = known.get(key)
+        if entry and entry["size"] == st.st_size and entry["mtime_ns"] == st.st_mtime_ns:
+            sha = entry["sha256"]  # (taille, mtime) inchangés : pas besoin de relire le fichier
         else:
-            continue
+            sha = file_sha256(p)
+        known[key] = {"sha256": sha, "size": st.st_size, "mtime_ns": st.st_mtime_ns}
+        cache_id = sha + ("-seed" if seed else "")
+        cached = cache_id in counts and pairs_path(cache_id).exists()
+        if not cached:
+            todo[cache_id] = (p, seed)
+        sources.append((p, cache_id, cached))
+
+    if todo:
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            futures = {cache_id: pool.submit(harvest_file, p, pairs_path(cache_id), seed)
+                       for cache_id, (p, seed) in todo.items()}
+            for cache_id, fut in futures.items():
+                counts[cache_id] = fut.result()
+
+    # oublier les fichiers supprimés de raw/ et les paires qui ne servent plus
+    live_files = {str(p.relative_to(RAW)) for p, _ in files}
+    live_ids = {cache_id for _, cache_id, _ in sources}
+    for key in set(known) - live_files:
+        del known[key]
+    for cache_id in set(counts) - live_ids:
+        del counts[cache_id]
+        pairs_path(cache_id).unlink(missing_ok=True)
+    return sources
 
-        if df is None or df.empty:
-            print(f"→ {p.name}: 0")
+def cleaned(pairs):
+    """Nettoyage + filtre de longueur (générateur)."""
+    for pr in pairs:
+        q, a = clean(pr["question"]), clean(pr["answer"])
+        if len(q) > 5 and len(a) > 10:
+            yield q, a
+
+def dedup(pairs):
+    """
+    Première occurrence de chaque question normalisée. Seule une empreinte de
+    16 octets par question est gardée en mémoire, pas le texte.
+    """
+    seen = set()
+    for q, a in pairs:
+        key = hashlib.blake2b(re.sub(r"\s+", " ", q.lower()).strip().encode("utf-8"), digest_size=16).digest()
+        if key in seen:
             continue
-        pairs = harvest_df(df)
-        print(f"→ {p.name}: {len(pairs)}")
-        all_pairs.extend(pairs)
+        seen.add(key)
+        yield q, a
 
-    if not all_pairs:
-        print("⚠️ Aucun contenu exploitable.")
-        return
+def merge(sources, out:Path)->int:
+    """Fusion, nettoyage et dédoublonnage en flux (aucune table complète en mémoire)."""
+    pairs = chain.from_iterable(iter_pairs(cache_id) for _, cache_id, _ in sources)
+    n = 0
+    out.parent.mkdir(parents=True, exist_ok=True)
+    tmp = out.with_suffix(".tmp")
+    with open(tmp, "w", encoding="utf-8", newline="") as f:
+        w = csv.writer(f, lineterminator=os.linesep)
+        w.writerow(["question", "answer"])
+        for q, a in dedup(cleaned(pairs)):
+            w.writerow([q, a])
+            n += 1
+    os.replace(tmp, out)
+    return n
+
+@profiled("build_faq", rate=1.0)
+def main(workers:int|None=None):
+    RAW.mkdir(parents=True, exist_ok=True)
+    manifest = load_manifest()
 
-    faq = pd.DataFrame(all_pairs)
-    faq["question"] = faq["question"].map(clean)
-    faq["answer"]   = faq["answer"].map(clean)
-    faq = faq[(faq["question"].str.len()>5) & (faq["answer"].str.len()>10)]
+    # 1) seed + 2) tout le répertoire raw/ (seuls les fichiers modifiés sont relus)
+    sources = resolve(source_files(), manifest, workers)
+    counts = manifest["counts"]
+    for p, cache_id, cached in sources:
+        label = "seed" if p.name == SEED_NAME else p.name
+        print(f"→ {label}: {counts[cache_id]}" + (" (cache)" if cached else ""))
+    save_manifest(manifest)
 
-    faq["q_norm"] = faq["question"].str.lower().str.replace(r"\s+"," ",regex=True).str.strip()
-    faq = faq.drop_duplicates(subset=["q_norm"]).drop(columns=["q_norm"])
+    if not any(counts[cache_id] for _, cache_id, _ in sources):
+        print("⚠️ Aucun contenu exploitable.")
+        return
 
-    OUT.parent.mkdir(parents=True, exist_ok=True)
-    faq.to_csv(OUT, index=False, encoding="utf-8")
-    print(f"✅ FAQ générée: {OUT} — {len(faq)} lignes")
+    n = merge(sources, OUT)
+    print(f"✅ FAQ générée: {OUT} — {n} lignes")
 
 if __name__ == "__main__":
     main()
@@ -1,18 +1,20 @@
-import os, re, uuid, pandas as pd
+import os, sys, re, csv, json, uuid, hashlib, pandas as pd
+from itertools import chain
 
 BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
 DATA_DIR = os.path.join(BASE_DIR, "data")
 RAW = os.path.join(DATA_DIR, "support_dataset_raw.csv")
+DELTA = os.path.join(DATA_DIR, "support_dataset_delta.json")  # écrit par merge_datasets.py
 OUT = os.path.join(DATA_DIR, "qa_corpus.csv")
+OUT_META = os.path.join(DATA_DIR, "qa_corpus.meta.json")  # génération de crawl reflétée par OUT
+KB_DELTA = os.path.join(DATA_DIR, "qa_corpus.kb_delta.json")  # lignes retirées/ajoutées, appliquées à chaud par chatbot_engine
+CHUNK_ROWS = 20_000  # lecture par blocs : mémoire bornée quelle que soit la taille de l'export
+FIELDS = ["id","question","answer","intent","tags","source","lang","article_id"]
 
-INTENT_RULES = [
-  ("wifi|réseau|internet|wlan", "wifi"),
-  ("imprimante|print", "imprimante"),
-  ("mise.?à.?jour|windows update|update", "windows"),
-  ("installer|installation|setup|msi|exe", "installation_logiciel"),
-  ("navigateur|firefox|chrome|edge", "navigateur"),
-  ("antivirus|sécurité|protection", "securite"),
-]
+sys.path.insert(0, os.path.dirname(BASE_DIR))  # racine du projet (import support_bot)
+from support_bot.intents import guess_intent  # règles INTENT_RULES partagées avec le routeur du chatbot
+from support_bot.profiling import profiled
+from support_bot.scraping.state import article_id, read_delta
 
 TEMPLATES = [
   "Comment {base} ?",
@@ -26,12 +28,6 @@ TEMPLATES = [
   "Je n’arrive pas à {base}, que faire ?",
 ]
 
-def guess_intent(text):
-  low=text.lower()
-  for pat, intent in INTENT_RULES:
-    if re.search(pat, low): return intent
-  return "depannage_pc"
-
 def base_from_title(title):
   t = re.sub(r"^\s*(\[.*?\]\s*)", "", str(title)).strip()
   t = re.sub(r"\s+", " ", t)
@@ -39,42 +35,132 @@ def base_from_title(title):
   t = re.sub(r"^(résoudre|réparer|dépanner)\s+les?\s+probl(è|e)mes?\s+de\s+", "", t, flags=re.I)
   return t
 
-def run():
-  raw = pd.read_csv(RAW)
-  rows=[]
-  for _, r in raw.iterrows():
-    base = base_from_title(r["titre"])
-    intent = guess_intent(str(r["titre"])+" "+str(r["contenu"]))
-    answer = str(r["contenu"]).strip()
-    source = r["source"]
+def iter_raw(path):
+  """(article_id, titre, contenu, source) ligne par ligne, lus par blocs de CHUNK_ROWS."""
+  with pd.read_csv(path, dtype=str, chunksize=CHUNK_ROWS) as reader:
+    for chunk in reader:
+      if "id" not in chunk.columns:  # export antérieur aux ids d'articles
+        chunk["id"] = None
+      for aid, titre, contenu, source in chunk[["id","titre","contenu","source"]].itertuples(index=False, name=None):
+        source = source if isinstance(source, str) else ""
+        yield (aid if isinstance(aid, str) else article_id(source, titre, contenu)), titre, contenu, source
+
+def row_id(aid, question):
+  """Id stable d'une ligne Q/A : même article + même question → même id."""
+  return str(uuid.UUID(bytes=hashlib.blake2b(f"{aid}\x00{question}".encode("utf-8"), digest_size=16).digest()))
+
+def qa_rows(records):
+  for aid, titre, contenu, source in records:
+    base = base_from_title(titre)
+    intent = guess_intent(str(titre)+" "+str(contenu))
+    answer = str(contenu).strip()
     tags = intent
 
-    # variations
-    for tpl in TEMPLATES:
-      q = tpl.format(base=base)
-      rows.append({
-        "id": str(uuid.uuid4()),
+    # variations + question brute
+    for q in [tpl.format(base=base) for tpl in TEMPLATES] + [base + " ?"]:
+      yield {
+        "id": row_id(aid, q),
         "question": q,
         "answer": answer,
         "intent": intent,
         "tags": tags,
         "source": source,
-        "lang": "fr"
-      })
-    # question brute
-    rows.append({
-      "id": str(uuid.uuid4()),
-      "question": base + " ?",
-      "answer": answer,
-      "intent": intent,
-      "tags": tags,
-      "source": source,
-      "lang": "fr"
-    })
-
-  df = pd.DataFrame(rows).drop_duplicates(subset=["question","answer"])
-  df.to_csv(OUT, index=False)
-  print(f"✅ Corpus Q/A: {len(df)} lignes → {OUT}")
+        "lang": "fr",
+        "article_id": aid
+      }
+
+def dedup(rows):
+  """Première occurrence de chaque (question, réponse) ; seule une empreinte de 16 octets est gardée."""
+  seen = set()
+  for r in rows:
+    key = hashlib.blake2b((r["question"]+"\x00"+r["answer"]).encode("utf-8"), digest_size=16).digest()
+    if key in seen: continue
+    seen.add(key)
+    yield r
+
+def iter_corpus(path):
+  """Lignes du corpus existant, telles qu'écrites (chaînes, vides compris)."""
+  with pd.read_csv(path, dtype=str, keep_default_na=False, chunksize=CHUNK_ROWS) as reader:
+    for chunk in reader:
+      yield from chunk[FIELDS].to_dict("records")
+
+def apply_delta(corpus, delta, changes=None):
+  """
+  Corpus existant sans les articles supprimés/modifiés, puis les lignes des articles ajoutés/modifiés.
+  changes (dict "remove"/"add") reçoit au passage les questions retirées et les paires (question, réponse)
+  ajoutées : le delta de lignes que chatbot_engine.apply_corpus_delta applique à la base servie.
+  """
+  drop = {a["id"] for a in delta["removed"]} | {a["previous_id"] for a in delta["changed"]}
+  new_ids = {a["id"] for a in delta["added"] + delta["changed"]}
+
+  def kept():
+    for r in corpus:
+      if r["article_id"] not in drop:
+        yield r
+      elif changes is not None:
+        changes["remove"].append(r["question"])
+
+  def recorded(rows):
+    for r in rows:
+      if changes is not None and r["article_id"] in new_ids:
+        changes["add"].append([r["question"], r["answer"]])
+      yield r
+
+  new = qa_rows((a["id"], a["titre"], a["contenu"], a["source"]) for a in delta["added"] + delta["changed"])
+  return recorded(dedup(chain(kept(), new)))
+
+def write_kb_delta(delta, changes):
+  """Delta de lignes de la génération delta["from"] -> delta["to"] (écriture atomique)."""
+  tmp = KB_DELTA + ".tmp"
+  with open(tmp, "w", encoding="utf-8") as f:
+    json.dump({"from": delta["from"], "to": delta["to"], **changes}, f, ensure_ascii=False)
+  os.replace(tmp, KB_DELTA)
+
+def corpus_generation():
+  """Génération de crawl du corpus courant (None si inconnue ou corpus sans article_id)."""
+  try:
+    with open(OUT, encoding="utf-8", newline="") as f:
+      if next(csv.reader(f), []) != FIELDS:
+        return None
+    with open(OUT_META, encoding="utf-8") as f:
+      return json.load(f).get("generation")
+  except (OSError, ValueError):
+    return None
+
+def write_corpus(rows):
+  n = 0
+  tmp = OUT + ".tmp"
+  with open(tmp, "w", encoding="utf-8", newline="") as f:
+    w = csv.DictWriter(f, fieldnames=FIELDS, lineterminator=os.linesep)
+    w.writeheader()
+    for r in rows:
+      w.writerow(r)
+      n += 1
+  os.replace(tmp, OUT)
+  return n
+
+@profiled("build_qa", rate=1.0)
+def run(full=False):
+  delta = read_delta(DELTA)
+  generation = corpus_generation()
+  if not full and delta and generation == delta["to"]:
+    print(f"✅ Corpus Q/A déjà à jour (génération {generation}) : {OUT}")
+    return
+  if not full and delta and generation == delta["from"]:
+    # le corpus reflète le crawl précédent : seul le delta est appliqué
+    changes = {"remove": [], "add": []}
+    n = write_corpus(apply_delta(iter_corpus(OUT), delta, changes))
+    write_kb_delta(delta, changes)
+    mode = (f"delta +{len(delta['added'])} ~{len(delta['changed'])} -{len(delta['removed'])} articles, "
+            f"{len(changes['remove'])} questions retirées / {len(changes['add'])} ajoutées → {KB_DELTA}")
+  else:
+    n = write_corpus(dedup(qa_rows(iter_raw(RAW))))
+    mode = "reconstruction complète"
+    if os.path.exists(KB_DELTA):
+      os.remove(KB_DELTA)  # plus de delta de lignes : la base servie se recompile depuis faq.csv
+  with open(OUT_META, "w", encoding="utf-8") as f:
+    json.dump({"generation": delta["to"] if delta else None}, f)
+  print(f"✅ Corpus Q/A ({mode}): {n} lignes → {OUT}")
 
 if __name__ == "__main__":
-  run()
+  run(full="--full" in sys.argv[1:])
@@ -1,11 +1,17 @@
-import os, time, requests, pandas as pd
-from bs4 import BeautifulSoup
+import os, sys, pandas as pd
 
 BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
 DATA_DIR = os.path.join(BASE_DIR, "data")
 os.makedirs(DATA_DIR, exist_ok=True)
 
-HEADERS = {"User-Agent": "Mozilla/5.0"}
+sys.path.insert(0, os.path.dirname(BASE_DIR))  # racine du projet (import support_bot)
+from support_bot.scraping import Fetcher, FetchError
+from support_bot.scraping.extract import extract_article
+from support_bot.scraping.state import CrawlState, write_delta
+
+STATE = os.path.join(DATA_DIR, "crawl_state.json")
+DELTA = os.path.join(DATA_DIR, "support_dataset_delta.json")
+GONE = {404, 410}  # page retirée ; toute autre erreur garde la version précédente
 
 MS_URLS = [
   "https://support.microsoft.com/fr-fr/windows/r%C3%A9soudre-les-probl%C3%A8mes-de-connexion-wi-fi-dans-windows-9424a1f7-6a3b-65a6-4d78-7f07eee84d2c",
@@ -20,45 +26,55 @@ VENDOR_URLS = [
   ("mozilla","https://support.mozilla.org/fr/kb/resoudre-les-problemes-de-connexion"),
 ]
 
-def scrape_generic(url):
+def parse_generic(url, html):
+  return extract_article(html, url, title_tags=("h1","h2"), min_len=40)
+
+def scrape_generic(url, fetcher=None):
+  if fetcher is None:
+    with Fetcher(timeout=25) as fetcher:
+      return scrape_generic(url, fetcher)
   try:
-    r = requests.get(url, headers=HEADERS, timeout=25)
-    r.raise_for_status()
-    soup = BeautifulSoup(r.text, "html.parser")
-    title = soup.find(["h1","h2"])
-    blocks = soup.select("h2, h3, p, li")
-    buf=[]
-    for b in blocks:
-      t = " ".join(b.get_text(" ", strip=True).split())
-      if len(t) >= 40:
-        buf.append(t)
-    if title and buf:
-      return {"source": url, "titre": title.get_text(strip=True), "contenu": "\n".join(buf)}
-  except Exception:
+    return parse_generic(url, fetcher.get(url).text)
+  except FetchError:
     return None
-  return None
 
-def run():
+def run(fetcher=None):
+  if fetcher is None:
+    with Fetcher(timeout=25, per_host_interval=1.0) as fetcher:
+      return run(fetcher)
+  state = CrawlState.load(STATE)
+  sources = [(None, url) for url in MS_URLS] + VENDOR_URLS
+  # toutes les pages en parallèle ; la limite par hôte remplace les time.sleep
+  # (une page inchangée revient en 304 depuis le cache HTTP)
+  results = fetcher.fetch_all([url for _, url in sources], return_exceptions=True)
   rows=[]
-  for url in MS_URLS:
-    item = scrape_generic(url)
-    if item: rows.append(item)
-    time.sleep(1.0)
-
-  for vendor, url in VENDOR_URLS:
-    item = scrape_generic(url)
-    if item:
+  for (vendor, url), res in zip(sources, results):
+    if isinstance(res, FetchError):
+      # échec temporaire : l'article reste tel quel au lieu d'être supprimé
+      if res.status not in GONE and url in state.articles:
+        old = state.articles[url]
+        rows.append({"source": url, "titre": old["titre"], "contenu": old["contenu"]})
+      continue
+    item = parse_generic(url, res.text)
+    if not item:
+      continue
+    if vendor:
       item["titre"] = f"[{vendor.upper()}] {item['titre']}"
-      rows.append(item)
-    time.sleep(1.0)
+    rows.append(item)
 
-  df = pd.DataFrame(rows).drop_duplicates(subset=["source","titre","contenu"])
+  df = pd.DataFrame(rows, columns=["source","titre","contenu"]).drop_duplicates(subset=["source","titre","contenu"])
   df = df[df["contenu"].str.len() > 60]
+  delta = state.update(df.to_dict("records"))
+  df = pd.DataFrame(state.rows(), columns=["id","source","titre","contenu"])
   out_csv = os.path.join(DATA_DIR, "support_dataset_raw.csv")
   out_json = os.path.join(DATA_DIR, "support_dataset_raw.json")
   df.to_csv(out_csv, index=False)
   df.to_json(out_json, orient="records", force_ascii=False, indent=2)
+  write_delta(DELTA, delta)
+  state.save()
   print(f"✅ Fusion: {len(df)} lignes → {out_csv}")
+  print(f"   Delta (génération {delta['to']}): +{len(delta['added'])} ~{len(delta['changed'])} "
+        f"-{len(delta['removed'])} → {DELTA}")
 
 if __name__ == "__main__":
   run()
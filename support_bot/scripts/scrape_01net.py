@@ -1,13 +1,18 @@
-import requests
-from bs4 import BeautifulSoup
-def scrape_01net_wifi():
-    url = "https://www.01net.com/telecharger/utilitaire/reseau/wifi-manager.html"
-    response = requests.get(url)
-    soup = BeautifulSoup(response.text, 'html.parser')
-
-    data = []
-    titre = soup.select_one('h1')
-    description = soup.select_one('.description')
-    if titre and description:
-        data.append({'source': '01net', 'titre': titre.text.strip(), 'contenu': description.text.strip()})
-    return data
+import os, sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))  # racine du projet (import support_bot)
+from support_bot.scraping import Fetcher, FetchError
+from support_bot.scraping.extract import extract_items
+
+URL = "https://www.01net.com/telecharger/utilitaire/reseau/wifi-manager.html"
+
+
+def scrape_01net_wifi(fetcher=None):
+    if fetcher is None:
+        with Fetcher() as fetcher:
+            return scrape_01net_wifi(fetcher)
+    try:
+        html = fetcher.get(URL).text
+    except FetchError:
+        return []
+    return extract_items(html, '01net', title_sel='h1', body_sel='.description')
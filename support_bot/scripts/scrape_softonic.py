@@ -1,17 +1,19 @@
-import requests
-from bs4 import BeautifulSoup
+import os, sys
 
-def scrape_softonic_wifi():
-    #url = "https://fr.softonic.com/telechargements/pilote-wifi"
-    url = "https://support.microsoft.com/fr-fr"
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))  # racine du projet (import support_bot)
+from support_bot.scraping import Fetcher, FetchError
+from support_bot.scraping.extract import extract_items
 
-    response = requests.get(url)
-    soup = BeautifulSoup(response.text, 'html.parser')
+#URL = "https://fr.softonic.com/telechargements/pilote-wifi"
+URL = "https://support.microsoft.com/fr-fr"
 
-    data = []
-    for item in soup.select('.sc-1v6ydtz-0'):
-        titre = item.select_one('h3')
-        description = item.select_one('p')
-        if titre and description:
-            data.append({'source': 'Softonic', 'titre': titre.text.strip(), 'contenu': description.text.strip()})
-    return data
+
+def scrape_softonic_wifi(fetcher=None):
+    if fetcher is None:
+        with Fetcher() as fetcher:
+            return scrape_softonic_wifi(fetcher)
+    try:
+        html = fetcher.get(URL).text
+    except FetchError:
+        return []
+    return extract_items(html, 'Softonic', title_sel='h3', body_sel='p', item_sel='.sc-1v6ydtz-0')
@@ -1,7 +1,9 @@
-import requests, time
-from bs4 import BeautifulSoup
+import os, sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))  # racine du projet (import support_bot)
+from support_bot.scraping import Fetcher, FetchError
+from support_bot.scraping.extract import extract_article
 
-HEADERS={"User-Agent":"Mozilla/5.0"}
 VENDOR_URLS = [
   ("lenovo","https://support.lenovo.com/fr/fr/solutions/ht502846-windows-10-wifi-troubleshooting"),
   ("hp","https://support.hp.com/fr-fr/help/diagnostics/wireless-network-and-internet"),
@@ -10,23 +12,18 @@ VENDOR_URLS = [
   ("ubuntu","https://help.ubuntu.com/stable/ubuntu-help/net-wireless-troubleshooting.html.fr") # si FR dispo
 ]
 
-def scrape_vendor_docs():
+def scrape_vendor_docs(fetcher=None):
+  if fetcher is None:
+    with Fetcher(per_host_interval=1.0) as fetcher:
+      return scrape_vendor_docs(fetcher)
   rows=[]
-  for vendor, url in VENDOR_URLS:
-    try:
-      r=requests.get(url, headers=HEADERS, timeout=20)
-      r.raise_for_status()
-      soup=BeautifulSoup(r.text,"html.parser")
-      title=soup.find(["h1","h2"])
-      parts = soup.select("h2, h3, p, li")
-      buf=[]
-      for p in parts:
-        tx=p.get_text(" ", strip=True)
-        if len(tx) >= 50:
-          buf.append(tx)
-      if title and buf:
-        rows.append({"source": url, "titre": f"[{vendor.upper()}] {title.get_text(strip=True)}", "contenu":"\n".join(buf)})
-      time.sleep(1.0)
-    except Exception:
+  # un hôte par constructeur : toutes les pages partent en même temps
+  results = fetcher.fetch_all([url for _, url in VENDOR_URLS], return_exceptions=True)
+  for (vendor, url), res in zip(VENDOR_URLS, results):
+    if isinstance(res, FetchError):
       continue
+    item = extract_article(res.text, url, title_tags=("h1","h2"), min_len=50, collapse_ws=False)
+    if item:
+      item["titre"] = f"[{vendor.upper()}] {item['titre']}"
+      rows.append(item)
   return rows
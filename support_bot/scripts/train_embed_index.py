@@ -1,32 +1,101 @@
-import os, numpy as np, pandas as pd, faiss
+import os, sys, json, numpy as np, pandas as pd, faiss
 from tqdm import tqdm
 from sentence_transformers import SentenceTransformer
 
 BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
 DATA_DIR = os.path.join(BASE_DIR, "data")
+MODELS_DIR = os.path.join(BASE_DIR, "models")
 CORPUS = os.path.join(DATA_DIR, "qa_corpus.csv")
 ROWS = os.path.join(DATA_DIR, "qa_rows.parquet")
 INDEX = os.path.join(DATA_DIR, "faiss.index")
+QA_EMB = os.path.join(DATA_DIR, "qa_embeddings.npy")  # aligné ligne à ligne sur ROWS
+FAQ = os.path.join(DATA_DIR, "faq.csv")
+FAQ_EMB = os.path.join(MODELS_DIR, "faq_embeddings.npy")
+FAQ_INDEX = os.path.join(MODELS_DIR, "faq.index")
 MODEL_NAME = "sentence-transformers/paraphrase-multilingual-MiniLM-L12-v2"  # FR OK
 
+sys.path.insert(0, os.path.dirname(BASE_DIR))  # racine du projet (import support_bot)
+from support_bot.profiling import profiled
+
+def previous_embeddings():
+  """(id de ligne → rang, embeddings) du dernier run() avec le même modèle, sinon None."""
+  try:
+    with open(os.path.splitext(QA_EMB)[0] + ".json", encoding="utf-8") as f:
+      if json.load(f).get("model") != MODEL_NAME:
+        return None
+    ids = pd.read_parquet(ROWS, columns=["id"])["id"].astype(str).tolist()
+    emb = np.load(QA_EMB, mmap_mode="r")
+  except (OSError, ValueError, KeyError):
+    return None
+  if len(ids) != emb.shape[0]:
+    return None
+  return {i: k for k, i in enumerate(ids)}, emb
+
+@profiled("train_embed_index", rate=1.0)
 def run():
   df = pd.read_csv(CORPUS)
-  model = SentenceTransformer(MODEL_NAME)
   qs = df["question"].tolist()
 
+  # ids stables (build_qa) : une ligne déjà encodée au run précédent garde
+  # son embedding, seules les lignes ajoutées ou modifiées passent dans le modèle
+  prev = previous_embeddings() if "id" in df.columns else None
+  ids = df["id"].astype(str).tolist() if prev else []
+  reuse = [prev[0].get(i, -1) for i in ids] if prev else [-1] * len(df)
+  todo = [k for k, j in enumerate(reuse) if j < 0]
+  done = [k for k, j in enumerate(reuse) if j >= 0]
+
   # embeddings normalisés → cosine = dot product
-  print("🔎 Encodage des questions…")
-  emb = model.encode(qs, batch_size=64, normalize_embeddings=True, show_progress_bar=True)
-  emb = emb.astype("float32")
+  print(f"🔎 Encodage de {len(todo)} questions ({len(done)} reprises du run précédent)…")
+  if todo:
+    model = SentenceTransformer(MODEL_NAME)
+    new = model.encode([qs[k] for k in todo], batch_size=64, normalize_embeddings=True, show_progress_bar=True)
+    d = new.shape[1]
+  else:
+    d = prev[1].shape[1]
+  emb = np.empty((len(df), d), dtype="float32")
+  if todo:
+    emb[todo] = new
+  if done:
+    emb[done] = prev[1][[reuse[k] for k in done]]
 
   # sauvegardes
   df.to_parquet(ROWS, index=False)
-  d = emb.shape[1]
+  with open(QA_EMB + ".tmp", "wb") as f:  # l'ancien fichier est encore mappé (prev)
+    np.save(f, emb)
+  os.replace(QA_EMB + ".tmp", QA_EMB)
+  with open(os.path.splitext(QA_EMB)[0] + ".json", "w", encoding="utf-8") as f:
+    json.dump({"model": MODEL_NAME, "n": int(emb.shape[0]), "dim": int(d)}, f, indent=2)
   index = faiss.IndexFlatIP(d)
   index.add(emb)
   faiss.write_index(index, INDEX)
   print(f"✅ FAISS index: {index.ntotal} vectors → {INDEX}")
   print(f"✅ Lignes: {len(df)} → {ROWS}")
 
+@profiled("train_embed_index_faq", rate=1.0)
+def run_faq():
+  # embeddings alignés ligne à ligne sur les questions de l'artefact kb.bin
+  # (moteur "dense" de chatbot_engine) : même nettoyage que build_kb
+  from pathlib import Path
+  from support_bot.kb_artifact import file_sha256, load_faq_frame
+
+  df = load_faq_frame(Path(FAQ))
+  model = SentenceTransformer(MODEL_NAME)
+  print("🔎 Encodage des questions FAQ…")
+  emb = model.encode(df["question"].tolist(), batch_size=64, normalize_embeddings=True, show_progress_bar=True)
+  emb = np.ascontiguousarray(emb, dtype="float32")
+
+  os.makedirs(MODELS_DIR, exist_ok=True)
+  np.save(FAQ_EMB, emb)
+  index = faiss.IndexFlatIP(emb.shape[1])
+  index.add(emb)
+  faiss.write_index(index, FAQ_INDEX)
+  meta = {"source_sha256": file_sha256(Path(FAQ)), "model": MODEL_NAME, "n": int(emb.shape[0]), "dim": int(emb.shape[1])}
+  with open(os.path.splitext(FAQ_EMB)[0] + ".json", "w", encoding="utf-8") as f:
+    json.dump(meta, f, indent=2)
+  print(f"✅ Embeddings FAQ: {emb.shape[0]} x {emb.shape[1]} → {FAQ_EMB}")
+
 if __name__ == "__main__":
-  run()
+  if len(sys.argv) > 1 and sys.argv[1] == "faq":
+    run_faq()
+  else:
+    run()
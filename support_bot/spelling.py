@@ -0,0 +1,176 @@
+# support_bot/spelling.py
+# Correction orthographique des questions, avant la recherche.
+#
+# Index « symmetric delete » (SymSpell) construit au chargement depuis le
+# vocabulaire de kb.bin : pour chaque terme, toutes les formes obtenues en
+# retirant jusqu'à MAX_DISTANCE caractères (sur ses PREFIX_LENGTH premiers
+# caractères, sans accents) pointent vers lui. Un mot inconnu génère ses
+# propres suppressions ; les termes rencontrés sont vérifiés par distance
+# d'édition (transpositions comprises) et le plus proche, puis le plus
+# fréquent, le remplace : "imprimente" -> "imprimante", "ordinatuer" ->
+# "ordinateur", "reseau" -> "réseau". Seuls les mots absents du vocabulaire
+# sont corrigés, et seulement vers un terme d'au moins min_frequency
+# questions : sur une base de quelques centaines de termes, une distance 2
+# ou des mots courts réécrivent des mots ordinaires ("demain" -> "email",
+# "soir" -> "noir").
+from __future__ import annotations
+from typing import Dict, Iterable, List, Mapping, Optional, Tuple
+
+import numpy as np
+
+from . import metrics
+from .analyzer import fold_accents
+
+_CACHE_MAX = 50_000  # corrections gardées en cache (vidé au-delà)
+
+
+def _deletes(word: str, max_distance: int) -> set:
+    """word et toutes ses formes à 1..max_distance caractères retirés."""
+    out = {word}
+    frontier = {word}
+    for _ in range(max_distance):
+        frontier = {w[:i] + w[i + 1:] for w in frontier if len(w) > 1 for i in range(len(w))}
+        out |= frontier
+    return out
+
+
+def edit_distance(a: str, b: str, limit: int) -> int:
+    """Distance de Damerau-Levenshtein restreinte (OSA) ; limit + 1 si elle dépasse limit."""
+    if abs(len(a) - len(b)) > limit:
+        return limit + 1
+    prev2: List[int] = []
+    prev = list(range(len(b) + 1))
+    for i, ca in enumerate(a, 1):
+        cur = [i] + [0] * len(b)
+        best = i
+        for j, cb in enumerate(b, 1):
+            d = min(prev[j] + 1, cur[j - 1] + 1, prev[j - 1] + (ca != cb))
+            if i > 1 and j > 1 and ca == b[j - 2] and a[i - 2] == cb:
+                d = min(d, prev2[j - 2] + 1)
+            cur[j] = d
+            best = min(best, d)
+        if best > limit:
+            return limit + 1
+        prev2, prev = prev, cur
+    return prev[-1] if prev[-1] <= limit else limit + 1
+
+
+class SpellIndex:
+    """
+    Dictionnaire de suppressions du vocabulaire (termes d'un seul mot).
+    Immuable une fois construit, sauf le cache des corrections et les
+    compteurs de stats() (sans verrou : approchés entre threads).
+    """
+
+    def __init__(self, terms: Iterable[str], freq: np.ndarray, max_distance: int = 1,
+                 prefix_length: int = 7, min_length: int = 6, min_frequency: int = 2):
+        self.max_distance = max_distance
+        self.prefix_length = prefix_length
+        self.min_length = min_length
+        self.min_frequency = min_frequency
+        self.terms: List[str] = []
+        self._folded: List[str] = []
+        self._freq: List[int] = []
+        self._index: Dict[str, List[int]] = {}
+        self._base: Optional["SpellIndex"] = None  # index du fit, sous les termes ajoutés à chaud
+        for term, f in zip(terms, np.asarray(freq).tolist()):
+            if not self._eligible(term, f):
+                continue  # n-grammes, nombres, codes, termes rares : pas de correction
+            folded = fold_accents(term)
+            tid = len(self.terms)
+            self.terms.append(term)
+            self._folded.append(folded)
+            self._freq.append(int(f))
+            for key in _deletes(folded[:prefix_length], max_distance):
+                self._index.setdefault(key, []).append(tid)
+        self._known = set(self.terms)
+        self._cache: Dict[str, Optional[str]] = {}
+        self.corrected = 0
+        self.unknown = 0
+
+    def _eligible(self, term: str, freq: int) -> bool:
+        return " " not in term and term.isalpha() and freq >= self.min_frequency
+
+    def __contains__(self, term: str) -> bool:
+        return term in self._known or (self._base is not None and term in self._base)
+
+    def extended(self, terms: Iterable[str], freq: np.ndarray) -> "SpellIndex":
+        """
+        Correcteur qui connaît en plus les termes donnés (ajouts à chaud), ou
+        self s'il n'y en a aucun de nouveau. self n'est pas modifié : les
+        snapshots déjà publiés le gardent. Seuls les termes ajoutés sont
+        indexés à nouveau, au-dessus de l'index du fit.
+        """
+        new = [(t, int(f)) for t, f in zip(terms, np.asarray(freq).tolist())
+               if self._eligible(t, f) and t not in self]
+        if not new:
+            return self
+        base = self._base or self
+        own = list(zip(self.terms, self._freq)) if self._base is not None else []
+        merged = own + new
+        out = SpellIndex([t for t, _ in merged], np.array([f for _, f in merged]), self.max_distance,
+                         self.prefix_length, self.min_length, self.min_frequency)
+        out._base = base
+        out.corrected, out.unknown = self.corrected, self.unknown
+        return out
+
+    def _best(self, folded: str, limit: int) -> Optional[Tuple[int, int, str]]:
+        """(distance, -fréquence, terme) du meilleur candidat de cet index et de celui du fit."""
+        seen = set()
+        best = self._base._best(folded, limit) if self._base is not None else None
+        for key in _deletes(folded[:self.prefix_length], limit):
+            for tid in self._index.get(key, ()):
+                if tid in seen:
+                    continue
+                seen.add(tid)
+                d = edit_distance(folded, self._folded[tid], limit)
+                if d > limit:
+                    continue
+                cand = (d, -self._freq[tid], self.terms[tid])
+                if best is None or cand < best:
+                    best = cand
+        return best
+
+    def lookup(self, word: str) -> Optional[str]:
+        """Terme du vocabulaire le plus proche de word (None si aucun à distance autorisée)."""
+        if len(word) < self.min_length or not word.isalpha():
+            return None
+        folded = fold_accents(word)
+        # mots courts : une seule erreur tolérée
+        limit = 1 if len(folded) <= 5 else self.max_distance
+        best = self._best(folded, limit)
+        return best[2] if best is not None else None
+
+    def correct(self, tokens: List[str], known: Mapping[str, int]) -> List[str]:
+        """tokens où chaque mot absent de known est remplacé par sa correction (s'il y en a une)."""
+        out = None
+        for i, token in enumerate(tokens):
+            if token in known:
+                continue
+            try:
+                fix = self._cache[token]
+            except KeyError:
+                if len(self._cache) > _CACHE_MAX:
+                    self._cache.clear()
+                fix = self._cache[token] = self.lookup(token)
+            if fix is None:
+                self.unknown += 1
+                metrics.inc(metrics.SPELL_UNKNOWN)
+                continue
+            self.corrected += 1
+            metrics.inc(metrics.SPELL_CORRECTED)
+            if out is None:
+                out = list(tokens)
+            out[i] = fix
+        return tokens if out is None else out
+
+    def stats(self) -> dict:
+        lookups = self.corrected + self.unknown
+        base = self._base.stats() if self._base is not None else {"terms": 0, "deletes": 0}
+        return {
+            "terms": base["terms"] + len(self.terms),
+            "deletes": base["deletes"] + len(self._index),
+            "corrected": self.corrected,
+            "unknown": self.unknown,
+            "hit_ratio": self.corrected / lookups if lookups else 0.0,
+        }
@@ -59,6 +59,7 @@
     const payload = {
       question,
       topic,
+      // pas de k : la réponse passe par le cache de réponses (k > 0 renvoie aussi data.matches, sans cache)
       history: history.slice(-10)
     };
 
@@ -92,12 +93,15 @@
         addMsg("Désolé, je n'ai pas compris 🤖",'bot');
       }
 
-      // mini-sources
-      if(Array.isArray(data?.context) && data.context.length){
+      // mini-sources (matches au-dessus du seuil, ou ancien format "context")
+      const context = Array.isArray(data?.matches)
+        ? data.matches.filter(m => m.score >= (data.threshold ?? 0))
+        : data?.context;
+      if(Array.isArray(context) && context.length){
         const tip=document.createElement('div');
         tip.className='msg bot';
         tip.style.fontSize='12px'; tip.style.color='#64748b';
-        tip.innerHTML=sanitize('Sources :\n'+data.context.slice(0,2).map(c=>`• ${c.question} → ${c.answer}`).join('\n')).replace(/\n/g,'<br>');
+        tip.innerHTML=sanitize('Sources :\n'+context.slice(0,2).map(c=>`• ${c.question} → ${c.answer}`).join('\n')).replace(/\n/g,'<br>');
         convo.appendChild(tip); convo.scrollTop=convo.scrollHeight;
       }
     }catch(err){
@@ -1,3 +1,742 @@
+import asyncio
+import contextlib
+import io
+import json
+import pstats
+import tempfile
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+from unittest import mock
+
+import numpy as np
+from django.conf import settings
 from django.test import TestCase
+from sklearn.feature_extraction.text import TfidfVectorizer
+
+from . import chatbot_engine, profiling, views
+from .analyzer import PROFILES, Analyzer
+from .answer_cache import SQLiteCacheBackend, normalize_query
+from .executor import PoolSaturated
+from .intents import match_intents
+from .kb_artifact import (VECTORIZER_PARAMS, KBArtifact, StaleArtifactError, build_artifact, compile_kb, load_faq_frame,
+                          memory_artifact, open_artifact)
+from .kb_delta import KBDelta
+from .near_dup import DEFAULTS as NEAR_DUP_DEFAULTS
+from .profiling import profiled
+from .retrieval import InvertedIndex, TfidfEngine
+from .scraping import FetchError, Fetcher
+from .scraping.state import CrawlState
+from .scripts import build_faq, build_qa
+from .tfidf import QueryVectorizer
+
+
+class AnswerCacheKeyTests(TestCase):
+    """Clé du cache de réponses vs termes de l'analyseur."""
+
+    def test_accents_kept_with_default_analyzer(self):
+        # profil par défaut : "note" et "noté" sont deux termes différents
+        fresh = chatbot_engine.get_chatbot_matches("c'est noté")["answer"]
+        other = chatbot_engine.get_chatbot_matches("c'est note")["answer"]
+        self.assertNotEqual(fresh, other)
+        chatbot_engine.get_chatbot_response("c'est note")
+        self.assertEqual(chatbot_engine.get_chatbot_response("c'est noté"), fresh)
+        self.assertEqual(chatbot_engine.get_chatbot_response("c'est note"), other)
+
+    def test_normalize_query(self):
+        self.assertEqual(normalize_query("  C'est   Noté ? "), "c'est note")
+        self.assertEqual(normalize_query("  C'est   Noté ? ", fold_accents=False), "c'est noté")
+
+
+class SpellIndexTests(TestCase):
+    """Correcteur aux réglages par défaut, sur le vocabulaire de kb.bin."""
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        kb = chatbot_engine._open_or_build_artifact()
+        cls.vocabulary = set(kb.vocabulary)
+        cls.speller = kb.make_speller()
+
+    def test_typos_corrected(self):
+        self.assertEqual(self.speller.lookup("imprimente"), "imprimante")
+        self.assertEqual(self.speller.lookup("ordinatuer"), "ordinateur")
+
+    def test_common_words_kept(self):
+        for word in ("demain", "regarder", "soir", "saut", "papier", "donner", "plage", "oiseau"):
+            self.assertNotIn(word, self.vocabulary)
+            self.assertIsNone(self.speller.lookup(word), word)
+
+
+class PartitionedEngineTests(TestCase):
+    """Index partitionné par sujet (CHATBOT_INTENT_INDEX)."""
+
+    def setUp(self):
+        patcher = mock.patch.dict(chatbot_engine.INTENT_INDEX_CONFIG, {"ENABLED": True})
+        patcher.start()
+        self.addCleanup(chatbot_engine.reload_kb)
+        self.addCleanup(patcher.stop)
+        chatbot_engine.reload_kb()
+
+    def test_hot_edits_rejected(self):
+        # le delta remplacerait le moteur partitionné par un TF-IDF global
+        self.assertEqual(chatbot_engine.kb_info()["engine"], "tfidf-intent")
+        with self.assertRaises(RuntimeError):
+            chatbot_engine.add_entries([("nouvelle question wifi", "nouvelle réponse")])
+
+    def _global(self, question, k=3):
+        engine = chatbot_engine._snapshot.engine
+        return [(d, round(s, 6)) for d, s in engine.index.search(engine.vectorize([question]), k=k)]
+
+    def _ask(self, question, topic=None, k=3):
+        payload = {"question": question, "topic": topic, "k": k}
+        resp = self.client.post("/api/ask/", data=json.dumps(payload), content_type="application/json")
+        self.assertEqual(resp.status_code, 200)
+        return resp.json()["matches"]
+
+    def test_routed_to_partition(self):
+        # "imprimante" -> partition imprimante seule, sans passer par l'index global
+        engine = chatbot_engine._snapshot.engine
+        with mock.patch.object(engine.index, "search", wraps=engine.index.search) as global_search:
+            matches = self._ask("mon imprimante ne fonctionne plus")
+        global_search.assert_not_called()
+        self.assertTrue(matches)
+        self.assertEqual({m["intent"] for m in matches}, {"imprimante"})
+
+    def test_fallback_to_global_index(self):
+        # rien au-dessus du seuil dans la partition wifi : mêmes résultats que l'index global
+        question = "mon pc portable ne charge plus"
+        self.assertEqual(match_intents(question + " wlan"), ["wifi"])
+        matches = self._ask(question + " wlan")
+        self.assertEqual([(m["doc"], round(m["score"], 6)) for m in matches], self._global(question + " wlan"))
+        self.assertNotEqual(matches[0]["intent"], "wifi")
+        # aucune règle : index global directement
+        self.assertEqual(match_intents(question), [])
+        self.assertEqual([(m["doc"], round(m["score"], 6)) for m in self._ask(question)], self._global(question))
+
+    def test_topic_from_view(self):
+        # sans sujet, "ne fonctionne plus" va à l'index global ; avec topic, à la partition choisie
+        question = "ne fonctionne plus"
+        self.assertGreater(len({m["intent"] for m in self._ask(question)}), 1)
+        self.assertEqual({m["intent"] for m in self._ask(question, topic="imprimante")}, {"imprimante"})
+        # sujet inconnu : ignoré
+        self.assertEqual(self._ask(question, topic="inconnu"), self._ask(question))
+        self.assertEqual(chatbot_engine.kb_info()["engine"], "tfidf-intent")
+
+
+class SQLiteCacheBackendTests(TestCase):
+    """Fichier de cache partagé par plusieurs workers."""
+
+    def setUp(self):
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        self.path = Path(tmp.name) / "cache.sqlite3"
+
+    def test_invalidate_keeps_other_workers_rows(self):
+        a = SQLiteCacheBackend(self.path, config="conf")
+        b = SQLiteCacheBackend(self.path, config="conf")
+        a.put("v1", "wifi", "réponse a")
+        b.put("v1", "imprimante", "réponse b")
+        a.invalidate("v2")  # a recharge, b sert encore v1
+        self.assertIsNone(a.get("v1", "wifi"))
+        self.assertEqual(b.get("v1", "imprimante"), "réponse b")
+
+    def test_rows_keyed_on_config(self):
+        SQLiteCacheBackend(self.path, config="tfidf").put("v1", "wifi", "réponse tfidf")
+        self.assertIsNone(SQLiteCacheBackend(self.path, config="hybrid").get("v1", "wifi"))
+
+    def test_expired_rows_purged(self):
+        a = SQLiteCacheBackend(self.path, config="conf", ttl=60)
+        SQLiteCacheBackend(self.path, config="conf").put("v1", "wifi", "réponse")
+        with mock.patch("support_bot.answer_cache.time.time", return_value=time.time() + 120):
+            a.invalidate("v2")
+        self.assertIsNone(a.get("v1", "wifi"))
+
+
+class _StandInHandler(BaseHTTPRequestHandler):
+    """Serveur local : /etag (requêtes conditionnelles), /flaky (503 puis 200), /page/* (200)."""
+
+    def do_GET(self):
+        server = self.server
+        with server.lock:
+            server.requests.append((self.path, time.monotonic(), dict(self.headers)))
+            n = sum(1 for path, _, _ in server.requests if path == self.path)
+        if self.path == "/etag":
+            if self.headers.get("If-None-Match") == '"v1"':
+                return self._send(304)
+            return self._send(200, "<p>version 1</p>", {"ETag": '"v1"'})
+        if self.path == "/last-modified":
+            stamp = "Wed, 01 Oct 2025 10:00:00 GMT"
+            if self.headers.get("If-Modified-Since") == stamp:
+                return self._send(304)
+            return self._send(200, "<p>daté</p>", {"Last-Modified": stamp})
+        if self.path == "/flaky" and n <= 2:
+            return self._send(503, "indisponible")
+        return self._send(200, f"<p>{self.path}</p>")
+
+    def _send(self, status, body="", headers=None):
+        data = body.encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "text/html; charset=utf-8")
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        if status != 304:
+            self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        if status != 304:
+            self.wfile.write(data)
+
+    def log_message(self, *args):
+        pass
+
+
+class FetcherTests(TestCase):
+    """support_bot.scraping contre un serveur HTTP local (sans réseau)."""
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.server = ThreadingHTTPServer(("127.0.0.1", 0), _StandInHandler)
+        cls.server.lock = threading.Lock()
+        cls.server.requests = []
+        threading.Thread(target=cls.server.serve_forever, daemon=True).start()
+        cls.base = f"http://127.0.0.1:{cls.server.server_port}"
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.server.shutdown()
+        cls.server.server_close()
+        super().tearDownClass()
+
+    def setUp(self):
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        self.cache_dir = Path(tmp.name)
+        with self.server.lock:
+            self.server.requests.clear()
+
+    def _fetcher(self, **kwargs):
+        kwargs = dict({"cache_dir": self.cache_dir, "workers": 4, "per_host_interval": 0.0,
+                       "backoff": 0.01}, **kwargs)
+        fetcher = Fetcher(**kwargs)
+        self.addCleanup(fetcher.close)
+        return fetcher
+
+    def _sent(self, path):
+        with self.server.lock:
+            return [headers for p, _, headers in self.server.requests if p == path]
+
+    def test_etag_304_reuses_cached_body(self):
+        fetcher = self._fetcher()
+        first = fetcher.get(self.base + "/etag")
+        second = fetcher.get(self.base + "/etag")
+        self.assertFalse(first.from_cache)
+        self.assertTrue(second.from_cache)
+        self.assertEqual(second.status, 200)
+        self.assertEqual(second.text, "<p>version 1</p>")
+        self.assertEqual(self._sent("/etag")[1].get("If-None-Match"), '"v1"')
+
+    def test_last_modified_304_reuses_cached_body(self):
+        fetcher = self._fetcher()
+        fetcher.get(self.base + "/last-modified")
+        second = fetcher.get(self.base + "/last-modified")
+        self.assertTrue(second.from_cache)
+        self.assertEqual(second.text, "<p>daté</p>")
+        self.assertEqual(len(self._sent("/last-modified")), 2)
+
+    def test_retry_on_503(self):
+        result = self._fetcher(retries=3).get(self.base + "/flaky")
+        self.assertEqual(result.status, 200)
+        self.assertEqual(len(self._sent("/flaky")), 3)
+
+    def test_503_gives_up_after_retries(self):
+        with self.assertRaises(FetchError) as ctx:
+            self._fetcher(retries=1).get(self.base + "/flaky")
+        self.assertEqual(ctx.exception.status, 503)
+        self.assertEqual(len(self._sent("/flaky")), 2)
+
+    def test_per_host_minimum_interval(self):
+        interval = 0.2
+        urls = [f"{self.base}/page/{i}" for i in range(4)]
+        results = self._fetcher(per_host_interval=interval).fetch_all(urls)
+        self.assertEqual([r.text for r in results], [f"<p>/page/{i}</p>" for i in range(4)])
+        with self.server.lock:
+            stamps = sorted(t for _, t, _ in self.server.requests)
+        gaps = [b - a for a, b in zip(stamps, stamps[1:])]
+        self.assertEqual(len(gaps), 3)
+        self.assertGreaterEqual(min(gaps), interval * 0.9)
+
+    def test_offline_replay_from_cache(self):
+        url = self.base + "/page/enregistree"
+        self._fetcher().get(url)
+        offline = self._fetcher(offline=True)
+        with self.server.lock:
+            self.server.requests.clear()
+        result = offline.get(url)
+        self.assertTrue(result.from_cache)
+        self.assertEqual(result.text, "<p>/page/enregistree</p>")
+        with self.assertRaises(FetchError):
+            offline.get(self.base + "/page/absente")
+        self.assertEqual(self.server.requests, [])
+
+
+class HotEditTests(TestCase):
+    """add_entries/remove_entries/update_entry (delta sans refit) vs base recompilée."""
+
+    def setUp(self):
+        # pas de refit en arrière-plan : on compare le delta lui-même
+        patcher = mock.patch.object(chatbot_engine, "KB_REFIT_DRIFT", 0)
+        patcher.start()
+        self.addCleanup(chatbot_engine.reload_kb)
+        self.addCleanup(patcher.stop)
+        chatbot_engine.reload_kb()
+
+    def test_ranking_matches_full_refit(self):
+        kb = chatbot_engine._snapshot.kb
+        sample = [kb.questions[i] for i in range(0, kb.n_docs, 7)]
+        chatbot_engine.add_entries([("comment activer le vpn de l'université", "Installez le client VPN."),
+                                    ("le vpn se déconnecte souvent", "Relancez le client VPN.")])
+        chatbot_engine.remove_entries([sample[0]])
+        chatbot_engine.update_entry(sample[1], answer="Nouvelle réponse.")
+        chatbot_engine.update_entry(sample[2], new_question="mon vpn ne marche plus du tout")
+
+        hot = chatbot_engine._snapshot
+        questions, answers = hot.delta.entries()
+        fresh = memory_artifact(questions, answers, kb.header.get("analyzer"))
+        arrays = fresh.arrays
+        engine = TfidfEngine(fresh.make_vectorizer(), InvertedIndex(
+            arrays["postings_indptr"], arrays["postings_docs"], arrays["postings_weights"], fresh.n_docs), 0.2)
+
+        for q in sample[1:] + ["vpn université", "vpn déconnecte", "mon vpn ne marche plus", "imprimante"]:
+            got = hot.engine.search_vectors([q], hot.engine.vectorize([q]), k=3)[0]
+            want = engine.search_vectors([q], engine.vectorize([q]), k=3)[0]
+            self.assertEqual([hot.question(d) for d, _ in got], [fresh.questions[d] for d, _ in want], q)
+            self.assertEqual([hot.answer(d) for d, _ in got], [fresh.answers[d] for d, _ in want], q)
+            self.assertAlmostEqual(got[0][1], want[0][1], delta=0.1)
+
+    def test_spell_index_learns_added_terms(self):
+        with mock.patch.dict(chatbot_engine.SPELLING_CONFIG, {"ENABLED": True}):
+            chatbot_engine.reload_kb()
+        self.assertIsNone(chatbot_engine._snapshot.vectorizer.speller.lookup("zoomkast"))
+        chatbot_engine.add_entries([("zoomcast ne démarre pas", "Réinstallez zoomcast."),
+                                    ("installer zoomcast", "Téléchargez zoomcast.")])
+        speller = chatbot_engine._snapshot.vectorizer.speller
+        self.assertEqual(speller.lookup("zoomkast"), "zoomcast")
+        self.assertEqual(speller.lookup("imprimente"), "imprimante")
+        self.assertEqual(chatbot_engine.get_chatbot_response("zoomkast ne démarre pas"), "Réinstallez zoomcast.")
+
+    def test_refit_keeps_near_dup_aliases(self):
+        header, arrays = compile_kb(load_faq_frame(chatbot_engine.FAQ_CSV), None, "0" * 64,
+                                    near_dup=dict(NEAR_DUP_DEFAULTS))
+        kb = KBArtifact(None, header, arrays)
+        self.assertGreater(len(kb.aliases), 1)
+        delta = KBDelta(kb, kb.make_vectorizer(), InvertedIndex(
+            arrays["postings_indptr"], arrays["postings_docs"], arrays["postings_weights"], kb.n_docs))
+        dropped = kb.questions[int(kb.alias_docs[0])]
+        delta.remove(dropped)
+        delta.remove(kb.questions[0])
+
+        refit = memory_artifact(*delta.entries(), aliases=delta.entry_aliases())
+        expected = {alias: kb.questions[int(doc)] for alias, doc in zip(kb.aliases, kb.alias_docs)
+                    if kb.questions[int(doc)] != dropped}
+        self.assertEqual({alias: refit.questions[int(doc)] for alias, doc in zip(refit.aliases, refit.alias_docs)},
+                         expected)
+
+
+class InvertedIndexParityTests(TestCase):
+    """Index inversé de kb.bin vs similarité cosinus calculée en dense sur toute la base."""
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.kb = chatbot_engine._open_or_build_artifact()
+        arrays = cls.kb.arrays
+        cls.engine = TfidfEngine(cls.kb.make_vectorizer(), InvertedIndex(
+            arrays["postings_indptr"], arrays["postings_docs"], arrays["postings_weights"], cls.kb.n_docs), 0.2)
+        vectorizer = TfidfVectorizer(**VECTORIZER_PARAMS, analyzer=Analyzer(cls.kb.analyzer_profile))
+        cls.matrix = vectorizer.fit_transform(list(cls.kb.questions)).toarray()
+        cls.vectorizer = vectorizer
+
+    def _brute_force(self, question, k):
+        scores = self.matrix @ self.vectorizer.transform([question]).toarray()[0]
+        order = np.lexsort((np.arange(len(scores)), -scores))  # score décroissant, puis plus petit id
+        return [(int(d), float(scores[d])) for d in order[:k] if scores[d] > 0]
+
+    def test_top_k_matches_brute_force(self):
+        k = 5
+        questions = [self.kb.questions[i] for i in range(0, self.kb.n_docs, 10)]
+        questions += [" ".join(q.split()[1:]) for q in questions] + ["wifi", "imprimante hors ligne"]
+        single = [self.engine.search(q, k=k) for q in questions]
+        batch = self.engine.search_batch(questions, k=k)
+        for q, got, got_batch in zip(questions, single, batch):
+            want = self._brute_force(q, k)
+            exact = dict(self._brute_force(q, self.kb.n_docs))
+            self.assertEqual(got, got_batch, q)
+            self.assertEqual(len(got), len(want), q)
+            for (doc, score), (want_doc, want_score) in zip(got, want):
+                self.assertAlmostEqual(score, want_score, places=9, msg=q)
+                # un autre document n'est admis qu'ex aequo (à l'arrondi près)
+                self.assertAlmostEqual(exact.get(doc, 0.0), want_score, places=9, msg=q)
+
+    def test_ties_go_to_lowest_doc_id(self):
+        kb = memory_artifact(["wifi lent", "imprimante bloquée", "wifi lent", "wifi lent le soir"],
+                             ["a", "b", "c", "d"])
+        arrays = kb.arrays
+        engine = TfidfEngine(kb.make_vectorizer(), InvertedIndex(
+            arrays["postings_indptr"], arrays["postings_docs"], arrays["postings_weights"], kb.n_docs), 0.2)
+        hits = engine.search("wifi lent", k=3)
+        self.assertEqual([doc for doc, _ in hits], [0, 2, 3])
+        self.assertEqual(hits[0][1], hits[1][1])
+        self.assertEqual(engine.search_batch(["wifi lent"], k=3)[0], hits)
+
+
+class QueryVectorizerTests(TestCase):
+    """tfidf.QueryVectorizer vs TfidfVectorizer ajusté sur faq.csv, pour chaque profil d'analyseur."""
+
+    def test_transform_matches_sklearn(self):
+        questions = load_faq_frame(chatbot_engine.FAQ_CSV)["question"].tolist()
+        queries = questions + [" ".join(reversed(q.split())) for q in questions[::5]] + [
+            "Réseau WiFi très lent ?", "l'imprimante n'imprime plus", "", "zzz inconnu"]
+        for profile in PROFILES:
+            with self.subTest(profile=profile):
+                sk = TfidfVectorizer(**VECTORIZER_PARAMS, analyzer=Analyzer(profile)).fit(questions)
+                ours = QueryVectorizer(sk.vocabulary_, sk.idf_, Analyzer(profile))
+                want = sk.transform(queries)
+                got = ours.transform(queries)
+                want.sort_indices()
+                got.sort_indices()
+                self.assertEqual(got.shape, want.shape)
+                np.testing.assert_array_equal(got.indptr, want.indptr)
+                np.testing.assert_array_equal(got.indices, want.indices)
+                np.testing.assert_allclose(got.data, want.data, rtol=0, atol=1e-15)
+
+
+class StageTimingTests(TestCase):
+    """Le chargement de la base n'est pas compté dans l'étape normalize."""
+
+    def test_load_not_counted_in_normalize(self):
+        chatbot_engine._lazy_load()
+        current = chatbot_engine._current_snapshot
+
+        def slow_snapshot():
+            time.sleep(0.2)  # chargement paresseux simulé
+            return current()
+
+        with mock.patch.object(chatbot_engine, "_current_snapshot", slow_snapshot), \
+                mock.patch.object(chatbot_engine.metrics, "record_answer",
+                                  wraps=chatbot_engine.metrics.record_answer) as record:
+            chatbot_engine.get_chatbot_response("chronométrage du wifi de la bibliothèque")
+            timings = chatbot_engine.get_chatbot_matches("chronométrage du wifi")["timings"]
+        path, result, times, score, total = record.call_args_list[0].args
+        self.assertEqual(path, "single")
+        self.assertLess(times[1] - times[0], 0.1)
+        self.assertGreaterEqual(total, 0.2)  # la latence totale, elle, inclut le chargement
+        self.assertLess(timings["normalize"], 0.1)
+
+
+class ChatbotApiTests(TestCase):
+    """Vues /api/ask/ et /api/ask/batch/."""
+
+    def _ask(self, payload):
+        return self.client.post("/api/ask/", data=json.dumps(payload), content_type="application/json")
+
+    def test_repeated_ui_question_is_cache_hit(self):
+        # même charge utile que chat.js (sans k)
+        payload = {"question": "Mon imprimante ne répond plus, que faire ?", "topic": None, "history": []}
+        first = self._ask(payload)
+        hits = chatbot_engine.cache_stats()["hits"]
+        second = self._ask(payload)
+        self.assertEqual(second.status_code, 200)
+        self.assertEqual(second.json()["answer"], first.json()["answer"])
+        self.assertEqual(chatbot_engine.cache_stats()["hits"], hits + 1)
+
+    def _batch(self, payload):
+        return self.client.post("/api/ask/batch/", data=json.dumps(payload), content_type="application/json")
+
+    def test_batch_matches_single_answers(self):
+        questions = ["Mon imprimante ne répond plus", "wifi eduroam", "mot de passe oublié", "", "xyzzy"]
+        resp = self._batch({"questions": questions})
+        self.assertEqual(resp.status_code, 200)
+        self.assertEqual(resp.json()["count"], len(questions))
+        self.assertEqual(resp.json()["answers"], [self._ask({"question": q}).json()["answer"] for q in questions])
+
+    def test_batch_validation(self):
+        self.assertEqual(self._batch({"questions": ["wifi", 3]}).status_code, 400)
+        self.assertEqual(self._batch({"questions": "wifi"}).status_code, 400)
+        self.assertEqual(self._batch({"questions": ["wifi"] * (views.BATCH_MAX_QUESTIONS + 1)}).status_code, 400)
+        bad = self.client.post("/api/ask/batch/", data="{", content_type="application/json")
+        self.assertEqual(bad.status_code, 400)
+
+    def test_saturated_pool_returns_503(self):
+        class _Full:
+            async def run(self, fn, *args):
+                raise PoolSaturated()
+
+        with mock.patch.object(views, "get_pool", return_value=_Full()):
+            for payload in ({"question": "wifi"}, {"question": "wifi", "k": 3}):
+                resp = self._ask(payload)
+                self.assertEqual(resp.status_code, 503)
+                self.assertEqual(resp["Retry-After"], str(settings.CHATBOT_API_POOL["RETRY_AFTER"]))
+            self.assertEqual(self._batch({"questions": ["wifi"]}).status_code, 503)
+
+    def test_k_must_be_an_integer(self):
+        for k in (2.9, True, "true", "3.0", " 3", "-1", 0, views.MAX_K + 1, [3]):
+            self.assertEqual(self._ask({"question": "wifi", "k": k}).status_code, 400, k)
+        for k in (3, "3"):
+            self.assertEqual(len(self._ask({"question": "wifi", "k": k}).json()["matches"]), 3)
+        form = self.client.post("/api/ask/", {"question": "wifi", "k": "2"})
+        self.assertEqual(len(form.json()["matches"]), 2)
+
+
+def _article(n, contenu=None):
+    return {"source": f"https://support.example/{n}", "titre": f"Configurer le service {n}",
+            "contenu": contenu or f"Ouvrez les paramètres du service {n} puis validez."}
+
+
+class CrawlDeltaTests(TestCase):
+    """scraping.state.CrawlState et build_qa.apply_delta (recrawl incrémental)."""
+
+    def test_crawl_state_delta(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            state = CrawlState.load(Path(tmp) / "crawl_state.json")
+            first = state.update([_article(1), _article(2), _article(3)])
+            self.assertEqual((first["from"], first["to"], len(first["added"])), (0, 1, 3))
+            ids = {row["source"]: row["id"] for row in first["added"]}
+            state.save()
+
+            state = CrawlState.load(Path(tmp) / "crawl_state.json")
+            second = state.update([_article(1), _article(2, "Nouvelle procédure."), _article(4)])
+        self.assertEqual((second["from"], second["to"]), (1, 2))
+        self.assertEqual([a["source"] for a in second["added"]], [_article(4)["source"]])
+        self.assertEqual([(a["source"], a["previous_id"]) for a in second["changed"]],
+                         [(_article(2)["source"], ids[_article(2)["source"]])])
+        self.assertEqual(second["removed"], [{"id": ids[_article(3)["source"]], "source": _article(3)["source"]}])
+        self.assertEqual(state.articles[_article(1)["source"]]["id"], ids[_article(1)["source"]])
+
+    def _corpus(self, articles):
+        return list(build_qa.dedup(build_qa.qa_rows(
+            (a["id"], a["titre"], a["contenu"], a["source"]) for a in articles)))
+
+    def test_apply_delta_matches_full_rebuild(self):
+        state = CrawlState(Path("unused.json"))
+        state.update([_article(1), _article(2), _article(3)])
+        before = self._corpus(state.rows())
+        delta = state.update([_article(1), _article(2, "Nouvelle procédure."), _article(4)])
+        full = self._corpus(state.rows())
+
+        changes = {"remove": [], "add": []}
+        applied = list(build_qa.apply_delta(before, delta, changes))
+        self.assertEqual(sorted(r["id"] for r in applied), sorted(r["id"] for r in full))
+        # ids stables : les lignes de l'article inchangé gardent les leurs
+        kept = {r["id"] for r in before if r["article_id"] == state.articles[_article(1)["source"]]["id"]}
+        self.assertTrue(kept <= {r["id"] for r in applied})
+        # idempotent : rejouer le delta ne change plus rien
+        self.assertEqual(list(build_qa.apply_delta(applied, delta)), applied)
+
+        removed = {r["question"] for r in before} - {r["question"] for r in full}
+        self.assertTrue(removed <= set(changes["remove"]))
+        self.assertEqual(len(changes["add"]), len(applied) - (len(before) - len(changes["remove"])))
+
+    def test_corpus_delta_applied_to_served_base(self):
+        with tempfile.TemporaryDirectory() as tmp, \
+                mock.patch.object(chatbot_engine, "KB_REFIT_DRIFT", 0), \
+                mock.patch.object(chatbot_engine, "CORPUS_DELTA", Path(tmp) / "qa_corpus.kb_delta.json"):
+            self.addCleanup(chatbot_engine.reload_kb)
+            chatbot_engine.reload_kb()
+            gone = chatbot_engine._snapshot.kb.questions[0]
+            chatbot_engine.CORPUS_DELTA.write_text(json.dumps({
+                "from": 1, "to": 2, "remove": [gone],
+                "add": [["Comment configurer le service zorglub ?", "Ouvrez les paramètres de zorglub."]],
+            }), encoding="utf-8")
+            chatbot_engine._apply_pending_corpus_delta()
+            info = chatbot_engine.kb_info()
+            self.assertEqual((info["n_added"], info["n_removed"]), (1, 1))
+            self.assertEqual(chatbot_engine.get_chatbot_response("configurer zorglub"),
+                             "Ouvrez les paramètres de zorglub.")
+            self.assertNotIn(gone, [m["question"] for m in chatbot_engine.get_chatbot_matches(gone)["matches"]])
+
+
+def _busy(seconds):
+    end = time.perf_counter() + seconds
+    while time.perf_counter() < end:
+        pass
+
+
+class ProfilingTests(TestCase):
+    """profiling.profiled / attach : un fichier par appel profilé."""
+
+    def _configure(self, mode, rate="1.0"):
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        env = {"CHATBOT_PROFILE": mode, "CHATBOT_PROFILE_DIR": tmp.name,
+               "CHATBOT_PROFILE_RATE": rate, "CHATBOT_PROFILE_INTERVAL": "0.001"}
+        patcher = mock.patch.dict("os.environ", env)
+        patcher.start()
+        self.addCleanup(profiling.config.cache_clear)
+        self.addCleanup(patcher.stop)
+        profiling.config.cache_clear()
+        return Path(tmp.name)
+
+    def test_sample_writes_collapsed_stacks(self):
+        out = self._configure("sample")
+
+        @profiled("t_sample")
+        def work():
+            _busy(0.1)
+            return 42
+
+        self.assertEqual(work(), 42)
+        files = list(out.glob("t_sample-*.collapsed"))
+        self.assertEqual(len(files), 1)
+        lines = files[0].read_text(encoding="utf-8").splitlines()
+        self.assertTrue(lines)
+        for line in lines:
+            stack, count = line.rsplit(" ", 1)
+            self.assertGreater(int(count), 0)
+        self.assertTrue(any(f"{__name__}:_busy" in line for line in lines))
+
+    def test_cprofile_writes_pstats(self):
+        out = self._configure("cprofile")
+
+        @profiled("t_cprofile")
+        def work():
+            _busy(0.01)
+
+        work()
+        files = list(out.glob("t_cprofile-*.prof"))
+        self.assertEqual(len(files), 1)
+        names = {func[2] for func in pstats.Stats(str(files[0])).stats}
+        self.assertIn("_busy", names)
+
+    def test_rate_zero_writes_nothing(self):
+        out = self._configure("sample", rate="0")
+
+        @profiled("t_rate")
+        def work():
+            _busy(0.02)
+
+        work()
+        self.assertEqual(list(out.iterdir()), [])
+
+    def test_disabled_returns_function_unchanged(self):
+        self._configure("")
+
+        def work():
+            pass
+
+        self.assertIs(profiled("t_off")(work), work)
+
+    def test_attach_profiles_executor_thread(self):
+        out = self._configure("cprofile")
+
+        @profiled("t_async")
+        async def view():
+            loop = asyncio.get_running_loop()
+            return await loop.run_in_executor(None, profiling.attach(_busy), 0.01)
+
+        asyncio.run(view())
+        files = list(out.glob("t_async-*.prof"))
+        self.assertEqual(len(files), 1)
+        self.assertIn("_busy", {func[2] for func in pstats.Stats(str(files[0])).stats})
+        # hors session : attach rend la fonction telle quelle
+        self.assertIs(profiling.attach(_busy), _busy)
+
+
+# Petit répertoire raw/ figé et lignes attendues par fichier, produites par le
+# builder d'origine (pandas + iterrows) ; faq.csv doit rester identique.
+FAQ_RAW = {
+    "faq_ifoad_support_large.csv": (
+        "question,answer\n"
+        "Comment me connecter à la plateforme ?,Utilisez vos identifiants ENT sur la page d'accueil.\n"
+        "Mot de passe oublié,Cliquez sur « Mot de passe oublié » puis suivez le lien reçu.\n"
+        "Qui ?,Trop court pour être gardé.\n"
+    ),
+    "support.csv": (
+        "Titre;Texte;HTML\n"
+        "Imprimante bloquée;;<p>Redémarrez l'imprimante<br>puis relancez l'impression.</p>\n"
+        ";Le   wifi eduroam est disponible dans tous les bâtiments.;\n"
+        "imprimante   BLOQUÉE;Doublon ignoré par la déduplication.;\n"
+    ),
+    "tickets.json": json.dumps([
+        {"question": "Où déposer mon devoir", "answer": "Dans l'espace <b>Devoirs</b> du cours concerné."},
+        {"patterns": ["Accès VPN", "vpn ne marche pas", ""], "response": "Installez le client VPN depuis le portail logiciel."},
+        {"title": "Horaires", "body": {"text": "La bibliothèque ouvre de 8h à 20h en semaine."}},
+        {"q": 12, "a": "Une réponse numérique suffisamment longue."},
+    ], ensure_ascii=False),
+    "intents.json": json.dumps({"intents": [
+        {"tag": "examens", "patterns": ["Date des examens", "calendrier examens"],
+         "responses": ["Le calendrier des examens est publié sur l'ENT."]},
+        {"tag": "vide", "patterns": ["Bonjour"], "responses": []},
+    ]}, ensure_ascii=False),
+    "chat.json": "\n".join(json.dumps(r, ensure_ascii=False) for r in [
+        {"prompt": "Changer de groupe de TD", "reply": "Faites la demande au secrétariat pédagogique."},
+        {"utterance": "changer de groupe de td", "reply": "Réponse en double ignorée par la déduplication."},
+    ]) + "\n",
+}
+FAQ_EXPECTED = {
+    "faq_ifoad_support_large.csv": [
+        "Comment me connecter à la plateforme ?,Utilisez vos identifiants ENT sur la page d'accueil.",
+        "Mot de passe oublié,Cliquez sur « Mot de passe oublié » puis suivez le lien reçu.",
+    ],
+    "support.csv": [
+        "Imprimante bloquée ?,Redémarrez l'imprimante puis relancez l'impression.",
+        "Informations utiles ?,Le wifi eduroam est disponible dans tous les bâtiments.",
+    ],
+    "tickets.json": [
+        "Où déposer mon devoir ?,Dans l'espace Devoirs du cours concerné.",
+        "Accès VPN ?,Installez le client VPN depuis le portail logiciel.",
+        "vpn ne marche pas ?,Installez le client VPN depuis le portail logiciel.",
+        "12.0 ?,Une réponse numérique suffisamment longue.",
+    ],
+    "intents.json": [
+        "Date des examens ?,Le calendrier des examens est publié sur l'ENT.",
+        "calendrier examens ?,Le calendrier des examens est publié sur l'ENT.",
+    ],
+    "chat.json": [
+        "Changer de groupe de TD ?,Faites la demande au secrétariat pédagogique.",
+    ],
+}
+
+
+class BuildFaqParityTests(TestCase):
+    """scripts/build_faq.py : faq.csv identique au builder d'origine, avec ou sans cache."""
+
+    def test_fixed_raw_dir(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            raw, cache = Path(tmp) / "raw", Path(tmp) / ".build_cache"
+            raw.mkdir()
+            for name, text in FAQ_RAW.items():
+                (raw / name).write_text(text, encoding="utf-8")
+            out = Path(tmp) / "faq.csv"
+            with mock.patch.multiple(build_faq, RAW=raw, OUT=out, CACHE=cache, MANIFEST=cache / "manifest.json"), \
+                    contextlib.redirect_stdout(io.StringIO()):
+                build_faq.main(workers=1)
+                first = out.read_bytes()
+                build_faq.main(workers=1)  # second passage : tout vient du cache
+                second = out.read_bytes()
+
+            # seed d'abord, puis les autres fichiers dans l'ordre de parcours de raw/
+            order = [build_faq.SEED_NAME] + [p.name for p in raw.glob("**/*") if p.name != build_faq.SEED_NAME]
+            expected = ["question,answer"] + [line for name in order for line in FAQ_EXPECTED[name]]
+        self.assertEqual(first.decode("utf-8").splitlines(), expected)
+        self.assertEqual(second, first)
+
+
+class OpenArtifactTests(TestCase):
+    """kb_artifact.open_artifact : contrôle de fraîcheur par source_sha256."""
+
+    def test_stale_when_source_changes(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            csv_path, out = Path(tmp) / "faq.csv", Path(tmp) / "kb.bin"
+            csv_path.write_text("question,answer\nImprimante bloquée ?,Redémarrez l'imprimante.\n"
+                                "Wifi indisponible ?,Reconnectez-vous au réseau eduroam.\n", encoding="utf-8")
+            header = build_artifact(csv_path, out)
+            self.assertEqual(open_artifact(out, csv_path).version, header["source_sha256"][:12])
 
-# Create your tests here.
+            with open(csv_path, "a", encoding="utf-8") as f:
+                f.write("Mot de passe oublié ?,Utilisez le lien de la page de connexion.\n")
+            with self.assertRaisesRegex(StaleArtifactError, "faq.csv a changé"):
+                open_artifact(out, csv_path)
+            # sans source, l'artefact s'ouvre tel quel (chemin des workers après build_kb)
+            self.assertEqual(open_artifact(out).n_docs, 2)
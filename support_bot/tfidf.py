@@ -0,0 +1,82 @@
+# support_bot/tfidf.py
+# Vectorisation des questions au service, sans scikit-learn.
+#
+# QueryVectorizer reproduit transform() du TfidfVectorizer du build (termes de
+# analyzer.Analyzer, tf brut x idf lissé, norme L2) à partir du vocabulaire et
+# des IDF de kb.bin : mêmes termes, mêmes poids au bit près. Avec un
+# correcteur (spelling.SpellIndex), les mots hors vocabulaire sont d'abord
+# remplacés par le terme connu le plus proche.
+# scikit-learn (et pandas, qu'il importe) ne sert plus qu'au build et aux
+# scripts d'entraînement.
+from __future__ import annotations
+import functools
+from typing import Dict, List, Optional
+
+import numpy as np
+import scipy.sparse as sp
+
+from .analyzer import Analyzer
+from .spelling import SpellIndex
+
+
+class QueryVectorizer:
+    """transform() d'un TfidfVectorizer ajusté (vocabulary_, idf_), en NumPy/SciPy."""
+
+    def __init__(self, vocabulary: Dict[str, int], idf: np.ndarray, analyzer: Optional[Analyzer] = None,
+                 speller: Optional[SpellIndex] = None):
+        self.vocabulary_ = vocabulary
+        self.idf_ = np.asarray(idf, dtype=np.float64)
+        self.analyzer = analyzer or Analyzer()
+        self.speller = speller
+
+    def build_analyzer(self):
+        return self.analyzer
+
+    def transform(self, docs: List[str]) -> sp.csr_matrix:
+        """Matrice (documents x termes) TF-IDF normalisée L2, indices triés."""
+        vocab = self.vocabulary_
+        analyze = self.analyzer
+        if self.speller is not None:
+            analyze = functools.partial(analyze, correct=functools.partial(self.speller.correct, known=vocab))
+        indptr = [0]
+        indices: List[int] = []
+        counts: List[int] = []
+        for doc in docs:
+            row: Dict[int, int] = {}
+            for token in analyze(doc):
+                t = vocab.get(token)
+                if t is not None:
+                    row[t] = row.get(t, 0) + 1
+            for t in sorted(row):
+                indices.append(t)
+                counts.append(row[t])
+            indptr.append(len(indices))
+
+        indptr_a = np.asarray(indptr, dtype=np.int64)
+        indices_a = np.asarray(indices, dtype=np.int32)
+        data = np.asarray(counts, dtype=np.float64)
+        data *= self.idf_[indices_a]
+        _normalize_rows(data, indptr_a)
+        return sp.csr_matrix((data, indices_a, indptr_a), shape=(len(docs), len(self.idf_)))
+
+
+def _normalize_rows(data: np.ndarray, indptr: np.ndarray) -> None:
+    """
+    Norme L2 par ligne, en place. Les carrés sont sommés dans l'ordre des
+    colonnes, comme sklearn (inplace_csr_row_normalize_l2) : une somme par
+    paires de NumPy pourrait différer au dernier bit et changer un départage.
+    """
+    lengths = np.diff(indptr)
+    if len(data) == 0:
+        return
+    rows = np.flatnonzero(lengths)
+    width = int(lengths.max())
+    # une ligne par document non vide, complétée par des zéros (x + 0.0 == x)
+    padded = np.zeros((len(rows), width))
+    offsets = np.arange(len(data)) - np.repeat(indptr[rows], lengths[rows])
+    padded[np.repeat(np.arange(len(rows)), lengths[rows]), offsets] = data * data
+    sums = np.zeros(len(rows))
+    for j in range(width):
+        sums += padded[:, j]
+    norms = np.sqrt(sums)
+    data /= np.repeat(norms, lengths[rows])
@@ -1,35 +1,106 @@
+from django.conf import settings
 from django.shortcuts import render
-from django.http import JsonResponse
+from django.http import HttpResponse, JsonResponse
 from django.views.decorators.csrf import csrf_exempt
 import json
-from .chatbot_engine import get_chatbot_response
+from .chatbot_engine import get_chatbot_matches, get_chatbot_response, get_chatbot_responses
+from . import metrics
+from .profiling import profiled
+from .executor import PoolSaturated, get_pool
+
+# Taille maximale d'un lot pour /api/ask/batch/
+BATCH_MAX_QUESTIONS = 1000
+
+# Nombre maximal de résultats demandés par /api/ask/ (paramètre k)
+MAX_K = 20
+
+def _overloaded():
+    """503 + Retry-After quand le pool de recherche est plein (backpressure)."""
+    metrics.inc(metrics.API_REJECTED)
+    resp = JsonResponse({'error': 'Le chatbot est surchargé, réessayez dans un instant.'}, status=503)
+    resp['Retry-After'] = str(getattr(settings, 'CHATBOT_API_POOL', {}).get('RETRY_AFTER', 1))
+    return resp
+
+def _parse_k(k):
+    """k entier (JSON) ou chaîne de chiffres (formulaire) ; None si invalide (2.9, true, "3.0"...)."""
+    if isinstance(k, int) and not isinstance(k, bool):
+        return k
+    if isinstance(k, str) and k.isascii() and k.isdigit():
+        return int(k)
+    return None
 
 def chatbot_page(request):
     return render(request, 'chatbot.html')
 
+# Vues async : la recherche (CPU) tourne dans un pool borné, la boucle
+# d'événements reste libre pour les E/S des autres connexions.
 @csrf_exempt
-def chatbot_api(request):
+@profiled("chatbot_api")
+async def chatbot_api(request):
     if request.method != 'POST':
         return JsonResponse({'error': 'Méthode non autorisée'}, status=405)
 
+    k = topic = None
     try:
         if request.content_type and "application/json" in request.content_type:
             payload = json.loads(request.body.decode('utf-8'))
             user_input = (payload.get('question') or payload.get('message') or '').strip()
+            k, topic = payload.get('k'), payload.get('topic')
         else:
             user_input = (request.POST.get('message') or request.POST.get('question') or '').strip()
+            k, topic = request.POST.get('k'), request.POST.get('topic')
     except Exception:
         user_input = ''
+    # sujet choisi dans l'interface (chat.js) : restreint la recherche si l'index est partitionné
+    topic = topic if isinstance(topic, str) else None
+
+    # k (optionnel) : top-k structuré, issu de la même recherche
+    if k is not None:
+        k = _parse_k(k)
+        if k is None or not 1 <= k <= MAX_K:
+            return JsonResponse({'error': f"'k' doit être un entier entre 1 et {MAX_K}"}, status=400)
+        try:
+            result = await get_pool().run(get_chatbot_matches, user_input, k, topic)
+        except PoolSaturated:
+            return _overloaded()
+        return JsonResponse({'response': result['answer'], **result})
 
-    resp = get_chatbot_response(user_input)
+    try:
+        resp = await get_pool().run(get_chatbot_response, user_input, topic)
+    except PoolSaturated:
+        return _overloaded()
     # on renvoie 2 clés pour compat avant/après
     return JsonResponse({'response': resp, 'answer': resp})
 
+@csrf_exempt
+async def chatbot_batch_api(request):
+    """Lot de questions en JSON : {"questions": [...]} -> {"answers": [...]}."""
+    if request.method != 'POST':
+        return JsonResponse({'error': 'Méthode non autorisée'}, status=405)
+
+    try:
+        payload = json.loads(request.body.decode('utf-8'))
+        questions = payload.get('questions') or payload.get('messages')
+    except Exception:
+        return JsonResponse({'error': 'JSON invalide'}, status=400)
+
+    if not isinstance(questions, list) or not all(isinstance(q, str) for q in questions):
+        return JsonResponse({'error': "'questions' doit être une liste de chaînes"}, status=400)
+    if len(questions) > BATCH_MAX_QUESTIONS:
+        return JsonResponse({'error': f'Maximum {BATCH_MAX_QUESTIONS} questions par lot'}, status=400)
+
+    try:
+        answers = await get_pool().run(get_chatbot_responses, questions)
+    except PoolSaturated:
+        return _overloaded()
+    return JsonResponse({'answers': answers, 'count': len(answers)})
+
+def metrics_view(request):
+    """Métriques du moteur au format texte Prometheus (agrégées sur les workers)."""
+    return HttpResponse(metrics.render(), content_type='text/plain; version=0.0.4; charset=utf-8')
+
 def about_page(request):
     return render(request, 'about.html')  # fichier à créer
 
 def contact_page(request):
     return render(request, 'contact.html')  # fichier à créer
-
-
-